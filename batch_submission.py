@@ -0,0 +1,174 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from typing import List, Dict, Optional, Set, Tuple
+
+from final_submission import parse_input_config
+from optimized_pipeline import process_documents, build_corpus_index
+from utils.embeddings import embed_batch
+
+# Job names become output file names: one plain path component, and never the summary's
+JOB_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+RESERVED_JOB_NAMES = {"batch_summary"}
+
+def job_name_error(name: str, seen: Set[str]) -> Optional[str]:
+    """Why name cannot be used as a job's output file name (None if it can)."""
+    if not JOB_NAME_RE.fullmatch(name):
+        return "job names may only contain letters, digits, '.', '_' and '-' and must not start with '.'"
+    if name in RESERVED_JOB_NAMES or name.endswith(".metrics"):
+        return "job name is reserved for batch output files"
+    if name in seen:
+        return "duplicate job name"
+    return None
+
+def load_job_configs(config_path: str) -> List[Tuple[str, Dict]]:
+    """
+    Reads (job_name, config) pairs from a directory of *.json files or a JSONL file.
+    JSONL jobs are named by their "id" field when present, else by line number. Configs
+    that are not valid JSON objects are reported and skipped.
+    """
+    jobs = []
+    path = Path(config_path)
+    if path.is_dir():
+        for json_path in sorted(path.glob("*.json")):
+            with open(json_path, "r", encoding="utf-8") as f:
+                data = load_job_config(json_path.stem, f.read())
+            if data is not None:
+                jobs.append((json_path.stem, data))
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, start=1):
+                if line.strip():
+                    data = load_job_config(f"line {line_no}", line)
+                    if data is not None:
+                        jobs.append((str(data.get("id", f"job_{line_no:04d}")), data))
+    return jobs
+
+def load_job_config(label: str, text: str) -> Optional[Dict]:
+    """One config as a dict, or None (with a message) if it is not a JSON object."""
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        print(f"❌ Skipping job {label}: invalid JSON ({e})")
+        return None
+    if not isinstance(data, dict):
+        print(f"❌ Skipping job {label}: config must be a JSON object, got {type(data).__name__}")
+        return None
+    return data
+
+def run_batch(config_path: str, input_dir: str, output_dir: str, top_k: int = 5, max_per_doc: int = 2) -> Dict:
+    """
+    Runs many persona/task configs against a shared document pool in one process.
+
+    Every distinct PDF is parsed and embedded once into an in-memory corpus index, all
+    persona queries are embedded in a single batch, and the cross-encoder session is
+    shared by every job. Writes <job>.json per config plus batch_summary.json. Jobs that
+    name a missing PDF fail on their own and are recorded as such in the summary.
+    """
+    batch_start = time.time()
+    os.makedirs(output_dir, exist_ok=True)
+
+    jobs = []
+    names = set()
+    for name, data in load_job_configs(config_path):
+        error = job_name_error(name, names)
+        if error:
+            print(f"❌ Skipping job {name!r}: {error}")
+            continue
+        names.add(name)
+        try:
+            persona, task, filenames = parse_input_config(data)
+        except ValueError as e:
+            print(f"❌ Skipping job {name}: {e}")
+            continue
+        jobs.append((name, persona, task, [os.path.join(input_dir, fname) for fname in filenames]))
+    if not jobs:
+        print("❌ No valid job configs found.")
+        return {}
+
+    distinct_paths = list(dict.fromkeys(p for _, _, _, paths in jobs for p in paths))
+    missing = {p for p in distinct_paths if not os.path.isfile(p)}
+    print(f"📚 {len(jobs)} jobs over {len(distinct_paths)} distinct documents.")
+    if missing:
+        print(f"❌ Missing documents (their jobs will fail): {', '.join(sorted(Path(p).name for p in missing))}")
+
+    shared_start = time.time()
+    index = build_corpus_index([p for p in distinct_paths if p not in missing])
+    query_embeddings = embed_batch([f"{persona}: {task}" for _, persona, task, _ in jobs])
+    shared_seconds = time.time() - shared_start
+    print(f"✅ Indexed {len(index)} chunks and embedded {len(jobs)} queries in {shared_seconds:.2f} seconds.")
+
+    job_reports = []
+    for (name, persona, task, pdf_paths), query_embedding in zip(jobs, query_embeddings):
+        job_start = time.time()
+        output_file = os.path.join(output_dir, f"{name}.json")
+        job_missing = [Path(p).name for p in pdf_paths if p in missing]
+        try:
+            if job_missing:
+                raise FileNotFoundError(f"missing documents: {', '.join(job_missing)}")
+            process_documents(
+                pdf_paths=pdf_paths,
+                persona=persona,
+                task=task,
+                output_file=output_file,
+                top_k=top_k,
+                max_per_doc=max_per_doc,
+                index=index,
+                query_embedding=query_embedding
+            )
+            status = "ok"
+        except Exception as e:
+            print(f"❌ Job {name} failed: {e}")
+            status = f"error: {e}"
+        job_reports.append({
+            "job": name,
+            "status": status,
+            "documents": len(pdf_paths),
+            "latency_seconds": round(time.time() - job_start, 4)
+        })
+
+    total_seconds = time.time() - batch_start
+    latencies = sorted(r["latency_seconds"] for r in job_reports)
+    summary = {
+        "jobs": len(job_reports),
+        "failed": sum(1 for r in job_reports if r["status"] != "ok"),
+        "distinct_documents": len(distinct_paths),
+        "missing_documents": sorted(Path(p).name for p in missing),
+        "indexed_chunks": len(index),
+        "shared_setup_seconds": round(shared_seconds, 4),
+        "total_seconds": round(total_seconds, 4),
+        "jobs_per_second": round(len(job_reports) / total_seconds, 4) if total_seconds else 0.0,
+        "latency_seconds": {
+            "mean": round(sum(latencies) / len(latencies), 4),
+            "p50": latencies[len(latencies) // 2],
+            "max": latencies[-1]
+        },
+        "per_job": job_reports
+    }
+    with open(os.path.join(output_dir, "batch_summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"\n✅ {summary['jobs']} jobs in {total_seconds:.2f} seconds "
+          f"({summary['jobs_per_second']:.2f} jobs/s, mean latency {summary['latency_seconds']['mean']:.2f}s).")
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Run many persona/task configs over shared PDFs.")
+    parser.add_argument("configs", help="Directory of *.json input configs, or a JSONL file.")
+    parser.add_argument("--input-dir", default="/app/input")
+    parser.add_argument("--output-dir", default="/app/output")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--max-per-doc", type=int, default=2)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.configs):
+        print(f"[ERROR] Config path '{args.configs}' not found.")
+        sys.exit(1)
+    run_batch(args.configs, args.input_dir, args.output_dir, args.top_k, args.max_per_doc)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+# benchmarks/run_benchmarks.py
+"""
+Stage-by-stage benchmark of the pipeline on a synthetic PDF corpus.
+
+    python benchmarks/run_benchmarks.py --tiny-models --pages 40 --output bench.json
+    python benchmarks/run_benchmarks.py --tiny-models --baseline bench.json
+
+Each stage (extract, embed, rank, rerank, sentences) is timed separately over several
+repeats; results report mean/stdev/min/max latency, throughput and peak RSS, and can be
+compared against a stored baseline (exit code 1 on regression). --ingestion also parses the
+corpus once per ingestion path (default vs PARSE_LOW_MEMORY), each in a fresh process, and
+reports the peak RSS of each.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+import platform
+import resource
+import statistics
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.synthetic import BI_ENCODER_DIR, CROSS_ENCODER_DIR, build_tiny_models, generate_corpus
+
+QUERY = "Travel Planner: Plan a four-day trip with museums, food markets and hiking on a budget"
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+def high_water_rss_mb() -> float:
+    """Peak RSS of this process image (VmHWM) on Linux, else 0. Unlike ru_maxrss it is not
+    inherited from the parent across fork/exec, so it is meaningful in spawned workers."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return 0.0
+
+class RssSampler:
+    """Samples resident memory in a background thread to find a stage's peak."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss_mb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.start_rss = current_rss_mb()
+        self.peak = self.start_rss
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_mb())
+
+def measure(fn: Callable[[], object], units: int, repeats: int, warmup: int = 1) -> Dict:
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    with RssSampler() as sampler:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn()
+            latencies.append(time.perf_counter() - start)
+    mean = statistics.mean(latencies)
+    return {
+        "repeats": repeats,
+        "units": units,
+        "mean_s": round(mean, 6),
+        "stdev_s": round(statistics.stdev(latencies), 6) if len(latencies) > 1 else 0.0,
+        "min_s": round(min(latencies), 6),
+        "max_s": round(max(latencies), 6),
+        "throughput_per_s": round(units / mean, 2) if mean else 0.0,
+        "peak_rss_mb": round(sampler.peak, 1),
+        "rss_growth_mb": round(sampler.peak - sampler.start_rss, 1)
+    }
+
+def run_stages(pdf_paths: List[str], repeats: int) -> Dict[str, Dict]:
+    # Imported here so MINILM_MODEL_PATH / CROSS_ENCODER_MODEL_PATH set by --tiny-models take effect
+    import numpy as np
+    from pdf_parser import extract_chunk_table
+    from optimized_pipeline import CANDIDATE_POOL, embed_table_rows, find_most_relevant_sentences
+    from utils.embeddings import embed_batch
+    from utils.similarity import cosine_scores, rank_rows
+    from utils.reranker import rerank_with_cross_encoder
+
+    import fitz
+    pages = 0
+    for path in pdf_paths:
+        with fitz.open(path) as doc:
+            pages += doc.page_count
+
+    # Same calls as the pipeline's batch path (optimized_pipeline.retrieve_candidates)
+    stages = {}
+    stages["extract"] = measure(lambda: extract_chunk_table(pdf_paths, cache_dir=""), pages, repeats)
+    stages["extract"]["unit"] = "pages"
+
+    table = extract_chunk_table(pdf_paths, cache_dir="")
+    rows = np.arange(len(table))
+    stages["embed"] = measure(lambda: embed_table_rows(table, rows), len(rows), repeats)
+    stages["embed"]["unit"] = "chunks"
+
+    query_embedding = embed_batch([QUERY])[0]
+    embeddings, _ = embed_table_rows(table, rows)
+
+    def rank():
+        sims = cosine_scores(query_embedding, embeddings)
+        return [table.info(int(i), similarity=float(sims[i])) for i in rank_rows(sims, CANDIDATE_POOL)]
+
+    stages["rank"] = measure(rank, len(rows), repeats)
+    stages["rank"]["unit"] = "chunks"
+
+    candidates = rank()
+    stages["rerank"] = measure(
+        lambda: rerank_with_cross_encoder(QUERY, candidates, top_k=5, max_per_doc=2), len(candidates), repeats
+    )
+    stages["rerank"]["unit"] = "pairs"
+
+    ranked = rerank_with_cross_encoder(QUERY, candidates, top_k=5, max_per_doc=2)
+    stages["sentences"] = measure(
+        lambda: [find_most_relevant_sentences(s["text"], query_embedding, top_n=3) for s in ranked],
+        len(ranked), repeats
+    )
+    stages["sentences"]["unit"] = "sections"
+    return stages
+
+def ingestion_run(pdf_paths: List[str], low_memory: bool) -> Dict:
+    """Runs in a fresh process: parses the corpus once and reports time and peak RSS."""
+    from pdf_parser import extract_document_table
+
+    start_rss = current_rss_mb()
+    with RssSampler() as sampler:
+        start = time.perf_counter()
+        tables = [extract_document_table(p, cache_dir="", low_memory=low_memory) for p in pdf_paths]
+        elapsed = time.perf_counter() - start
+    peak = max(sampler.peak, high_water_rss_mb())
+    return {
+        "seconds": round(elapsed, 6),
+        "chunks": sum(len(t) for t in tables),
+        "peak_rss_mb": round(peak, 1),
+        "rss_growth_mb": round(peak - start_rss, 1)
+    }
+
+def run_ingestion(pdf_paths: List[str]) -> Dict[str, Dict]:
+    """Peak RSS of the default and low-memory ingestion paths, one fresh process each."""
+    results = {}
+    for name, low_memory in (("default", False), ("low_memory", True)):
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results[name] = pool.submit(ingestion_run, pdf_paths, low_memory).result()
+    return results
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Returns a message per stage whose mean latency regressed beyond tolerance."""
+    regressions = []
+    for stage, current in results["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if not previous or not previous.get("mean_s"):
+            continue
+        change = current["mean_s"] / previous["mean_s"] - 1
+        status = "REGRESSION" if change > tolerance else "ok"
+        print(f"  {stage:<10} {previous['mean_s']:9.4f}s -> {current['mean_s']:9.4f}s  ({change:+.1%})  {status}")
+        if change > tolerance:
+            regressions.append(f"{stage}: {change:+.1%}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline stages on a synthetic PDF corpus.")
+    parser.add_argument("--documents", type=int, default=3)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--words-per-page", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--tiny-models", action="store_true", help="Use generated stand-in ONNX models (needs `onnx`).")
+    parser.add_argument("--workdir", help="Where to write the corpus and tiny models (default: a temp dir).")
+    parser.add_argument("--output", help="Write results JSON here.")
+    parser.add_argument("--baseline", help="Compare against a previous results JSON.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed mean-latency increase vs baseline.")
+    parser.add_argument("--ingestion", action="store_true", help="Also compare peak RSS of the two ingestion paths.")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="pdf-insight-bench-")
+    if args.tiny_models:
+        models_dir = build_tiny_models(os.path.join(workdir, "models"), os.path.join(REPO_ROOT, "models"))
+        os.environ["MINILM_MODEL_PATH"] = os.path.join(models_dir, BI_ENCODER_DIR)
+        os.environ["CROSS_ENCODER_MODEL_PATH"] = os.path.join(models_dir, CROSS_ENCODER_DIR)
+
+    corpus = {"documents": args.documents, "pages": args.pages, "words_per_page": args.words_per_page, "seed": args.seed}
+    pdf_paths = generate_corpus(os.path.join(workdir, "corpus"), **corpus)
+    print(f"📄 Generated {len(pdf_paths)} synthetic PDFs in {workdir}")
+
+    stages = run_stages(pdf_paths, args.repeats)
+    results = {
+        "timestamp": datetime.now().isoformat(),
+        "platform": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "models": "tiny" if args.tiny_models else "bundled",
+        "corpus": corpus,
+        "stages": stages
+    }
+
+    for stage, r in stages.items():
+        print(f"  {stage:<10} {r['mean_s']:9.4f}s ±{r['stdev_s']:.4f}  {r['throughput_per_s']:10.1f} {r['unit']}/s  "
+              f"peak RSS {r['peak_rss_mb']:.0f} MB")
+
+    if args.ingestion:
+        results["ingestion"] = run_ingestion(pdf_paths)
+        print("📥 Ingestion (fresh process per path):")
+        for name, r in results["ingestion"].items():
+            print(f"  {name:<10} {r['seconds']:9.4f}s  {r['chunks']:6d} chunks  peak RSS {r['peak_rss_mb']:.0f} MB "
+                  f"(+{r['rss_growth_mb']:.0f} MB while parsing)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"📁 Results saved to: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("corpus") != corpus or baseline.get("models") != results["models"]:
+            print("⚠️ Baseline was recorded with a different corpus or model set.")
+        print("📊 Against baseline:")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"❌ Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# benchmarks/span_window_check.py
+"""
+Checks sentence selection in span mode (find_most_relevant_sentences(mode="span")) for
+chunks longer than the bi-encoder's token window: a sentence past the window must be
+ranked by its own embedding, never by the zero row embed_spans returns for it, so it
+cannot outrank a scored sentence it does not beat.
+
+    python benchmarks/span_window_check.py --tiny-models
+
+The query is pointed away from every sentence inside the window, so all of their scores
+are negative and an unscored (zero) sentence would win. Exit code 1 on failure.
+"""
+import os
+import sys
+import random
+import argparse
+import tempfile
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.synthetic import BI_ENCODER_DIR, CROSS_ENCODER_DIR, VOCABULARY, build_tiny_models
+
+def long_chunk(rng: random.Random, sentences: int) -> str:
+    lines = []
+    for _ in range(sentences):
+        words = [rng.choice(VOCABULARY) for _ in range(rng.randint(8, 16))]
+        words[0] = words[0].capitalize()
+        lines.append(" ".join(words) + ".")
+    return " ".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Check span-mode sentence selection past the model window.")
+    parser.add_argument("--sentences", type=int, default=80)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tiny-models", action="store_true", help="Use generated stand-in ONNX models (needs `onnx`).")
+    parser.add_argument("--workdir", help="Where to write the tiny models (default: a temp dir).")
+    args = parser.parse_args()
+
+    if args.tiny_models:
+        workdir = args.workdir or tempfile.mkdtemp(prefix="pdf-insight-spans-")
+        models_dir = build_tiny_models(os.path.join(workdir, "models"), os.path.join(REPO_ROOT, "models"))
+        os.environ["MINILM_MODEL_PATH"] = os.path.join(models_dir, BI_ENCODER_DIR)
+        os.environ["CROSS_ENCODER_MODEL_PATH"] = os.path.join(models_dir, CROSS_ENCODER_DIR)
+
+    # Imported here so the model paths set above take effect
+    from optimized_pipeline import find_most_relevant_sentences, split_sentence_spans
+    from utils.embeddings import embed_batch, embed_spans
+
+    text = long_chunk(random.Random(args.seed), args.sentences)
+    spans = split_sentence_spans(text)
+    sentences = [text[s:e] for s, e in spans]
+    pooled = embed_spans([text], [spans])[0]
+    covered = pooled.any(axis=1)
+    if covered.all():
+        print(f"❌ The chunk fits the model window; raise --sentences ({args.sentences}).")
+        sys.exit(1)
+
+    # A query facing away from the in-window sentences: all of their scores are negative
+    query = -pooled[covered].mean(axis=0)
+    query /= max(np.linalg.norm(query), 1e-9)
+    scores = pooled @ query
+    scores[~covered] = embed_batch([s for s, c in zip(sentences, covered) if not c]) @ query
+
+    ranked = find_most_relevant_sentences(text, query, top_n=len(sentences), mode="span")
+    expected = [sentences[i] for i in np.argsort(scores)[::-1]]
+    position = {sentence: rank for rank, sentence in enumerate(ranked)}
+    errors = [
+        f"sentence {i} (past the window, score {scores[i]:.4f}) ranked above sentence {j} (score {scores[j]:.4f})"
+        for i in np.flatnonzero(~covered) for j in np.flatnonzero(covered)
+        if position[sentences[i]] < position[sentences[j]] and scores[i] < scores[j]
+    ]
+    print(f"📄 {len(sentences)} sentences, {int((~covered).sum())} past the model window; "
+          f"best in-window score {scores[covered].max():.4f}.")
+    if errors or ranked != expected:
+        for error in errors[:5]:
+            print(f"  {error}")
+        print("❌ Span-mode ranking does not match the sentences' own scores.")
+        sys.exit(1)
+    print("✅ Sentences past the window are ranked by their own embeddings.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+# benchmarks/summarizer_parity.py
+"""
+Checks that the vectorized summarizer functions return exactly what the original
+per-sentence / per-paragraph implementations (kept below as reference_*) returned.
+
+    python benchmarks/summarizer_parity.py --tiny-models
+    python benchmarks/summarizer_parity.py --tiny-models --pdf input/*.pdf
+
+Texts are the pages of a synthetic corpus (plus any --pdf files), each also run with
+junk header/footer lines mixed in. Exit code 1 if any function's output differs.
+"""
+import os
+import re
+import sys
+import random
+import argparse
+import tempfile
+from typing import Callable, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.synthetic import BI_ENCODER_DIR, CROSS_ENCODER_DIR, build_tiny_models, generate_corpus
+
+PROMPT = "Travel Planner: Plan a four-day trip with museums, food markets and hiking on a budget"
+JUNK_LINES = [
+    "Copyright 2024 Example Press. All rights reserved.", "Page 12", "CHAPTER FOUR",
+    "Download more free ebooks at www.example.com", "TABLE OF CONTENTS", "Introduction"
+]
+
+# --- Reference implementations (summarizer.py before vectorization) ---
+def reference_filter_junk_lines(text):
+    lines = text.split('\n')
+    filtered = []
+    junk_patterns = [
+        r'copyright', r'feedbooks', r'gutenberg', r'source:', r'brought to you by',
+        r'free ebooks? at', r'planet ebook', r'project gutenberg', r'all rights reserved',
+        r'public domain', r'similar users also downloaded', r'download', r'license',
+        r'www\.', r'https?://', r'\.(com|org|net|info|gov|edu)', r'ebook',
+        r'\bchapter\b', r'\bcontents\b', r'\bindex\b', r'\btable of contents\b',
+        r'\bpage \d+\b', r'\bthe end\b', r'\babout the author\b', r'\bbiography\b',
+        r'\bpublication\b', r'\bpublisher\b', r'\bprinted in', r'\bfirst published',
+        r'\bthis book is brought to you by', r'\bfor more free ebooks', r'\bvisit',
+        r'\bcontact us\b', r'\bdisclaimer\b', r'\btranscriber\b', r'\bfootnote\b',
+        r'\bnotes?\b', r'\bintroduction\b', r'\bforeword\b', r'\bappendix\b',
+        r'\bprologue\b', r'\bepilogue\b', r'\bbook [ivxlc]+\b', r'\bpart [ivxlc]+\b'
+    ]
+    junk_re = re.compile('|'.join(junk_patterns), re.IGNORECASE)
+    for line in lines:
+        l = line.strip()
+        if not l or junk_re.search(l):
+            continue
+        if len(l.split()) < 5 and l.isupper():
+            continue
+        filtered.append(l)
+    return '\n'.join(dict.fromkeys(filtered))
+
+def reference_summarize(text, max_sentences=3):
+    sentences = re.split(r'(?<=[.!?]) +', text)
+    return ' '.join(sentences[:max_sentences]).strip()
+
+def reference_textrank_summary(text, top_n=3):
+    text = re.sub(r'\s+', ' ', text)
+    sentences = re.split(r'(?<=[.!?]) +', text)
+    sentences = [s.strip() for s in sentences if len(s.strip().split()) > 6]
+    if not sentences:
+        return ""
+    scores = []
+    for i, s1 in enumerate(sentences):
+        score = 0
+        words1 = set(s1.lower().split())
+        for j, s2 in enumerate(sentences):
+            if i == j:
+                continue
+            words2 = set(s2.lower().split())
+            score += len(words1 & words2)
+        scores.append((score, i, s1))
+    top = sorted(scores, reverse=True)[:top_n]
+    top_indices = sorted([i for _, i, _ in top])
+    return ' '.join([sentences[i] for i in top_indices])
+
+def reference_summarize_text(text):
+    summary = reference_textrank_summary(text)
+    if not summary:
+        summary = reference_summarize(text)
+    return summary
+
+def reference_clean_title(title, content, page):
+    bad_titles = [
+        "loved this book ?", "about woolf:", "feedbooks", "project gutenberg", "similar users also downloaded",
+        "copyright", "download", "license", "public domain", "source:", "brought to you by",
+        "chapter", "contents", "index", "table of contents", "page", "the end", "about the author",
+        "biography", "publication", "publisher", "printed in", "first published", "this book is brought to you by",
+        "for more free ebooks", "visit", "contact us", "disclaimer", "transcriber", "footnote", "notes", "introduction",
+        "foreword", "appendix", "prologue", "epilogue", "book", "part"
+    ]
+    if not title or any(bad in title.lower() for bad in bad_titles) or len(title.strip()) < 4:
+        content_clean = reference_filter_junk_lines(content)
+        first_sentence = reference_summarize(content_clean, max_sentences=1)
+        return first_sentence if first_sentence else f"Section on page {page}"
+    return title.strip()
+
+def reference_summarize_most_relevant(text, prompt, max_words=120):
+    # The original embedded each paragraph separately; its per-token embed_onnx output
+    # could not be compared with cosine_similarity, so pooled embeddings stand in for it
+    from sklearn.metrics.pairwise import cosine_similarity
+    from summarizer import extract_content_paragraphs
+    from utils.embeddings import embed_batch
+
+    cleaned_text = reference_filter_junk_lines(text)
+    paragraphs = [p.strip() for p in cleaned_text.split('\n') if p.strip()]
+    if not paragraphs:
+        paragraphs = [cleaned_text]
+    prompt_emb = embed_batch([prompt])[0]
+    best_para = ""
+    best_score = -1
+    for para in paragraphs:
+        para_emb = embed_batch([para])[0]
+        score = cosine_similarity([prompt_emb], [para_emb])[0][0]
+        if score > best_score and para.strip():
+            best_score = score
+            best_para = para
+    if not best_para.strip():
+        for para in paragraphs:
+            if para.strip():
+                best_para = para
+                break
+    content_paras = extract_content_paragraphs(cleaned_text, top_k=2)
+    if not content_paras:
+        content_paras = [best_para]
+    summary = ' '.join([reference_summarize(p, max_sentences=3) for p in content_paras])
+    words = summary.split()
+    if len(words) > max_words:
+        summary = ' '.join(words[:max_words])
+    return summary if summary.strip() else "Content not available."
+
+# --- Test texts ---
+def page_texts(pdf_paths: List[str]) -> List[str]:
+    import fitz
+
+    texts = []
+    for path in pdf_paths:
+        with fitz.open(path) as doc:
+            texts.extend(page.get_text() for page in doc)
+    return texts
+
+def with_junk(text: str, rng: random.Random) -> str:
+    """The text with junk lines inserted at random line positions."""
+    lines = text.split("\n")
+    for junk in rng.sample(JUNK_LINES, 3):
+        lines.insert(rng.randint(0, len(lines)), junk)
+    return "\n".join(lines)
+
+def compare(texts: List[str]) -> Dict[str, int]:
+    """Mismatch count per function over all texts."""
+    import summarizer
+
+    pairs: Dict[str, Callable[[str, int], tuple]] = {
+        "filter_junk_lines": lambda t, i: (summarizer.filter_junk_lines(t), reference_filter_junk_lines(t)),
+        "summarize": lambda t, i: (summarizer.summarize(t), reference_summarize(t)),
+        "textrank_summary": lambda t, i: (summarizer.textrank_summary(t), reference_textrank_summary(t)),
+        "summarize_text": lambda t, i: (summarizer.summarize_text(t), reference_summarize_text(t)),
+        "clean_title": lambda t, i: (
+            summarizer.clean_title(t.split("\n")[0], t, i), reference_clean_title(t.split("\n")[0], t, i)
+        ),
+        "summarize_most_relevant": lambda t, i: (
+            summarizer.summarize_most_relevant(t, PROMPT), reference_summarize_most_relevant(t, PROMPT)
+        )
+    }
+    mismatches = {}
+    for name, run in pairs.items():
+        mismatches[name] = 0
+        for i, text in enumerate(texts):
+            new, old = run(text, i)
+            if new != old:
+                mismatches[name] += 1
+                if mismatches[name] == 1:
+                    print(f"  {name}: first mismatch on text {i}:\n    new: {new[:120]!r}\n    old: {old[:120]!r}")
+    return mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare summarizer.py with its original implementations.")
+    parser.add_argument("--pdf", nargs="*", default=[], help="Real PDFs whose pages are added to the test texts.")
+    parser.add_argument("--documents", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tiny-models", action="store_true", help="Use generated stand-in ONNX models (needs `onnx`).")
+    parser.add_argument("--workdir", help="Where to write the corpus and tiny models (default: a temp dir).")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="pdf-insight-parity-")
+    if args.tiny_models:
+        models_dir = build_tiny_models(os.path.join(workdir, "models"), os.path.join(REPO_ROOT, "models"))
+        os.environ["MINILM_MODEL_PATH"] = os.path.join(models_dir, BI_ENCODER_DIR)
+        os.environ["CROSS_ENCODER_MODEL_PATH"] = os.path.join(models_dir, CROSS_ENCODER_DIR)
+
+    pdf_paths = generate_corpus(os.path.join(workdir, "corpus"), documents=args.documents, pages=args.pages,
+                                seed=args.seed) + list(args.pdf)
+    pages = page_texts(pdf_paths)
+    rng = random.Random(args.seed)
+    texts = pages + [with_junk(text, rng) for text in pages]
+    print(f"📄 Comparing on {len(texts)} texts ({len(pages)} pages, with and without junk lines)...")
+
+    mismatches = compare(texts)
+    for name, count in mismatches.items():
+        print(f"  {name:<24} {'identical' if not count else f'{count} mismatches'}")
+    if any(mismatches.values()):
+        print("❌ Summarizer output differs from the reference implementation.")
+        sys.exit(1)
+    print("✅ All functions match the reference implementation.")
+
+if __name__ == "__main__":
+    main()
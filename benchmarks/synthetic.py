@@ -0,0 +1,123 @@
+# benchmarks/synthetic.py
+"""Offline fixtures for the benchmark harness: synthetic PDF corpora and tiny stand-in ONNX models."""
+import os
+import random
+import shutil
+from typing import List
+
+import numpy as np
+
+MODEL_FILE_NAME = "model_qint8_avx512_vnni.onnx"
+BI_ENCODER_DIR = "all-MiniLM-L6-v2"
+CROSS_ENCODER_DIR = "cross-encoder-ms-marco-MiniLM-L-6-v2"
+TOKENIZER_FILES = ["config.json", "special_tokens_map.json", "tokenizer.json", "tokenizer_config.json", "vocab.txt"]
+
+VOCABULARY = (
+    "travel hotel beach food museum budget itinerary train city castle wine market festival river "
+    "mountain hiking guide restaurant culture history recipe ingredient oven sauce vegetarian dinner "
+    "buffet menu form signature document field export share convert acrobat workflow compliance "
+    "onboarding employee policy training schedule report analysis revenue growth strategy research "
+    "method dataset experiment result model accuracy benchmark network protein molecule reaction"
+).split()
+
+def synthetic_page_text(rng: random.Random, words_per_page: int) -> List[str]:
+    """Sentence lines for one page, plus the short header/footer lines clean_pdf_text should drop."""
+    lines = ["Synthetic Benchmark Manual"]
+    remaining = words_per_page
+    while remaining > 0:
+        length = min(remaining, rng.randint(6, 18))
+        words = [rng.choice(VOCABULARY) for _ in range(length)]
+        words[0] = words[0].capitalize()
+        lines.append(" ".join(words) + rng.choice([".", ".", ".", "!", "?"]))
+        remaining -= length
+    lines.append(str(rng.randint(1, 999)))
+    return lines
+
+def generate_corpus(
+    out_dir: str,
+    documents: int = 3,
+    pages: int = 20,
+    words_per_page: int = 300,
+    seed: int = 0
+) -> List[str]:
+    """Writes `documents` PDFs of `pages` pages each and returns their paths (deterministic per seed)."""
+    import fitz
+
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for d in range(documents):
+        doc = fitz.open()
+        for _ in range(pages):
+            page = doc.new_page()
+            lines = synthetic_page_text(rng, words_per_page)
+            # Shrink the font so every line fits on the page
+            fontsize = min(9.0, (page.rect.height - 72) / (len(lines) * 1.25))
+            y = 36 + fontsize
+            for line in lines:
+                page.insert_text((36, y), line, fontsize=fontsize)
+                y += fontsize * 1.25
+        path = os.path.join(out_dir, f"synthetic_{d:03d}.pdf")
+        doc.save(path)
+        doc.close()
+        paths.append(path)
+    return paths
+
+def _tiny_encoder(path: str, cross: bool, vocab_size: int, dim: int, seed: int):
+    """Embedding-lookup graph with the same inputs/outputs as the real MiniLM exports."""
+    from onnx import TensorProto, helper, numpy_helper, save
+
+    rng = np.random.default_rng(seed)
+    inputs = [
+        helper.make_tensor_value_info(name, TensorProto.INT64, ["batch", "sequence"])
+        for name in ("input_ids", "attention_mask", "token_type_ids")
+    ]
+    initializers = [
+        numpy_helper.from_array(rng.standard_normal((vocab_size, dim)).astype(np.float32), "word_embeddings"),
+        numpy_helper.from_array(rng.standard_normal((2, dim)).astype(np.float32), "type_embeddings"),
+        numpy_helper.from_array(np.array([-1], dtype=np.int64), "last_axis")
+    ]
+    nodes = [
+        helper.make_node("Gather", ["word_embeddings", "input_ids"], ["words"]),
+        helper.make_node("Gather", ["type_embeddings", "token_type_ids"], ["types"]),
+        helper.make_node("Cast", ["attention_mask"], ["mask"], to=TensorProto.FLOAT),
+        helper.make_node("Unsqueeze", ["mask", "last_axis"], ["mask_3d"]),
+        helper.make_node("Add", ["words", "types"], ["summed"]),
+        helper.make_node("Mul", ["summed", "mask_3d"], ["hidden"])
+    ]
+    if cross:
+        initializers += [
+            numpy_helper.from_array(np.array([1], dtype=np.int64), "sequence_axis"),
+            numpy_helper.from_array(rng.standard_normal((dim, 1)).astype(np.float32), "classifier")
+        ]
+        nodes += [
+            helper.make_node("ReduceSum", ["hidden", "sequence_axis"], ["hidden_sum"], keepdims=0),
+            helper.make_node("ReduceSum", ["mask", "sequence_axis"], ["token_count"], keepdims=1),
+            helper.make_node("Div", ["hidden_sum", "token_count"], ["pooled"]),
+            helper.make_node("MatMul", ["pooled", "classifier"], ["logits"])
+        ]
+        outputs = [helper.make_tensor_value_info("logits", TensorProto.FLOAT, ["batch", 1])]
+    else:
+        nodes.append(helper.make_node("Identity", ["hidden"], ["last_hidden_state"]))
+        outputs = [helper.make_tensor_value_info("last_hidden_state", TensorProto.FLOAT, ["batch", "sequence", dim])]
+
+    graph = helper.make_graph(nodes, "tiny_encoder", inputs, outputs, initializers)
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    save(model, path)
+
+def build_tiny_models(out_dir: str, source_models_dir: str, dim: int = 32) -> str:
+    """
+    Creates stand-in bi-encoder and cross-encoder ONNX models next to copies of the real
+    tokenizer files, so every pipeline stage runs without the quantized weights.
+    Returns the models directory. Requires the `onnx` package.
+    """
+    for i, (name, cross) in enumerate([(BI_ENCODER_DIR, False), (CROSS_ENCODER_DIR, True)]):
+        model_dir = os.path.join(out_dir, name)
+        os.makedirs(model_dir, exist_ok=True)
+        for file_name in TOKENIZER_FILES:
+            source = os.path.join(source_models_dir, name, file_name)
+            if os.path.exists(source):
+                shutil.copy(source, model_dir)
+        _tiny_encoder(os.path.join(model_dir, MODEL_FILE_NAME), cross, vocab_size=30522, dim=dim, seed=i)
+    return out_dir
@@ -0,0 +1,451 @@
+import os
+import json
+import shutil
+import argparse
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: one writing process per corpus only
+    fcntl = None
+
+from pdf_parser import extract_chunk_table, file_digest
+from utils.chunk_table import ChunkTable
+from utils.quantization import QuantizedMatrix
+from utils.similarity import top_k_indices
+from utils.vector_index import CorpusIndex
+from optimized_pipeline import embed_table_rows, report_cache_stats
+
+# --- INCREMENTAL CORPUS ---
+# The corpus is a list of immutable segments (one CorpusIndex per add batch) plus a manifest
+# mapping each document to its content digest and row range. Removed or replaced documents
+# are tombstoned; compaction rewrites the live rows into one segment once tombstones exceed
+# COMPACT_RATIO of all rows or there are more than COMPACT_MAX_SEGMENTS segments.
+COMPACT_RATIO = float(os.environ.get("COMPACT_RATIO", "0.25"))
+COMPACT_MAX_SEGMENTS = int(os.environ.get("COMPACT_MAX_SEGMENTS", "8"))
+MANIFEST_VERSION = 1
+
+def empty_manifest() -> Dict:
+    # documents: name -> {digest, segment, start, stop}; tombstones: segment -> [[start, stop], ...]
+    return {"version": MANIFEST_VERSION, "next_segment": 0, "segments": [], "documents": {}, "tombstones": {}}
+
+class CorpusSnapshot:
+    """
+    Immutable view of the corpus at one point in time: (segment index, live-row mask) pairs.
+
+    Answers search()/search_batch() like a CorpusIndex (so it can be passed as
+    process_documents(index=...)), with tombstoned rows excluded. Writers never mutate a
+    published snapshot, so readers need no locks.
+    """
+
+    def __init__(self, segments: List[Tuple[CorpusIndex, np.ndarray]], generation: int = 0):
+        self.segments = segments
+        self.generation = generation
+        self.live_count = sum(int(live.sum()) for _, live in segments)
+
+    def __len__(self) -> int:
+        return self.live_count
+
+    @property
+    def storage(self) -> str:
+        """Vector storage of the segments, "+"-joined if they differ."""
+        return "+".join(sorted({index.storage for index, _ in self.segments})) or "float32"
+
+    def search(self, query_embedding: np.ndarray, top_k: int = 50, documents: Optional[Iterable[str]] = None) -> List[Dict]:
+        return self.search_batch(np.asarray(query_embedding)[None, :], top_k, documents)[0]
+
+    def search_batch(self, query_matrix: np.ndarray, top_k: int = 50, documents: Optional[Iterable[str]] = None) -> List[List[Dict]]:
+        """
+        Per segment: score, keep the live rows and take a local top-k; then merge the local
+        winners in global row order so ties break the same way as in a single index.
+        """
+        queries = np.asarray(query_matrix, dtype=np.float32)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-9)
+        documents = None if documents is None else list(documents)
+
+        per_query = [([], [], []) for _ in range(len(queries))]  # (segment, row, score) parts
+        for seg, (index, live) in enumerate(self.segments):
+            mask = index.document_mask(documents)
+            rows = np.flatnonzero(live if mask is None else live & mask)
+            if not len(rows):
+                continue
+            for q, (picked, picked_scores) in enumerate(index.top_rows(queries, top_k, rows)):
+                order = np.argsort(picked, kind="stable")
+                per_query[q][0].append(np.full(len(picked), seg))
+                per_query[q][1].append(picked[order])
+                per_query[q][2].append(picked_scores[order])
+
+        results = []
+        for segs, rows, scores in per_query:
+            if not segs:
+                results.append([])
+                continue
+            segs, rows, scores = np.concatenate(segs), np.concatenate(rows), np.concatenate(scores)
+            results.append([
+                self.segments[segs[i]][0].info(int(rows[i]), float(scores[i]))
+                for i in top_k_indices(scores, top_k)
+            ])
+        return results
+
+class CorpusManager:
+    """
+    Persistent document corpus that is updated in place instead of rebuilt.
+
+    add()/refresh() hash each PDF and only parse and embed new or changed files, which are
+    appended as a new segment; remove() tombstones a document's rows. Every update writes
+    the segment first and the manifest last (atomic rename), then publishes a new
+    CorpusSnapshot. Readers call snapshot() and keep a consistent view even while an update
+    or a background compaction is running.
+
+    Writers hold a thread lock plus an flock on the corpus "lock" file, and re-read the
+    manifest once they have it, so several processes can update one corpus directory.
+    Call wait() before exiting a process that may have started a background compaction.
+    """
+
+    def __init__(
+        self,
+        corpus_dir: str,
+        compact_ratio: float = COMPACT_RATIO,
+        max_segments: int = COMPACT_MAX_SEGMENTS,
+        background: bool = True
+    ):
+        self.corpus_dir = corpus_dir
+        self.compact_ratio = compact_ratio
+        self.max_segments = max_segments
+        self.background = background
+        self._write_lock = threading.Lock()  # serializes add/remove/compact within the process
+        self._compactor: Optional[threading.Thread] = None
+
+        os.makedirs(corpus_dir, exist_ok=True)
+        self.manifest = empty_manifest()
+        self._indexes: Dict[str, CorpusIndex] = {}
+        self._snapshot = self._build_snapshot()
+        # The first load also holds the lock, so a concurrent compaction cannot delete
+        # segments between reading the manifest and mapping them
+        with self._locked():
+            pass
+
+    # --- Manifest ---
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.corpus_dir, "manifest.json")
+
+    @property
+    def lock_path(self) -> str:
+        return os.path.join(self.corpus_dir, "lock")
+
+    def _segment_dir(self, name: str) -> str:
+        return os.path.join(self.corpus_dir, name)
+
+    def _new_segment_dir(self, manifest: Dict) -> Tuple[str, str]:
+        """Name and directory for the next segment, clearing leftovers of a writer that died mid-write."""
+        segment = f"segment-{manifest['next_segment']:06d}"
+        shutil.rmtree(self._segment_dir(segment), ignore_errors=True)
+        return segment, self._segment_dir(segment)
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive write access across threads and processes, with the manifest re-read from disk."""
+        with self._write_lock, open(self.lock_path, "a+") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._reload()
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _reload(self):
+        """Picks up updates another process committed since this one last read the manifest."""
+        manifest = self._load_manifest()
+        if manifest == self.manifest:
+            return
+        for name in manifest["segments"]:
+            if name not in self._indexes:
+                self._indexes[name] = CorpusIndex.load(self._segment_dir(name))
+        for name in list(self._indexes):
+            if name not in manifest["segments"]:
+                del self._indexes[name]
+        self.manifest = manifest
+        self._snapshot = self._build_snapshot(self._snapshot.generation + 1)
+
+    def _load_manifest(self) -> Dict:
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") != MANIFEST_VERSION:
+                raise ValueError(f"Unsupported corpus manifest version {manifest.get('version')} in {self.corpus_dir}")
+            return manifest
+        return empty_manifest()
+
+    def _save_manifest(self, manifest: Dict):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _build_snapshot(self, generation: int = 0) -> CorpusSnapshot:
+        segments = []
+        for name in self.manifest["segments"]:
+            index = self._indexes[name]
+            live = np.ones(len(index), dtype=bool)
+            for start, stop in self.manifest["tombstones"].get(name, []):
+                live[start:stop] = False
+            segments.append((index, live))
+        return CorpusSnapshot(segments, generation)
+
+    def _commit(self, manifest: Dict):
+        """Persists the manifest and publishes a fresh snapshot (caller holds the write lock)."""
+        self._save_manifest(manifest)
+        self.manifest = manifest
+        self._snapshot = self._build_snapshot(self._snapshot.generation + 1)
+
+    # --- Readers ---
+    def snapshot(self) -> CorpusSnapshot:
+        return self._snapshot
+
+    def documents(self) -> Dict[str, str]:
+        """Managed document names and their content digests."""
+        return {name: doc["digest"] for name, doc in self.manifest["documents"].items()}
+
+    def stats(self) -> Dict:
+        snapshot = self._snapshot
+        total = sum(len(index) for index, _ in snapshot.segments)
+        live = len(snapshot)
+        return {
+            "documents": len(self.manifest["documents"]),
+            "segments": len(self.manifest["segments"]),
+            "rows": total,
+            "live_rows": live,
+            "tombstoned_rows": total - live,
+            "generation": snapshot.generation
+        }
+
+    # --- Writers ---
+    def add(self, pdf_path: str) -> bool:
+        """Adds (or replaces, if its contents changed) one PDF; returns whether anything changed."""
+        return bool(self.add_many([pdf_path]))
+
+    def add_many(self, pdf_paths: List[str]) -> List[str]:
+        """
+        Adds new PDFs and replaces changed ones (matched by file name, compared by content
+        digest) in a single segment. Unchanged and missing files are skipped; returns the changed names.
+        """
+        digests = {}
+        for path in pdf_paths:
+            try:
+                digests[Path(path).name] = (path, file_digest(path))
+            except OSError as e:
+                print(f"❌ Error extracting {path}: {e}")
+
+        with self._locked():
+            known = self.manifest["documents"]
+            changed = [name for name, (_, digest) in digests.items()
+                       if name not in known or known[name]["digest"] != digest]
+            if not changed:
+                return []
+
+            table = extract_chunk_table([digests[name][0] for name in changed])
+            embeddings, cache_stats = embed_table_rows(table, np.arange(len(table)))
+            report_cache_stats(cache_stats)
+
+            manifest = json.loads(json.dumps(self.manifest))
+            segment, segment_dir = self._new_segment_dir(manifest)
+            index = CorpusIndex.build(table, embeddings, meta={"documents": changed})
+            index.save(segment_dir)
+
+            for name in changed:
+                self._tombstone(manifest, name)
+            starts, stops = self._row_ranges(table)
+            for name in changed:
+                manifest["documents"][name] = {
+                    "digest": digests[name][1],
+                    "segment": segment,
+                    "start": starts.get(name, 0),
+                    "stop": stops.get(name, 0)
+                }
+            manifest["segments"].append(segment)
+            manifest["next_segment"] += 1
+
+            self._indexes[segment] = CorpusIndex.load(self._segment_dir(segment))
+            self._commit(manifest)
+        print(f"🗂️ Corpus: indexed {len(table)} chunks from {len(changed)} new/changed documents.")
+        self.maybe_compact()
+        return changed
+
+    def remove(self, document: str) -> bool:
+        """Tombstones a document's rows; returns False if it is not in the corpus."""
+        with self._locked():
+            if document not in self.manifest["documents"]:
+                return False
+            manifest = json.loads(json.dumps(self.manifest))
+            self._tombstone(manifest, document)
+            del manifest["documents"][document]
+            self._commit(manifest)
+        self.maybe_compact()
+        return True
+
+    def refresh(self, pdf_paths: List[str]) -> Dict[str, List[str]]:
+        """
+        Syncs the corpus to exactly this set of PDFs: new and changed files are indexed,
+        managed documents missing from the set are removed.
+        """
+        names = {Path(p).name for p in pdf_paths}
+        before = self.documents()
+        changed = self.add_many(pdf_paths)
+        removed = [name for name in before if name not in names]
+        for name in removed:
+            self.remove(name)
+        summary = {
+            "added": [n for n in changed if n not in before],
+            "updated": [n for n in changed if n in before],
+            "removed": removed,
+            "unchanged": sorted(names - set(changed))
+        }
+        print(f"🔄 Corpus refresh: {len(summary['added'])} added, {len(summary['updated'])} updated, "
+              f"{len(summary['removed'])} removed, {len(summary['unchanged'])} unchanged.")
+        return summary
+
+    def refresh_dir(self, pdf_dir: str) -> Dict[str, List[str]]:
+        """refresh() over every *.pdf in a directory."""
+        return self.refresh(sorted(str(p) for p in Path(pdf_dir).glob("*.pdf")))
+
+    @staticmethod
+    def _row_ranges(table: ChunkTable) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """First and one-past-last row per document (extraction keeps each document's rows contiguous)."""
+        starts, stops = {}, {}
+        for row, doc_id in enumerate(table.doc_ids.tolist()):
+            name = table.documents[doc_id]
+            starts.setdefault(name, row)
+            stops[name] = row + 1
+        return starts, stops
+
+    @staticmethod
+    def _tombstone(manifest: Dict, document: str):
+        doc = manifest["documents"].get(document)
+        if doc is not None and doc["stop"] > doc["start"]:
+            manifest["tombstones"].setdefault(doc["segment"], []).append([doc["start"], doc["stop"]])
+
+    # --- Compaction ---
+    def needs_compaction(self) -> bool:
+        stats = self.stats()
+        if stats["segments"] > self.max_segments:
+            return True
+        return stats["rows"] > 0 and stats["tombstoned_rows"] / stats["rows"] > self.compact_ratio
+
+    def maybe_compact(self):
+        """Starts a compaction (in a background thread unless background=False) when needed."""
+        if not self.needs_compaction():
+            return
+        if not self.background:
+            self.compact()
+            return
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self.compact, name="corpus-compactor", daemon=True)
+        self._compactor.start()
+
+    def compact(self):
+        """
+        Rewrites all live rows into one new segment and drops the old segments. Readers
+        holding an older snapshot keep using its (already mapped) arrays undisturbed.
+        """
+        with self._locked():
+            if not self.manifest["segments"]:
+                return
+            snapshot = self._snapshot
+            manifest = json.loads(json.dumps(self.manifest))
+            order = sorted(manifest["documents"].items(),
+                           key=lambda item: (manifest["segments"].index(item[1]["segment"]), item[1]["start"]))
+
+            tables, vectors, ranges, row = [], [], {}, 0
+            for name, doc in order:
+                index = self._indexes[doc["segment"]]
+                rows = np.arange(doc["start"], doc["stop"])
+                tables.append(self._take(index.table, rows, name))
+                vectors.append(np.asarray(index.vectors[rows]))
+                ranges[name] = (row, row + len(rows))
+                row += len(rows)
+
+            old_segments = manifest["segments"]
+            segment, segment_dir = self._new_segment_dir(manifest)
+            dim = next((v.shape[1] for v in vectors if v.ndim == 2), 0)
+            merged_vectors = np.concatenate(vectors) if vectors else np.zeros((0, dim), dtype=np.float32)
+            storage = self._indexes[old_segments[-1]].storage
+            merged = CorpusIndex(
+                merged_vectors,
+                ChunkTable.concat(tables),
+                meta={"documents": [name for name, _ in order]},
+                quantized=QuantizedMatrix.quantize(merged_vectors, storage) if storage != "float32" else None
+            )
+            merged.save(segment_dir)
+
+            for name, (start, stop) in ranges.items():
+                manifest["documents"][name].update(segment=segment, start=start, stop=stop)
+            manifest["segments"] = [segment]
+            manifest["tombstones"] = {}
+            manifest["next_segment"] += 1
+
+            self._indexes[segment] = CorpusIndex.load(self._segment_dir(segment))
+            self._commit(manifest)
+            for name in old_segments:
+                self._indexes.pop(name, None)
+                shutil.rmtree(self._segment_dir(name), ignore_errors=True)
+        print(f"🧹 Corpus compacted: {len(snapshot)} live chunks in 1 segment (was {len(old_segments)}).")
+
+    @staticmethod
+    def _take(table: ChunkTable, rows: np.ndarray, document: str) -> ChunkTable:
+        """Copies a contiguous row range of one document out of a segment table."""
+        if not len(rows):
+            return ChunkTable.empty()
+        start, stop = int(rows[0]), int(rows[-1]) + 1
+        t0, t1 = int(table.text_offsets[start]), int(table.text_offsets[stop])
+        token_buffer = token_offsets = None
+        if table.has_tokens:
+            k0, k1 = int(table.token_offsets[start]), int(table.token_offsets[stop])
+            token_buffer = np.array(table.token_buffer[k0:k1])
+            token_offsets = np.array(table.token_offsets[start:stop + 1]) - k0
+        return ChunkTable(
+            [document], np.zeros(stop - start, dtype=np.int32),
+            np.array(table.page_numbers[start:stop]), np.array(table.chunk_ids[start:stop]),
+            np.array(table.text_buffer[t0:t1]), np.array(table.text_offsets[start:stop + 1]) - t0,
+            token_buffer, token_offsets
+        )
+
+    def wait(self):
+        """Blocks until a running background compaction has finished."""
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain an incrementally updated corpus index.")
+    parser.add_argument("corpus_dir", help="Directory holding the corpus manifest and segments")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("refresh", help="Sync the corpus to every PDF in a directory").add_argument("pdf_dir")
+    sub.add_parser("add", help="Add or replace PDFs").add_argument("pdfs", nargs="+")
+    sub.add_parser("remove", help="Remove documents by file name").add_argument("documents", nargs="+")
+    sub.add_parser("compact", help="Rewrite live rows into one segment")
+    sub.add_parser("status", help="Print corpus statistics")
+    args = parser.parse_args()
+
+    manager = CorpusManager(args.corpus_dir, background=False)
+    if args.command == "refresh":
+        manager.refresh_dir(args.pdf_dir)
+    elif args.command == "add":
+        manager.add_many(args.pdfs)
+    elif args.command == "remove":
+        for name in args.documents:
+            if not manager.remove(name):
+                print(f"⚠️ Not in corpus: {name}")
+    elif args.command == "compact":
+        manager.compact()
+    print(json.dumps(manager.stats(), indent=2))
+
+if __name__ == "__main__":
+    main()
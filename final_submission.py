@@ -3,7 +3,24 @@ import time
 import os
 import sys
 from pathlib import Path
-from optimized_pipeline import process_documents
+from utils.startup import timed, print_startup_report
+with timed("import pipeline"):
+    from optimized_pipeline import process_documents, load_or_build_corpus_index
+
+def parse_input_config(data: dict):
+    """Extracts (persona, task, pdf_filenames) from a challenge input dict; raises ValueError if incomplete."""
+    persona = data.get("persona", {}).get("role", "").strip()
+    task = data.get("job_to_be_done", {}).get("task", "").strip()
+    documents = data.get("documents", [])
+    pdf_filenames = [doc.get("filename") for doc in documents if doc.get("filename")]
+
+    if not persona or not task:
+        raise ValueError("Persona or task missing from input JSON.")
+
+    if not pdf_filenames:
+        raise ValueError("No document filenames found in input JSON.")
+
+    return persona, task, pdf_filenames
 
 def load_input_config():
     """Reads input config from /app/input/challenge1b_input.json."""
@@ -15,21 +32,12 @@ def load_input_config():
     with open(input_path, "r", encoding="utf-8") as f:
         data = json.load(f)
 
-    persona = data.get("persona", {}).get("role", "").strip()
-    task = data.get("job_to_be_done", {}).get("task", "").strip()
-    documents = data.get("documents", [])
-    pdf_filenames = [doc.get("filename") for doc in documents if doc.get("filename")]
-
-    if not persona or not task:
-        print("[ERROR] Persona or task missing from input JSON.")
-        sys.exit(1)
-
-    if not pdf_filenames:
-        print("[ERROR] No document filenames found in input JSON.")
+    try:
+        return parse_input_config(data)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
         sys.exit(1)
 
-    return persona, task, pdf_filenames
-
 def main():
     """Main submission process."""
     print("🚀 Starting Document Intelligence Pipeline...")
@@ -57,21 +65,43 @@ def main():
     start_time = time.time()
 
     try:
+        # Optional: reuse a prebuilt corpus index across runs (built on first use)
+        index = None
+        manager = None
+        index_dir = os.environ.get("CORPUS_INDEX_DIR")
+        corpus_dir = os.environ.get("CORPUS_DIR")
+        if corpus_dir:
+            # Incrementally maintained corpus: only new or changed PDFs are parsed and embedded
+            from corpus_manager import CorpusManager
+            manager = CorpusManager(corpus_dir)
+            manager.add_many(pdf_paths)
+            index = manager.snapshot()
+        elif index_dir:
+            # Rebuilt when the saved index lacks an input PDF or a PDF's content changed
+            index = load_or_build_corpus_index(pdf_paths, index_dir)
+
         process_documents(
             pdf_paths=pdf_paths,
             persona=persona,
             task=task,
             output_file=output_path,
             top_k=5,
-            max_per_doc=2
+            max_per_doc=2,
+            index=index
         )
     except Exception as e:
         print(f"❌ An error occurred during processing: {e}")
         sys.exit(1)
+    finally:
+        if manager is not None:
+            # Compaction runs on a daemon thread; let it finish before the process exits
+            manager.wait()
 
     elapsed = time.time() - start_time
     print(f"\n✅ Finished in {elapsed:.2f} seconds.")
     print(f"📁 Output saved to: {output_path}")
+    if os.environ.get("STARTUP_REPORT"):
+        print_startup_report()
 
 if __name__ == "__main__":
     main()
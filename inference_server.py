@@ -0,0 +1,329 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from final_submission import parse_input_config
+from optimized_pipeline import process_documents
+from utils import runtime
+from utils.embeddings import embed_batch, get_onnx_session, get_tokenizer
+from utils.reranker import cross_encode_pairs, get_cross_encoder_session, get_cross_encoder_tokenizer
+from utils.vector_index import CorpusIndex
+
+# --- SERVER DEFAULTS ---
+MAX_CONCURRENT = int(os.environ.get("SERVER_MAX_CONCURRENT", "4"))    # requests running the pipeline at once
+MAX_PENDING = int(os.environ.get("SERVER_MAX_PENDING", "32"))         # running + queued before rejecting with 503
+REQUEST_TIMEOUT = float(os.environ.get("SERVER_REQUEST_TIMEOUT", "120"))
+BATCH_WINDOW_MS = float(os.environ.get("SERVER_BATCH_WINDOW_MS", "5"))
+MAX_EMBED_ITEMS = 256   # texts per coalesced bi-encoder call
+MAX_RERANK_ITEMS = 128  # pairs per coalesced cross-encoder call
+MAX_BODY_BYTES = 1 << 20
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable",
+           504: "Gateway Timeout"}
+
+class RequestCancelled(Exception):
+    """Raised in a timed-out request's pipeline thread at its next model call."""
+
+class CoalescingBatcher:
+    """
+    Merges concurrent submissions into shared model calls.
+
+    Each submission is a list of items; the run loop waits up to window_ms after the first
+    arrival for more submissions (up to max_items in total), runs run_batch once on the
+    concatenation in a dedicated executor thread and hands each caller its own slice.
+    """
+
+    def __init__(self, run_batch: Callable[[List[Any]], Any], max_items: int, window_ms: float):
+        self.run_batch = run_batch
+        self.max_items = max_items
+        self.window = window_ms / 1000.0
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.queue: Optional[asyncio.Queue] = None
+        self.calls = 0
+        self.items = 0
+        self.submissions = 0
+
+    async def submit(self, items: List[Any]):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((items, future))
+        return await future
+
+    async def run(self):
+        self.queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self.queue.get()]
+            total = len(pending[0][0])
+            deadline = loop.time() + self.window
+            while total < self.max_items:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+                total += len(pending[-1][0])
+
+            flat = [item for items, _ in pending for item in items]
+            try:
+                results = await loop.run_in_executor(self.executor, self.run_batch, flat)
+            except Exception as e:
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.calls += 1
+            self.items += len(flat)
+            self.submissions += len(pending)
+            offset = 0
+            for items, future in pending:
+                if not future.done():
+                    future.set_result(results[offset:offset + len(items)])
+                offset += len(items)
+
+    def stats(self) -> Dict:
+        return {
+            "model_calls": self.calls,
+            "submissions": self.submissions,
+            "items": self.items,
+            "mean_batch": round(self.items / self.calls, 2) if self.calls else 0.0
+        }
+
+def score_pairs(pairs: List[Tuple[str, str]]) -> np.ndarray:
+    return cross_encode_pairs([q for q, _ in pairs], [t for _, t in pairs])
+
+class InferenceServer:
+    """Keeps both models warm and serves persona/task requests over HTTP (TCP or Unix socket)."""
+
+    def __init__(
+        self,
+        input_dir: str,
+        index: Optional[CorpusIndex] = None,
+        max_concurrent: int = MAX_CONCURRENT,
+        max_pending: int = MAX_PENDING,
+        request_timeout: float = REQUEST_TIMEOUT,
+        window_ms: float = BATCH_WINDOW_MS
+    ):
+        self.input_dir = os.path.realpath(input_dir)
+        self.index = index
+        self.max_pending = max_pending
+        self.request_timeout = request_timeout
+        self.slots = asyncio.Semaphore(max_concurrent)
+        self.pending = 0
+        self.served = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.embedder = CoalescingBatcher(embed_batch, MAX_EMBED_ITEMS, window_ms)
+        self.reranker = CoalescingBatcher(score_pairs, MAX_RERANK_ITEMS, window_ms)
+        self.pipeline_threads = ThreadPoolExecutor(max_workers=max_concurrent)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # --- Thread-side entry points handed to process_documents ---
+    def embed(self, texts: List[str], cancelled: Optional[threading.Event] = None) -> np.ndarray:
+        if cancelled is not None and cancelled.is_set():
+            raise RequestCancelled()
+        if not texts:
+            return embed_batch([])
+        return asyncio.run_coroutine_threadsafe(self.embedder.submit(list(texts)), self.loop).result()
+
+    def score(self, query: str, texts: List[str], cancelled: Optional[threading.Event] = None) -> np.ndarray:
+        if cancelled is not None and cancelled.is_set():
+            raise RequestCancelled()
+        if not texts:
+            return np.zeros(0, dtype=np.float32)
+        pairs = [(query, text) for text in texts]
+        return asyncio.run_coroutine_threadsafe(self.reranker.submit(pairs), self.loop).result()
+
+    def warm_up(self):
+        """Loads tokenizers and ONNX sessions and runs one inference through each model."""
+        start = time.perf_counter()
+        get_tokenizer(), get_onnx_session()
+        get_cross_encoder_tokenizer(), get_cross_encoder_session()
+        embed_batch(["warm up"])
+        score_pairs([("warm up", "warm up")])
+        print(f"🔥 Models warm in {time.perf_counter() - start:.2f} seconds.")
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        await self.loop.run_in_executor(None, self.warm_up)
+        asyncio.create_task(self.embedder.run())
+        asyncio.create_task(self.reranker.run())
+
+    # --- Request handling ---
+    def resolve_documents(self, filenames: List[str]) -> List[str]:
+        paths = []
+        for name in filenames:
+            path = os.path.realpath(os.path.join(self.input_dir, name))
+            if not path.startswith(self.input_dir + os.sep):
+                raise ValueError(f"Document outside input directory: {name}")
+            if self.index is None and not os.path.exists(path):
+                raise ValueError(f"Document not found: {name}")
+            paths.append(path)
+        return paths
+
+    async def process(self, body: bytes) -> Tuple[int, Dict]:
+        received = time.perf_counter()
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            return 503, {"error": "Server busy, retry later."}
+
+        try:
+            data = json.loads(body or b"{}")
+            persona, task, filenames = parse_input_config(data)
+            pdf_paths = self.resolve_documents(filenames)
+            top_k = int(data.get("top_k", 5))
+            max_per_doc = int(data.get("max_per_doc", 2))
+        except (ValueError, TypeError, AttributeError) as e:
+            return 400, {"error": str(e)}
+
+        # A request holds its pending count and concurrency slot until its pipeline thread
+        # returns, even after a 504, so abandoned work never hides from admission control
+        self.pending += 1
+        try:
+            await self.slots.acquire()
+        except BaseException:
+            self.pending -= 1
+            raise
+        started = time.perf_counter()
+        cancelled = threading.Event()
+        job = self.loop.run_in_executor(
+            self.pipeline_threads,
+            lambda: process_documents(
+                pdf_paths=pdf_paths,
+                persona=persona,
+                task=task,
+                output_file=None,
+                top_k=top_k,
+                max_per_doc=max_per_doc,
+                index=self.index,
+                embed_fn=lambda texts: self.embed(texts, cancelled),
+                score_fn=lambda query, texts: self.score(query, texts, cancelled)
+            )
+        )
+        job.add_done_callback(self.release_slot)
+        try:
+            output = await asyncio.wait_for(asyncio.shield(job), self.request_timeout)
+        except asyncio.TimeoutError:
+            # The thread stops at its next model call; its slot is freed when it does
+            cancelled.set()
+            self.timed_out += 1
+            return 504, {"error": f"Request exceeded {self.request_timeout:.0f}s."}
+        except Exception as e:
+            return 500, {"error": str(e)}
+        finished = time.perf_counter()
+
+        self.served += 1
+        output["timing"] = {
+            "queue_ms": round((started - received) * 1000, 2),
+            "processing_ms": round((finished - started) * 1000, 2),
+            "total_ms": round((finished - received) * 1000, 2)
+        }
+        return 200, output
+
+    def release_slot(self, job: asyncio.Future):
+        if not job.cancelled():
+            job.exception()  # retrieved here so abandoned jobs do not log "never retrieved"
+        self.slots.release()
+        self.pending -= 1
+
+    def health(self) -> Dict:
+        return {
+            "status": "ok",
+            "pending": self.pending,
+            "served": self.served,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "embedding": self.embedder.stats(),
+            "reranking": self.reranker.stats(),
+            "runtime": runtime.describe()
+        }
+
+    async def route(self, method: str, path: str, body: bytes) -> Tuple[int, Dict]:
+        if path == "/health":
+            return (200, self.health()) if method == "GET" else (405, {"error": "Use GET."})
+        if path == "/process":
+            return await self.process(body) if method == "POST" else (405, {"error": "Use POST."})
+        return 404, {"error": f"Unknown path {path}"}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").strip()
+            method, path, _ = request_line.split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                key, _, value = line.decode("latin-1").partition(":")
+                headers[key.strip().lower()] = value.strip()
+            length = int(headers.get("content-length", "0"))
+            if length > MAX_BODY_BYTES:
+                status, payload = 413, {"error": "Request body too large."}
+            else:
+                body = await reader.readexactly(length) if length else b""
+                status, payload = await self.route(method, path.split("?", 1)[0], body)
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            status, payload = 400, {"error": f"Malformed request: {e}"}
+
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: close\r\n\r\n"
+        )
+        try:
+            writer.write(head.encode("latin-1") + data)
+            await writer.drain()
+        finally:
+            writer.close()
+
+async def serve(args):
+    index = CorpusIndex.load(args.index) if args.index else None
+    server = InferenceServer(
+        input_dir=args.input_dir,
+        index=index,
+        max_concurrent=args.max_concurrent,
+        max_pending=args.max_pending,
+        request_timeout=args.timeout,
+        window_ms=args.batch_window_ms
+    )
+    await server.start()
+    if args.unix:
+        listener = await asyncio.start_unix_server(server.handle_connection, path=args.unix)
+        print(f"🚀 Serving on unix:{args.unix}")
+    else:
+        listener = await asyncio.start_server(server.handle_connection, args.host, args.port)
+        print(f"🚀 Serving on http://{args.host}:{args.port}")
+    async with listener:
+        await listener.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm persona-aware PDF insight service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--unix", help="Listen on a Unix socket path instead of TCP.")
+    parser.add_argument("--input-dir", default="/app/input", help="Directory request filenames are resolved against.")
+    parser.add_argument("--index", default=os.environ.get("CORPUS_INDEX_DIR"), help="Serve from a prebuilt corpus index.")
+    parser.add_argument("--max-concurrent", type=int, default=MAX_CONCURRENT)
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING)
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT)
+    parser.add_argument("--batch-window-ms", type=float, default=BATCH_WINDOW_MS)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,133 +1,564 @@
 import os
 import json
 import time
+import heapq
+import queue
+import threading
 from datetime import datetime
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Dict, Tuple, Optional
 import numpy as np
 import re
 
-from pdf_parser import extract_sections_from_pdf
-from utils.embeddings import embed_text
-from utils.similarity import rank_sections_by_similarity
-from utils.reranker import rerank_with_cross_encoder
+from pdf_parser import CHUNK_MAX_TOKENS, CHUNK_MODE, CHUNK_OVERLAP_TOKENS, PARSER_VERSION, extract_chunk_table, file_digest, iter_sections_from_pdf, PARSE_WORKERS
+from utils import metrics
+from utils.embeddings import MODEL_FILE as BI_ENCODER_FILE, embed_batch, embed_spans
+from utils.embedding_cache import embed_batch_cached
+from utils.bm25 import BM25_BUDGET, BM25_HYBRID, BM25Index
+from utils.chunk_table import ChunkTable
+from utils.dedup import DEDUP_CHUNKS, DEDUP_THRESHOLD, MinHashLSH, dedup_stats, deduplicate_rows, provenance, report_dedup_stats
+from utils.quantization import RESCORE_FACTOR, print_storage_report, storage_report
+from utils.similarity import cosine_scores, rank_rows
+from utils.reranker import MODEL_FILE as CROSS_ENCODER_FILE, cross_encode_batch, rerank_with_cross_encoder
+from utils.result_cache import RESULT_CACHE_BYPASS, cached_scorer, get_result_cache, model_stamp, new_entry, result_slot
+from utils.vector_index import CorpusIndex
 
-def find_most_relevant_sentences(chunk_text: str, query_embedding: np.ndarray, top_n: int = 1) -> List[str]:
-    """Finds the most relevant sentence(s) in a chunk to act as a title or summary."""
-    sentences = re.split(r'(?<=[.!?]) +', chunk_text)
-    if not sentences: return ["No relevant sentences found."]
-    
-    valid_sentences = [s.strip() for s in sentences if len(s.split()) > 3]
-    if not valid_sentences: return [chunk_text[:100]] # Fallback
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?]) +')
+
+def split_sentence_spans(chunk_text: str) -> List[Tuple[int, int]]:
+    """Character spans of the sentences find_most_relevant_sentences considers (stripped, more than 3 words)."""
+    spans = []
+    start = 0
+    boundaries = [(m.start(), m.end()) for m in SENTENCE_BOUNDARY.finditer(chunk_text)]
+    for piece_end, next_start in boundaries + [(len(chunk_text), len(chunk_text))]:
+        piece = chunk_text[start:piece_end]
+        stripped = piece.strip()
+        if len(stripped.split()) > 3:
+            offset = start + len(piece) - len(piece.lstrip())
+            spans.append((offset, offset + len(stripped)))
+        start = next_start
+    return spans
+
+def find_most_relevant_sentences(
+    chunk_text: str,
+    query_embedding: np.ndarray,
+    top_n: int = 1,
+    embed_fn: Optional[Callable[[List[str]], np.ndarray]] = None,
+    mode: str = "separate",
+    span_embeddings: Optional[np.ndarray] = None
+) -> List[str]:
+    """
+    Finds the most relevant sentence(s) in a chunk to act as a title or summary.
 
-    embeddings = [embed_text(s) for s in valid_sentences]
-    if not embeddings: return [chunk_text[:100]] # Fallback
+    mode="separate" embeds every sentence with its own forward pass (the original behaviour).
+    mode="span" mean-pools each sentence's token span from one forward pass over the chunk
+    (see embed_spans); pass span_embeddings to reuse spans pooled for many chunks at once.
+    Sentences past the model window are embedded separately, as in "separate" mode.
+    """
+    if mode == "span":
+        spans = split_sentence_spans(chunk_text)
+        if not spans: return [chunk_text[:100]] # Fallback
+        valid_sentences = [chunk_text[s:e] for s, e in spans]
+        embeddings = span_embeddings if span_embeddings is not None else embed_spans([chunk_text], [spans])[0]
+        # Spans past the model window pool no tokens (zero rows); embed those sentences on their own
+        uncovered = np.flatnonzero(~np.asarray(embeddings).any(axis=1))
+        if len(uncovered):
+            embeddings = np.array(embeddings, dtype=np.float32)
+            embeddings[uncovered] = (embed_fn or embed_batch)([valid_sentences[i] for i in uncovered])
+    else:
+        sentences = re.split(r'(?<=[.!?]) +', chunk_text)
+        if not sentences: return ["No relevant sentences found."]
+
+        valid_sentences = [s.strip() for s in sentences if len(s.split()) > 3]
+        if not valid_sentences: return [chunk_text[:100]] # Fallback
+
+        embeddings = (embed_fn or embed_batch)(valid_sentences)
+    if not len(embeddings): return [chunk_text[:100]] # Fallback
     
     # Use dot product for similarity with normalized embeddings
-    sims = np.dot(np.array(embeddings), query_embedding)
+    sims = np.dot(embeddings, query_embedding)
     top_indices = np.argsort(sims)[-top_n:][::-1]
     
     return [valid_sentences[i] for i in top_indices]
 
+# --- STREAMING MODE ---
+STREAM_QUEUE_SIZE = 512   # chunks buffered between the parser threads and the embedder
+STREAM_EMBED_BATCH = 128  # chunks handed to embed_batch at a time
+CANDIDATE_POOL = 50       # candidates kept for the cross-encoder
+
+def report_cache_stats(cache_stats: Dict):
+    if cache_stats["enabled"]:
+        total = cache_stats["hits"] + cache_stats["misses"]
+        rate = cache_stats["hits"] / total if total else 0.0
+        print(f"💾 Embedding cache: {cache_stats['hits']}/{total} hits ({rate:.0%}).")
+
+def chunk_embedder(
+    texts: List[str],
+    input_ids: List[Optional[List[int]]],
+    embed_fn: Optional[Callable[[List[str]], np.ndarray]] = None
+) -> Optional[Callable[[List[str]], np.ndarray]]:
+    """
+    Embedding function for chunk texts that reuses the token ids attached by the
+    token-aware chunker (CHUNK_MODE=tokens), so those chunks are never re-tokenized.
+    An explicit embed_fn takes precedence; returns None when there is nothing to reuse.
+    """
+    if embed_fn is not None:
+        return embed_fn
+    ids_by_text = {text: ids for text, ids in zip(texts, input_ids) if ids is not None}
+    if not ids_by_text:
+        return None
+    return lambda batch: embed_batch(batch, input_ids=[ids_by_text.get(t) for t in batch])
+
+def embed_table_rows(
+    table: ChunkTable,
+    rows: np.ndarray,
+    embed_fn: Optional[Callable[[List[str]], np.ndarray]] = None
+) -> Tuple[np.ndarray, Dict]:
+    """Embeds the given chunk-table rows through the (cached) batched embedder; returns (matrix, cache stats)."""
+    texts = table.texts(rows)
+    input_ids = [table.input_ids(row) for row in rows] if table.has_tokens else [None] * len(texts)
+    return embed_batch_cached(texts, return_stats=True, embed_fn=chunk_embedder(texts, input_ids, embed_fn))
+
+def stream_candidates(
+    pdf_paths: List[str],
+    query_embedding: np.ndarray,
+    top_n: int = CANDIDATE_POOL,
+    queue_size: int = STREAM_QUEUE_SIZE,
+    embed_batch_size: int = STREAM_EMBED_BATCH,
+    workers: int = PARSE_WORKERS,
+    embed_fn: Optional[Callable[[List[str]], np.ndarray]] = None,
+    dedup: bool = False
+) -> Tuple[List[Dict], Dict]:
+    """
+    Parses, embeds and scores chunks concurrently, keeping only the top_n candidates.
+
+    Parser threads push page chunks into a bounded queue; the calling thread drains it in
+    batches through the (cached) batched embedder and keeps a running min-heap of the best
+    scores, so memory is bounded by queue_size + top_n chunks rather than the corpus size.
+    With dedup, near-duplicates of an earlier chunk are dropped before embedding and
+    only their provenance is kept. Returns (candidates sorted by similarity, stats).
+    """
+    chunk_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    done = object()
+
+    def produce(pdf_path):
+        try:
+            for chunk in iter_sections_from_pdf(str(pdf_path)):
+                chunk["document"] = Path(pdf_path).name
+                while not stop.is_set():
+                    try:
+                        chunk_queue.put(chunk, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+        except Exception as e:
+            print(f"❌ Error extracting {pdf_path}: {e}")
+        finally:
+            chunk_queue.put(done)
+
+    heap = []  # (similarity, -arrival, dedup id, info): earlier chunks win ties, as in the batch path
+    stats = {"enabled": False, "hits": 0, "misses": 0, "chunks": 0, "embedded": 0}
+    lsh = MinHashLSH() if dedup else None
+    duplicates = {}  # representative id -> provenance of the near-duplicates dropped in its favour
+
+    def consume(batch):
+        stats["chunks"] += len(batch)
+        reps = [None] * len(batch)
+        if lsh is not None:
+            kept, reps = [], []
+            for chunk, (rep, is_new) in zip(batch, lsh.add_batch([c["text"] for c in batch])):
+                if is_new:
+                    kept.append(chunk)
+                    reps.append(rep)
+                else:
+                    duplicates.setdefault(rep, []).append(provenance(chunk))
+            batch = kept
+            if not batch:
+                return
+        texts = [c["text"] for c in batch]
+        vectors, cache_stats = embed_batch_cached(
+            texts, return_stats=True, embed_fn=chunk_embedder(texts, [c.get("input_ids") for c in batch], embed_fn)
+        )
+        stats["enabled"] = cache_stats["enabled"]
+        stats["hits"] += cache_stats["hits"]
+        stats["misses"] += cache_stats["misses"]
+        sims = vectors @ query_embedding
+        for sim, chunk, rep in zip(sims, batch, reps):
+            item = (float(sim), -stats["embedded"], rep, chunk)
+            stats["embedded"] += 1
+            if len(heap) < top_n:
+                heapq.heappush(heap, item)
+            elif item[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, item)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(pdf_paths)))) as pool:
+        for pdf_path in pdf_paths:
+            pool.submit(produce, pdf_path)
+        try:
+            remaining = len(pdf_paths)
+            batch = []
+            while remaining:
+                chunk = chunk_queue.get()
+                if chunk is done:
+                    remaining -= 1
+                    continue
+                batch.append(chunk)
+                if len(batch) >= embed_batch_size:
+                    consume(batch)
+                    batch = []
+            if batch:
+                consume(batch)
+        finally:
+            stop.set()
+            # Unblock any producer still waiting to post its sentinel
+            while remaining:
+                if chunk_queue.get() is done:
+                    remaining -= 1
+
+    candidates = []
+    for sim, _, rep, c in sorted(heap, key=lambda x: x[:2], reverse=True):
+        candidate = {"document": c["document"], "page_number": c["page_number"], "chunk_id": c["chunk_id"],
+                     "text": c["text"], "similarity": sim}
+        if rep in duplicates:
+            candidate["duplicates"] = duplicates[rep]
+        candidates.append(candidate)
+    if lsh is not None:
+        stats["dedup"] = dedup_stats(stats["chunks"], stats["embedded"], len(duplicates))
+    return candidates, stats
+
+def build_corpus_index(pdf_paths: List[str], index_dir: Optional[str] = None) -> CorpusIndex:
+    """Extracts and embeds a document set once so it can be queried repeatedly; saves it if index_dir is given."""
+    table = extract_chunk_table(pdf_paths)
+    embeddings, cache_stats = embed_table_rows(table, np.arange(len(table)))
+    report_cache_stats(cache_stats)
+
+    # Missing files were skipped by extraction and are left out of the index as well
+    present = [p for p in pdf_paths if os.path.isfile(p)]
+    meta = {
+        "documents": [Path(p).name for p in present],
+        "digests": {Path(p).name: file_digest(p) for p in present}
+    }
+    index = CorpusIndex.build(table, embeddings, meta=meta)
+    if index.quantized is not None:
+        index.meta["storage_report"] = storage_report(index.vectors, index.quantized)
+        print_storage_report(index.meta["storage_report"])
+    if index_dir:
+        index.save(index_dir)
+        print(f"🗂️ Saved index of {len(index)} chunks to {index_dir}")
+    return index
+
+def stale_index_documents(index: CorpusIndex, pdf_paths: List[str]) -> List[str]:
+    """
+    Input documents the index cannot answer for: not indexed, or changed since (content digest
+    differs). Missing files are treated as absent from the input, as extraction skips them.
+    """
+    digests = index.meta.get("digests") or {}
+    return [Path(p).name for p in pdf_paths
+            if os.path.isfile(p) and digests.get(Path(p).name) != file_digest(p)]
+
+def load_or_build_corpus_index(pdf_paths: List[str], index_dir: str) -> CorpusIndex:
+    """
+    The saved index in index_dir if it covers every input PDF with unchanged content;
+    otherwise (or if none exists yet) the input set is indexed again and saved there.
+    """
+    if CorpusIndex.exists(index_dir):
+        index = CorpusIndex.load(index_dir)
+        stale = stale_index_documents(index, pdf_paths)
+        if not stale:
+            return index
+        print(f"⚠️ Corpus index in {index_dir} is missing or out of date for {len(stale)} document(s) "
+              f"({', '.join(stale[:3])}{', ...' if len(stale) > 3 else ''}); rebuilding.")
+        del index  # release the memory-mapped files before they are overwritten
+    return build_corpus_index(pdf_paths, index_dir)
+
+def retrieve_candidates(
+    pdf_paths: List[str],
+    persona_query: str,
+    query_embedding: np.ndarray,
+    index: Optional[CorpusIndex] = None,
+    streaming: bool = False,
+    embed_fn: Optional[Callable[[List[str]], np.ndarray]] = None,
+    dedup: bool = DEDUP_CHUNKS,
+    bm25_budget: int = BM25_BUDGET,
+    hybrid: bool = BM25_HYBRID
+) -> List[Dict]:
+    """Steps 1+2: the CANDIDATE_POOL best chunks for the query, from the index, the streaming path or a full parse."""
+    if index is not None:
+        # --- Steps 1+2: Query a prebuilt corpus index instead of parsing PDFs ---
+        print("🔍 Stage 1: Retrieving candidates from corpus index...")
+        with metrics.stage("retrieve"):
+            candidate_sections = index.search(
+                query_embedding, top_k=CANDIDATE_POOL, documents=[Path(p).name for p in pdf_paths]
+            )
+        print(f"✅ Retrieved {len(candidate_sections)} candidates from {len(index)} indexed chunks.")
+    elif streaming:
+        # --- Steps 1+2: Parse, embed and retrieve concurrently with bounded memory ---
+        print("🔍 Streaming extraction and retrieval...")
+        with metrics.stage("stream_retrieve"):
+            candidate_sections, stream_stats = stream_candidates(
+                pdf_paths, query_embedding, embed_fn=embed_fn, dedup=dedup
+            )
+        metrics.incr("chunks", stream_stats["chunks"])
+        if dedup:
+            report_dedup_stats(stream_stats["dedup"])
+            metrics.incr("dedup_removed", stream_stats["dedup"]["removed"])
+        report_cache_stats(stream_stats)
+        print(f"✅ Streamed {stream_stats['chunks']} chunks; kept {len(candidate_sections)} candidates for reranking.")
+    else:
+        # --- Step 1: Chunk Extraction (now with cleaning) ---
+        # Chunks stay in one columnar table; later stages narrow `rows` instead of copying dicts
+        with metrics.stage("extract"):
+            table = extract_chunk_table(pdf_paths)
+        rows = np.arange(len(table))
+        metrics.incr("chunks", len(table))
+        print(f"✅ Extracted {len(table)} cleaned chunks.")
+
+        duplicates = {}
+        if dedup:
+            with metrics.stage("dedup"):
+                rows, duplicates, chunk_dedup_stats = deduplicate_rows(table, rows)
+            report_dedup_stats(chunk_dedup_stats)
+            metrics.incr("dedup_removed", chunk_dedup_stats["removed"])
+
+        lexical_scores = None
+        if bm25_budget > 0:
+            with metrics.stage("bm25"):
+                lexical = BM25Index()
+                lexical.add_many(table.texts(rows))
+                matched, lexical_scores = lexical.search(persona_query, bm25_budget)
+            if matched is None:
+                print("🔎 BM25 prefilter: no lexical matches; embedding every chunk.")
+            else:
+                print(f"🔎 BM25 prefilter: kept {len(matched)}/{len(rows)} chunks.")
+                metrics.incr("bm25_kept", len(matched))
+                rows = rows[matched]
+            if matched is None or not hybrid:
+                lexical_scores = None
+
+        # --- Step 2: Stage 1 - Fast Retrieval with Bi-Encoder ---
+        print("🔍 Stage 1: Retrieving candidates...")
+        with metrics.stage("embed"):
+            chunk_embeddings, cache_stats = embed_table_rows(table, rows, embed_fn)
+        report_cache_stats(cache_stats)
+
+        with metrics.stage("retrieve"):
+            sims = cosine_scores(query_embedding, chunk_embeddings)
+            candidate_sections = []
+            for i in rank_rows(sims, CANDIDATE_POOL, lexical_scores):
+                row = int(rows[i])
+                info = table.info(row, similarity=float(sims[i]))
+                if lexical_scores is not None:
+                    info["bm25"] = float(lexical_scores[i])
+                if row in duplicates:
+                    info["duplicates"] = duplicates[row]
+                candidate_sections.append(info)
+        print(f"✅ Retrieved {len(candidate_sections)} candidates for reranking.")
+    return candidate_sections
+
+def summarize_sections(
+    ranked_sections: List[Dict],
+    query_embedding: np.ndarray,
+    embed_fn: Optional[Callable[[List[str]], np.ndarray]] = None,
+    sentence_mode: str = "separate",
+    sentence_cache: Optional[Dict[str, List[str]]] = None
+) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Step 4: titles and subsection sentences for the reranked sections; returns
+    (extracted_sections, subsection_analysis). sentence_cache (chunk id -> most relevant
+    sentences, e.g. from the result cache) is read first and filled with new results.
+    """
+    sentence_cache = {} if sentence_cache is None else sentence_cache
+    subsection_analysis = []
+    final_sections = []
+    span_embeddings = [None] * len(ranked_sections)
+    with metrics.stage("sentences"):
+        missing = any(section["chunk_id"] not in sentence_cache for section in ranked_sections)
+        if sentence_mode == "span" and missing:
+            # One batched forward pass over the selected chunks covers every sentence
+            texts = [section["text"] for section in ranked_sections]
+            span_embeddings = embed_spans(texts, [split_sentence_spans(t) for t in texts])
+        for section, spans_embedded in zip(ranked_sections, span_embeddings):
+            relevant_sentences = sentence_cache.get(section["chunk_id"])
+            if relevant_sentences is None:
+                relevant_sentences = sentence_cache[section["chunk_id"]] = find_most_relevant_sentences(
+                    section["text"], query_embedding, top_n=3, embed_fn=embed_fn,
+                    mode=sentence_mode, span_embeddings=spans_embedded
+                )
+            section_title = relevant_sentences[0] if relevant_sentences else section["text"][:100]
+
+            for sent in relevant_sentences[:2]:
+                subsection_analysis.append({
+                    "document": section["document"],
+                    "page_number": section["page_number"],
+                    "refined_text": sent
+                })
+
+            final_section = {
+                "document": section["document"],
+                "section_title": section_title,
+                "importance_rank": section["rank"],
+                "page_number": section["page_number"]
+            }
+            if "duplicates" in section:
+                final_section["duplicates"] = section["duplicates"]
+            final_sections.append(final_section)
+    return final_sections, subsection_analysis
+
 def process_documents(
     pdf_paths: List[str],  # <- CHANGED: previously was pdf_dir
     persona: str, 
     task: str, 
-    output_file: str,
+    output_file: Optional[str],
     top_k: int = 5, 
-    max_per_doc: int = 2
+    max_per_doc: int = 2,
+    adaptive_rerank: bool = False,
+    streaming: bool = False,
+    index: Optional[CorpusIndex] = None,
+    embed_fn: Optional[Callable[[List[str]], np.ndarray]] = None,
+    score_fn: Optional[Callable[[str, List[str]], np.ndarray]] = None,
+    query_embedding: Optional[np.ndarray] = None,
+    sentence_mode: str = "separate",
+    dedup: bool = DEDUP_CHUNKS,
+    bm25_budget: int = BM25_BUDGET,
+    hybrid: bool = BM25_HYBRID,
+    bypass_result_cache: bool = RESULT_CACHE_BYPASS
 ) -> Dict:
+    """
+    Runs the full retrieval pipeline and writes the challenge output JSON (skipped if output_file is None).
+    embed_fn / score_fn override the bi-encoder and cross-encoder calls, e.g. with the
+    request-coalescing batchers of inference_server. A precomputed query_embedding
+    (e.g. from a batch of personas embedded together) skips the query forward pass.
+    sentence_mode="span" pools title/subsection sentences from one pass per selected chunk.
+    dedup embeds and reranks one representative per near-duplicate chunk group (not
+    applied to a prebuilt index); sections list the pages they stand in for as "duplicates".
+    bm25_budget > 0 (batch path) embeds only the top BM25 matches for the query, up to
+    that many chunks; hybrid then ranks them by fused BM25 + cosine ranks. Both are
+    ignored, with a warning, for streaming and index runs.
+    With RESULT_CACHE_DIR set, repeated queries over unchanged PDFs reuse cached results;
+    a new top_k/max_per_doc reuses the cached candidates and cross-encoder scores.
+    bypass_result_cache skips the lookup (the fresh result still refreshes the entry).
+    """
     start_time = time.time()
+    embed = embed_fn or embed_batch
     
     if not pdf_paths:
         print("❌ No PDF files provided.")
         return {}
 
     print(f"Found {len(pdf_paths)} PDF files to process.")
+    mode = "index" if index is not None else "streaming" if streaming else "batch"
+    if mode != "batch" and (bm25_budget > 0 or hybrid):
+        # The prefilter needs every chunk before embedding, which only the batch path has
+        print(f"⚠️ BM25 prefilter/hybrid ranking is not supported in {mode} mode; ignoring it.")
+        bm25_budget, hybrid = 0, False
+    hybrid = hybrid and bm25_budget > 0  # hybrid ranking fuses the prefilter's scores
+    owns_metrics = metrics.start_run(documents=len(pdf_paths), top_k=top_k, max_per_doc=max_per_doc, mode=mode)
 
-    # --- Step 1: Chunk Extraction (now with cleaning) ---
-    all_chunks = []
-    with ThreadPoolExecutor() as executor:
-        future_to_pdf = {
-            executor.submit(extract_sections_from_pdf, str(pdf_path)): pdf_path
-            for pdf_path in pdf_paths
-        }
-        for future in as_completed(future_to_pdf):
-            try:
-                chunks = future.result()
-                for chunk in chunks:
-                    chunk['document'] = Path(future_to_pdf[future]).name
-                    all_chunks.append(chunk)
-            except Exception as e:
-                print(f"❌ Error extracting {future_to_pdf[future]}: {e}")
-    print(f"✅ Extracted {len(all_chunks)} cleaned chunks.")
-
-    persona_query = f"{persona}: {task}"
-
-    # --- Step 2: Stage 1 - Fast Retrieval with Bi-Encoder ---
-    print("🔍 Stage 1: Retrieving candidates...")
-    query_embedding = embed_text(persona_query)
-    chunk_embeddings = [embed_text(chunk['text']) for chunk in all_chunks]
-
-    section_infos = [
-        {"document": c["document"], "page_number": c["page_number"], "chunk_id": c["chunk_id"], "text": c["text"]}
-        for c in all_chunks
-    ]
-
-    candidate_sections = rank_sections_by_similarity(
-        query_embedding, chunk_embeddings, section_infos, top_k=50
-    )
-    print(f"✅ Retrieved {len(candidate_sections)} candidates for reranking.")
-
-    # --- Step 3: Stage 2 - Accurate Reranking with Cross-Encoder ---
-    print("⚖️ Stage 2: Reranking candidates...")
-    ranked_sections = rerank_with_cross_encoder(
-        query=persona_query,
-        section_infos=candidate_sections,
-        top_k=top_k,
-        max_per_doc=max_per_doc
-    )
-
-    # --- Step 4: Subsection Analysis and Smart Title Generation ---
-    subsection_analysis = []
-    final_sections = []
-    for section in ranked_sections:
-        relevant_sentences = find_most_relevant_sentences(
-            section["text"], query_embedding, top_n=3
-        )
-        section_title = relevant_sentences[0] if relevant_sentences else section["text"][:100]
+    status = "error"
+    try:
+        persona_query = f"{persona}: {task}"
+        cache = get_result_cache()
+        cache_key = entry = None
+        if cache is not None and all(os.path.exists(p) for p in pdf_paths):
+            # Options only enter the key where they can change the result
+            storage = index.storage if index is not None else None
+            cache_key = cache.key(
+                persona, task,
+                [(Path(p).name, file_digest(p)) for p in pdf_paths],
+                mode=mode,
+                index_size=len(index) if index is not None else None,
+                storage=storage, rescore_factor=RESCORE_FACTOR if storage not in (None, "float32") else None,
+                adaptive=adaptive_rerank, dedup=dedup, dedup_threshold=DEDUP_THRESHOLD if dedup else None,
+                bm25_budget=bm25_budget, hybrid=hybrid,
+                sentence_mode=sentence_mode, candidate_pool=CANDIDATE_POOL,
+                chunk_mode=CHUNK_MODE, parser_version=PARSER_VERSION,
+                chunk_tokens=[CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS] if CHUNK_MODE == "tokens" else None,
+                models=[model_stamp(BI_ENCODER_FILE), model_stamp(CROSS_ENCODER_FILE)]
+            )
+            if not bypass_result_cache:
+                entry = cache.get(cache_key)
+        slot = result_slot(top_k, max_per_doc)
 
-        for sent in relevant_sentences[:2]:
-            subsection_analysis.append({
-                "document": section["document"],
-                "page_number": section["page_number"],
-                "refined_text": sent
-            })
-
-        final_sections.append({
-            "document": section["document"],
-            "section_title": section_title,
-            "importance_rank": section["rank"],
-            "page_number": section["page_number"]
-        })
-
-    # --- Final Output ---
-    output = {
-        "metadata": {
-            "input_documents": [Path(p).name for p in pdf_paths],
-            "persona": persona,
-            "job_to_be_done": task,
-            "processing_timestamp": datetime.now().isoformat()
-        },
-        "extracted_sections": final_sections,
-        "subsection_analysis": subsection_analysis
-    }
+        if entry is not None and slot in entry["results"]:
+            print("♻️ Result cache hit: reusing ranked sections.")
+            final_sections = entry["results"][slot]["extracted_sections"]
+            subsection_analysis = entry["results"][slot]["subsection_analysis"]
+        else:
+            if entry is not None:
+                print("♻️ Result cache hit: reusing candidates and cross-encoder scores.")
+                query_embedding = np.array(entry["query_embedding"], dtype=np.float32)
+                candidate_sections = entry["candidates"]
+            else:
+                if query_embedding is None:
+                    with metrics.stage("embed_query"):
+                        query_embedding = embed([persona_query])[0]
+                candidate_sections = retrieve_candidates(
+                    pdf_paths, persona_query, query_embedding, index=index, streaming=streaming,
+                    embed_fn=embed_fn, dedup=dedup, bm25_budget=bm25_budget, hybrid=hybrid
+                )
+                if cache_key is not None:
+                    entry = new_entry(query_embedding, candidate_sections)
+            if entry is not None:
+                score_fn = cached_scorer(entry, score_fn or cross_encode_batch)
+
+            # --- Step 3: Stage 2 - Accurate Reranking with Cross-Encoder ---
+            print("⚖️ Stage 2: Reranking candidates...")
+            with metrics.stage("rerank"):
+                ranked_sections, rerank_stats = rerank_with_cross_encoder(
+                    query=persona_query,
+                    section_infos=candidate_sections,
+                    top_k=top_k,
+                    max_per_doc=max_per_doc,
+                    adaptive=adaptive_rerank,
+                    return_stats=True,
+                    score_fn=score_fn
+                )
+            metrics.incr("candidates", rerank_stats["candidates"])
+            metrics.incr("pairs_scored", rerank_stats["pairs_scored"])
+            print(f"✅ Scored {rerank_stats['pairs_scored']}/{rerank_stats['candidates']} cross-encoder pairs.")
+
+            # --- Step 4: Subsection Analysis and Smart Title Generation ---
+            final_sections, subsection_analysis = summarize_sections(
+                ranked_sections, query_embedding, embed_fn, sentence_mode,
+                entry["sentences"] if entry is not None else None
+            )
+            if cache_key is not None:
+                entry["results"][slot] = {"extracted_sections": final_sections, "subsection_analysis": subsection_analysis}
+                try:
+                    cache.put(cache_key, entry)
+                except Exception as e:
+                    # The cache is an optimization: a failed write must not fail the request
+                    print(f"⚠️ Result cache write failed: {e}")
+
+        # --- Final Output ---
+        output = {
+            "metadata": {
+                "input_documents": [Path(p).name for p in pdf_paths],
+                "persona": persona,
+                "job_to_be_done": task,
+                "processing_timestamp": datetime.now().isoformat()
+            },
+            "extracted_sections": final_sections,
+            "subsection_analysis": subsection_analysis
+        }
 
-    Path(output_file).parent.mkdir(parents=True, exist_ok=True)
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(output, f, indent=2, ensure_ascii=False)
+        if output_file:
+            Path(output_file).parent.mkdir(parents=True, exist_ok=True)
+            with open(output_file, "w", encoding="utf-8") as f:
+                json.dump(output, f, indent=2, ensure_ascii=False)
 
-    print(f"🎯 Pipeline completed in {round(time.time() - start_time, 2)} seconds.")
-    print(f"📄 Output saved to: {output_file}")
+        status = "ok"
+        print(f"🎯 Pipeline completed in {round(time.time() - start_time, 2)} seconds.")
+        if output_file:
+            print(f"📄 Output saved to: {output_file}")
+    finally:
+        if owns_metrics:
+            metrics_file = metrics.metrics_path_for(output_file) if output_file else None
+            metrics.finish_run(metrics_file, status=status)
+            if metrics_file:
+                print(f"📊 Metrics saved to: {metrics_file}")
     return output
@@ -1,7 +1,59 @@
 import fitz  # PyMuPDF
 import hashlib
+import os
 import re
-from typing import List, Dict
+import mmap
+import struct
+import zlib
+import multiprocessing
+import tempfile
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from typing import List, Dict, Optional, Iterator, Tuple
+
+from utils import metrics
+from utils.chunk_table import ChunkTable, ChunkTableBuilder, chunk_id_to_int
+from utils.embeddings import get_tokenizer
+from utils.runtime import PARSE_WORKERS
+
+try:
+    import resource
+except ImportError:  # Windows: no per-process limits
+    resource = None
+
+# --- PARSE CACHE ---
+# Disabled unless a directory is given. Entries are keyed by the PDF's content digest
+# and chunking parameters, so the same file at a different path still hits.
+PARSE_CACHE_DIR = os.environ.get("PARSE_CACHE_DIR", "")
+# Bump when cleaning/chunking logic or the cache layout changes so stale entries are ignored
+PARSER_VERSION = 2
+CACHE_MAGIC = b"PCHK"
+CACHE_HEADER = struct.Struct("<4sII")  # magic, chunk count, has-token-ids flag
+
+# --- PARALLEL EXTRACTION ---
+# Documents with more than PARSE_SHARD_PAGES pages are split into page ranges and
+# parsed on a process pool; smaller ones stay on the in-process thread pool.
+# PARSE_WORKERS (default: all cores) is part of the core budget shared with inference.
+PARSE_SHARD_PAGES = int(os.environ.get("PARSE_SHARD_PAGES", "50"))
+
+# --- CHUNKING MODE ---
+# "words": chunk_size-word windows (default). "tokens": windows cut on bi-encoder token
+# boundaries that always fit the model, carrying their token ids on to inference.
+CHUNK_MODE = os.environ.get("CHUNK_MODE", "words")
+CHUNK_MAX_TOKENS = int(os.environ.get("CHUNK_MAX_TOKENS", "256"))  # including [CLS]/[SEP]
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", "32"))
+SENTENCE_END = ".!?"
+
+# --- LOW-MEMORY INGESTION ---
+# PARSE_LOW_MEMORY=1 opens PDFs from read-only memory maps and, in words mode, cleans and
+# chunks each page in one pass that yields chunk byte offsets into the page's UTF-8 text
+# instead of intermediate strings. Chunks are identical to the default path.
+# PARSE_MEMORY_LIMIT_MB caps each parse worker's heap (RLIMIT_DATA, which does not count
+# the read-only file mappings); when set, every document is parsed on the process pool.
+PARSE_LOW_MEMORY = os.environ.get("PARSE_LOW_MEMORY", "0") not in ("", "0")
+PARSE_MEMORY_LIMIT_MB = int(os.environ.get("PARSE_MEMORY_LIMIT_MB", "0"))
+ALLOC_FAILED = re.compile(r"\b(?:m|c|re)alloc\b.*failed")
 
 def clean_pdf_text(text: str) -> str:
     """
@@ -40,14 +92,264 @@ def split_text_into_chunks(text: str, chunk_size: int = 250, overlap: int = 50)
         i += chunk_size - overlap
     return chunks
 
-def extract_sections_from_pdf(pdf_path: str) -> List[Dict]:
+def chunk_page_offsets(text: str, chunk_size: int = 250, overlap: int = 50) -> Tuple[bytes, List[Tuple[int, int]]]:
     """
-    Extracts granular, cleaned, and uniformly-sized text chunks from a PDF.
+    clean_pdf_text() followed by split_text_into_chunks() in a single pass over the page:
+    returns the cleaned page as UTF-8 and each chunk's (start, end) byte range in it.
     """
-    doc = fitz.open(pdf_path)
+    words = []
+    pending = None  # hyphenated word waiting for its continuation
+    for line in text.split('\n'):
+        tokens = line.split()
+        # Fewer than 4 words also covers page-number lines (a digits-only line is one word)
+        if len(tokens) < 4:
+            continue
+        for token in tokens:
+            if token.endswith('-'):
+                pending = token[:-1] if pending is None else pending + token[:-1]
+            elif pending is not None:
+                words.append(pending + token)
+                pending = None
+            else:
+                words.append(token)
+    if pending is not None:
+        # Nothing follows the last hyphen, so it stays
+        words.append(pending + '-')
+    if not words:
+        return b"", []
+
+    data = " ".join(words).encode("utf-8")
+    # Words never contain a space byte (UTF-8 continuation bytes are >= 0x80)
+    ends = np.append(np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 0x20), len(data))
+    starts = np.insert(ends[:-1] + 1, 0, 0)
+
+    spans = []
+    i = 0
+    while i < len(words):
+        last = min(i + chunk_size, len(words)) - 1
+        spans.append((int(starts[i]), int(ends[last])))
+        if i + chunk_size >= len(words):
+            break
+        i += chunk_size - overlap
+    return data, spans
+
+def split_text_into_token_chunks(
+    text: str,
+    tokenizer,
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap: int = CHUNK_OVERLAP_TOKENS
+) -> List[Tuple[str, List[int]]]:
+    """
+    Splits text into chunks of at most max_tokens model tokens (special tokens included),
+    tokenizing the text only once. Each cut prefers the last sentence end in the back half
+    of the window, else the last word start, so no word is split. Returns
+    (chunk_text, input_ids) pairs whose ids are ready to feed to the bi-encoder.
+    """
+    encoded = tokenizer([text], add_special_tokens=False, truncation=False, return_offsets_mapping=True)
+    ids, offsets = encoded["input_ids"][0], encoded["offset_mapping"][0]
+    n = len(ids)
+    if not n:
+        return []
+    specials = len(tokenizer.build_inputs_with_special_tokens([]))
+    budget = max(1, min(max_tokens, tokenizer.model_max_length) - specials)
+    metrics.incr("chunker_tokens", n)
+
+    # Token k starts a word if whitespace precedes it, and a sentence if that word follows .!?
+    word_start = [True] + [offsets[k][0] > offsets[k - 1][1] for k in range(1, n)]
+    sentence_start = [True] + [
+        word_start[k] and text[offsets[k - 1][1] - 1] in SENTENCE_END for k in range(1, n)
+    ]
+
     chunks = []
-    for page_num, page in enumerate(doc):
-        raw_text = page.get_text("text")
+    start = 0
+    while True:
+        end = min(start + budget, n)
+        if end < n:
+            cut = next((k for k in range(end, start + budget // 2, -1) if sentence_start[k]), None)
+            if cut is None:
+                cut = next((k for k in range(end, start, -1) if word_start[k]), end)
+            end = cut
+        chunk_text = text[offsets[start][0]:offsets[end - 1][1]]
+        chunks.append((chunk_text, tokenizer.build_inputs_with_special_tokens(ids[start:end])))
+        if end >= n:
+            break
+        start = max(end - overlap, start + 1)
+        while start < end and not word_start[start]:
+            start += 1
+    return chunks
+
+def file_digest(path: str) -> str:
+    """Returns the SHA-256 hex digest of a file's contents."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def make_chunk_id(doc_digest: str, page_num: int, idx: int, chunk_text: str) -> str:
+    """
+    Builds a 64-bit chunk id (16 hex digits) from the document's content digest,
+    so it does not depend on the file path.
+    """
+    return hashlib.md5(
+        (f"{doc_digest}-{page_num}-{idx}-{chunk_text[:30]}").encode()
+    ).hexdigest()[:16]
+
+def parse_cache_path(cache_dir: str, doc_digest: str, chunk_size: int, overlap: int, mode: str = "words") -> str:
+    if mode == "tokens":
+        return os.path.join(
+            cache_dir, f"{doc_digest}-tokens{CHUNK_MAX_TOKENS}-{CHUNK_OVERLAP_TOKENS}-v{PARSER_VERSION}.chunks"
+        )
+    return os.path.join(cache_dir, f"{doc_digest}-{chunk_size}-{overlap}-v{PARSER_VERSION}.chunks")
+
+def save_cached_chunks(path: str, table: ChunkTable):
+    """
+    Writes a document's chunk table as zlib-compressed columns (pages, ids, offsets, text, tokens).
+    Each writer uses its own temp file; a failed write is reported and otherwise ignored.
+    """
+    columns = [table.page_numbers, table.chunk_ids, table.text_offsets]
+    if table.has_tokens:
+        columns.append(table.token_offsets)
+    columns.append(table.text_buffer)
+    if table.has_tokens:
+        columns.append(table.token_buffer)
+    body = b"".join(np.ascontiguousarray(c).tobytes() for c in columns)
+    payload = CACHE_HEADER.pack(CACHE_MAGIC, len(table), int(table.has_tokens)) + zlib.compress(body, 1)
+
+    tmp_path = None
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".", suffix=".tmp")
+        with open(fd, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"⚠️ Could not write parse cache {path}: {e}")
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def load_cached_chunks(path: str, document: str) -> Optional[ChunkTable]:
+    """Reads a table written by save_cached_chunks, or returns None if missing or unreadable."""
+    try:
+        with open(path, "rb") as f:
+            payload = f.read()
+        magic, count, has_tokens = CACHE_HEADER.unpack_from(payload, 0)
+        if magic != CACHE_MAGIC:
+            return None
+        body = zlib.decompress(payload[CACHE_HEADER.size:])
+    except (OSError, struct.error, zlib.error):
+        return None
+
+    pos = 0
+    def take(dtype, count):
+        nonlocal pos
+        column = np.frombuffer(body, dtype=dtype, count=count, offset=pos)
+        pos += column.nbytes
+        return column
+
+    page_numbers = take(np.int32, count)
+    chunk_ids = take(np.int64, count)
+    text_offsets = take(np.int64, count + 1)
+    token_offsets = take(np.int64, count + 1) if has_tokens else None
+    text_buffer = take(np.uint8, int(text_offsets[-1]))
+    token_buffer = take(np.int32, int(token_offsets[-1])) if has_tokens else None
+    return ChunkTable(
+        [document], np.zeros(count, dtype=np.int32), page_numbers, chunk_ids,
+        text_buffer, text_offsets, token_buffer, token_offsets
+    )
+
+@contextmanager
+def map_pdf(pdf_path: str, low_memory: bool = PARSE_LOW_MEMORY):
+    """Read-only memory map of the file with low_memory (None otherwise, or for empty files)."""
+    if not low_memory or not os.path.getsize(pdf_path):
+        yield None
+        return
+    with open(pdf_path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield mapped
+    finally:
+        mapped.close()
+
+@contextmanager
+def open_pdf(pdf_path: str, mapped: Optional[mmap.mmap] = None):
+    """
+    Opens a fitz document for the duration of the block; given a map_pdf() mapping, fitz
+    reads the file straight from it (file-backed pages rather than heap).
+    """
+    if mapped is None:
+        doc = fitz.open(pdf_path)
+        try:
+            yield doc
+        finally:
+            doc.close()
+        return
+
+    view = memoryview(mapped)
+    try:
+        doc = fitz.open(stream=view, filetype="pdf")
+        try:
+            yield doc
+        finally:
+            doc.close()
+    finally:
+        view.release()
+
+def release_mapped_pages(mapped: Optional[mmap.mmap]):
+    """Drops the mapping's pages from this process's RSS; they stay in the page cache and fault back in on use."""
+    if mapped is not None and hasattr(mmap, "MADV_DONTNEED"):
+        mapped.madvise(mmap.MADV_DONTNEED)
+
+def is_allocation_failure(error: Optional[BaseException]) -> bool:
+    """MemoryError, or a fitz error raised from a failed allocation ("calloc (...) failed")."""
+    while error is not None:
+        if isinstance(error, MemoryError) or ALLOC_FAILED.search(str(error)):
+            return True
+        error = error.__cause__
+    return False
+
+def limit_worker_memory(limit_mb: int):
+    """Process-pool initializer: caps the worker's heap so a runaway document raises MemoryError."""
+    if resource is None or limit_mb <= 0:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_DATA)
+    limit = limit_mb * 2**20
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_DATA, (limit, hard))
+
+def chunk_pages(
+    doc,
+    document: str,
+    doc_digest: str,
+    start: int,
+    stop: int,
+    chunk_size: int = 250,
+    overlap: int = 50,
+    mode: str = CHUNK_MODE,
+    low_memory: bool = PARSE_LOW_MEMORY,
+    mapped: Optional[mmap.mmap] = None
+) -> ChunkTable:
+    """
+    Cleans and chunks pages [start, stop) of an open fitz document into a chunk table.
+    In "tokens" mode each row also carries its bi-encoder input ids. When the document was
+    opened from `mapped`, the file pages each page read are released once it is chunked.
+    """
+    tokenizer = get_tokenizer() if mode == "tokens" else None
+    table = ChunkTableBuilder()
+    for page_num in range(start, stop):
+        raw_text = doc[page_num].get_text("text")
+        release_mapped_pages(mapped)
+
+        if low_memory and tokenizer is None:
+            data, spans = chunk_page_offsets(raw_text, chunk_size, overlap)
+            view = memoryview(data)
+            for idx, (chunk_start, chunk_end) in enumerate(spans):
+                # 30 characters fit in 120 UTF-8 bytes; a character cut at the limit is dropped
+                head = data[chunk_start:min(chunk_end, chunk_start + 120)].decode("utf-8", "ignore")
+                chunk_id = chunk_id_to_int(make_chunk_id(doc_digest, page_num, idx, head))
+                table.append_encoded(document, page_num + 1, chunk_id, view[chunk_start:chunk_end])
+            continue
         
         # --- NEW: Clean the text before chunking ---
         cleaned_text = clean_pdf_text(raw_text)
@@ -55,16 +357,225 @@ def extract_sections_from_pdf(pdf_path: str) -> List[Dict]:
         if not cleaned_text:
             continue
             
-        page_chunks = split_text_into_chunks(cleaned_text)
-        for idx, chunk_text in enumerate(page_chunks):
-            chunk_id = hashlib.md5(
-                (f"{pdf_path}-{page_num}-{idx}-{chunk_text[:30]}").encode()
-            ).hexdigest()
-            chunks.append({
-                "text": chunk_text,
-                "document": str(pdf_path).split("/")[-1],
-                "page_number": page_num + 1,
-                "chunk_id": chunk_id
-            })
-    doc.close()
-    return chunks
\ No newline at end of file
+        if tokenizer is not None:
+            page_chunks = split_text_into_token_chunks(cleaned_text, tokenizer)
+        else:
+            page_chunks = [(text, None) for text in split_text_into_chunks(cleaned_text, chunk_size, overlap)]
+        for idx, (chunk_text, input_ids) in enumerate(page_chunks):
+            chunk_id = chunk_id_to_int(make_chunk_id(doc_digest, page_num, idx, chunk_text))
+            table.append(document, page_num + 1, chunk_id, chunk_text, input_ids)
+    return table.build(copy_text=not low_memory)
+
+def extract_page_range(
+    pdf_path: str,
+    doc_digest: str,
+    start: int,
+    stop: int,
+    chunk_size: int = 250,
+    overlap: int = 50,
+    mode: str = CHUNK_MODE,
+    low_memory: bool = PARSE_LOW_MEMORY
+) -> ChunkTable:
+    """
+    Process-pool worker: opens its own fitz handle and chunks one page range. Running out
+    of memory raises MemoryError (fitz reports failed allocations as RuntimeErrors).
+    """
+    document = str(pdf_path).split("/")[-1]
+    try:
+        with map_pdf(pdf_path, low_memory) as mapped, open_pdf(pdf_path, mapped) as doc:
+            return chunk_pages(doc, document, doc_digest, start, stop, chunk_size, overlap, mode, low_memory, mapped)
+    except (MemoryError, RuntimeError) as e:
+        # Drop the traceback first: it keeps the failed parse's frames (and memory) alive,
+        # and a worker at its memory limit could not even format it
+        error = e.with_traceback(None)
+    if is_allocation_failure(error):
+        raise MemoryError(f"out of memory parsing pages {start + 1}-{stop}")
+    raise error
+
+def extract_document_table(
+    pdf_path: str,
+    chunk_size: int = 250,
+    overlap: int = 50,
+    cache_dir: str = PARSE_CACHE_DIR,
+    mode: str = CHUNK_MODE,
+    low_memory: bool = PARSE_LOW_MEMORY
+) -> ChunkTable:
+    """
+    Extracts granular, cleaned, and uniformly-sized text chunks from a PDF as a chunk table.
+    When cache_dir is set, unchanged files are served from the parse cache without opening fitz.
+    """
+    document = str(pdf_path).split("/")[-1]
+    doc_digest = file_digest(pdf_path)
+
+    cache_path = None
+    if cache_dir:
+        cache_path = parse_cache_path(cache_dir, doc_digest, chunk_size, overlap, mode)
+        cached = load_cached_chunks(cache_path, document)
+        if cached is not None:
+            metrics.incr("parse_cache_hits")
+            return cached
+        metrics.incr("parse_cache_misses")
+
+    with map_pdf(pdf_path, low_memory) as mapped, open_pdf(pdf_path, mapped) as doc:
+        table = chunk_pages(
+            doc, document, doc_digest, 0, doc.page_count, chunk_size, overlap, mode, low_memory, mapped
+        )
+        metrics.incr("pages_parsed", doc.page_count)
+
+    if cache_path:
+        save_cached_chunks(cache_path, table)
+    return table
+
+def extract_sections_from_pdf(
+    pdf_path: str,
+    chunk_size: int = 250,
+    overlap: int = 50,
+    cache_dir: str = PARSE_CACHE_DIR,
+    mode: str = CHUNK_MODE,
+    low_memory: bool = PARSE_LOW_MEMORY
+) -> List[Dict]:
+    """extract_document_table() as a list of chunk dicts."""
+    return extract_document_table(pdf_path, chunk_size, overlap, cache_dir, mode, low_memory).to_dicts()
+
+def iter_sections_from_pdf(
+    pdf_path: str,
+    chunk_size: int = 250,
+    overlap: int = 50,
+    cache_dir: str = PARSE_CACHE_DIR,
+    mode: str = CHUNK_MODE,
+    low_memory: bool = PARSE_LOW_MEMORY
+) -> Iterator[Dict]:
+    """
+    Generator variant of extract_sections_from_pdf: yields chunks page by page as they are parsed.
+    The parse cache is read the same way; it is only written once the whole document has been consumed.
+    """
+    document = str(pdf_path).split("/")[-1]
+    doc_digest = file_digest(pdf_path)
+
+    cache_path = None
+    if cache_dir:
+        cache_path = parse_cache_path(cache_dir, doc_digest, chunk_size, overlap, mode)
+        cached = load_cached_chunks(cache_path, document)
+        if cached is not None:
+            metrics.incr("parse_cache_hits")
+            yield from cached.to_dicts()
+            return
+        metrics.incr("parse_cache_misses")
+
+    collected = [] if cache_path else None
+    with map_pdf(pdf_path, low_memory) as mapped, open_pdf(pdf_path, mapped) as doc:
+        for page_num in range(doc.page_count):
+            page_table = chunk_pages(
+                doc, document, doc_digest, page_num, page_num + 1, chunk_size, overlap, mode, low_memory, mapped
+            )
+            metrics.incr("pages_parsed")
+            if collected is not None:
+                collected.append(page_table)
+            yield from page_table.to_dicts()
+
+    if cache_path:
+        save_cached_chunks(cache_path, ChunkTable.concat(collected).with_document(document))
+
+def extract_tables(
+    pdf_paths: List[str],
+    workers: int = PARSE_WORKERS,
+    shard_pages: int = PARSE_SHARD_PAGES,
+    chunk_size: int = 250,
+    overlap: int = 50,
+    cache_dir: str = PARSE_CACHE_DIR,
+    mode: str = CHUNK_MODE,
+    low_memory: bool = PARSE_LOW_MEMORY,
+    memory_limit_mb: int = PARSE_MEMORY_LIMIT_MB
+) -> Dict[str, ChunkTable]:
+    """
+    Extracts chunks from many PDFs, returning {pdf_path: chunk table} in input order.
+
+    Cached documents are served from the parse cache. Documents longer than shard_pages
+    are split into page ranges parsed by a process pool (one fitz handle per task) and
+    merged back in page order; chunk ids depend only on content, page and position, so
+    they are identical to a single-pass parse. Smaller documents use a thread pool,
+    unless memory_limit_mb is set: then every document goes to the pool, whose workers
+    run under that heap limit, and a document that exceeds it is skipped.
+    """
+    plans = {}
+    results = {}
+    for pdf_path in pdf_paths:
+        pdf_path = str(pdf_path)
+        try:
+            document = pdf_path.split("/")[-1]
+            doc_digest = file_digest(pdf_path)
+            cache_path = parse_cache_path(cache_dir, doc_digest, chunk_size, overlap, mode) if cache_dir else None
+            cached = load_cached_chunks(cache_path, document) if cache_path else None
+            if cached is not None:
+                metrics.incr("parse_cache_hits")
+                results[pdf_path] = cached
+                continue
+            if cache_path:
+                metrics.incr("parse_cache_misses")
+            with map_pdf(pdf_path, low_memory) as mapped, open_pdf(pdf_path, mapped) as doc:
+                page_count = doc.page_count
+            plans[pdf_path] = (doc_digest, cache_path, page_count)
+        except Exception as e:
+            print(f"❌ Error extracting {pdf_path}: {e}")
+
+    large = [p for p, (_, _, pages) in plans.items() if pages > shard_pages or memory_limit_mb > 0]
+    pool_context = nullcontext()
+    if large:
+        shard_count = sum(-(-plans[p][2] // shard_pages) for p in large)
+        pool_context = ProcessPoolExecutor(
+            max_workers=max(1, min(workers, shard_count)),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=limit_worker_memory,
+            initargs=(memory_limit_mb,)
+        )
+
+    with ThreadPoolExecutor(max_workers=workers) as threads, pool_context as processes:
+        futures = {}
+        for pdf_path, (doc_digest, _, page_count) in plans.items():
+            if pdf_path in large:
+                futures[pdf_path] = [
+                    processes.submit(extract_page_range, pdf_path, doc_digest, start,
+                                     min(start + shard_pages, page_count), chunk_size, overlap, mode, low_memory)
+                    for start in range(0, page_count, shard_pages)
+                ]
+            else:
+                futures[pdf_path] = [
+                    threads.submit(extract_page_range, pdf_path, doc_digest, 0, page_count,
+                                   chunk_size, overlap, mode, low_memory)
+                ]
+
+        for pdf_path, shard_futures in futures.items():
+            try:
+                # Shards were submitted in page order, so concatenating keeps chunks in page order
+                table = ChunkTable.concat([future.result() for future in shard_futures])
+            except MemoryError as e:
+                limit = f" (PARSE_MEMORY_LIMIT_MB={memory_limit_mb})" if memory_limit_mb else ""
+                print(f"❌ Error extracting {pdf_path}: {e}{limit}")
+                continue
+            except Exception as e:
+                print(f"❌ Error extracting {pdf_path}: {e}")
+                continue
+            metrics.incr("pages_parsed", plans[pdf_path][2])
+            table = table.with_document(pdf_path.split("/")[-1])
+            cache_path = plans[pdf_path][1]
+            if cache_path:
+                save_cached_chunks(cache_path, table)
+            results[pdf_path] = table
+
+    return {str(p): results[str(p)] for p in pdf_paths if str(p) in results}
+
+def extract_chunk_table(
+    pdf_paths: List[str],
+    workers: int = PARSE_WORKERS,
+    shard_pages: int = PARSE_SHARD_PAGES,
+    chunk_size: int = 250,
+    overlap: int = 50,
+    cache_dir: str = PARSE_CACHE_DIR,
+    mode: str = CHUNK_MODE,
+    low_memory: bool = PARSE_LOW_MEMORY,
+    memory_limit_mb: int = PARSE_MEMORY_LIMIT_MB
+) -> ChunkTable:
+    """All documents' chunks in one table, in input order (documents that fail are skipped)."""
+    tables = extract_tables(pdf_paths, workers, shard_pages, chunk_size, overlap, cache_dir, mode,
+                            low_memory, memory_limit_mb)
+    return ChunkTable.concat(list(tables.values()))
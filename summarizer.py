@@ -1,60 +1,44 @@
-import os
 import re
 import numpy as np
 import logging
 from pathlib import Path
 from collections import Counter
 
-import onnxruntime as ort
-from sklearn.metrics.pairwise import cosine_similarity
-from transformers import AutoTokenizer
-
-# ONNX model path (from environment variable or default)
-MODEL_PATH = os.environ.get("MINILM_MODEL_PATH", "./models/all-MiniLM-L6-v2/model_qint8_avx512_vnni.onnx")
-TOKENIZER_PATH = os.path.dirname(MODEL_PATH)
-
-# Load tokenizer & ONNX session
-tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_PATH)
-session = ort.InferenceSession(MODEL_PATH, providers=["CPUExecutionProvider"])
-
-def embed_onnx(text):
-    tokens = tokenizer(text, return_tensors="np", padding=True, truncation=True, max_length=512)
-
-    # Add token_type_ids if missing (some models/tokenizers don’t return it)
-    if "token_type_ids" not in tokens:
-        tokens["token_type_ids"] = np.zeros_like(tokens["input_ids"])
-
-    # Get only the inputs that ONNX model expects
-    required_inputs = [i.name for i in session.get_inputs()]
-    inputs_onnx = {k: tokens[k] for k in required_inputs if k in tokens}
-
-    outputs = session.run(None, inputs_onnx)[0]
-    norm = np.linalg.norm(outputs, axis=1, keepdims=True)
-    return (outputs / norm)[0]
-
-
-
+from utils.embeddings import embed_batch
+from utils.startup import timed_import
+
+# Precompiled once and shared by every call
+JUNK_PATTERNS = [
+    r'copyright', r'feedbooks', r'gutenberg', r'source:', r'brought to you by',
+    r'free ebooks? at', r'planet ebook', r'project gutenberg', r'all rights reserved',
+    r'public domain', r'similar users also downloaded', r'download', r'license',
+    r'www\.', r'https?://', r'\.(com|org|net|info|gov|edu)', r'ebook',
+    r'\bchapter\b', r'\bcontents\b', r'\bindex\b', r'\btable of contents\b',
+    r'\bpage \d+\b', r'\bthe end\b', r'\babout the author\b', r'\bbiography\b',
+    r'\bpublication\b', r'\bpublisher\b', r'\bprinted in', r'\bfirst published',
+    r'\bthis book is brought to you by', r'\bfor more free ebooks', r'\bvisit',
+    r'\bcontact us\b', r'\bdisclaimer\b', r'\btranscriber\b', r'\bfootnote\b',
+    r'\bnotes?\b', r'\bintroduction\b', r'\bforeword\b', r'\bappendix\b',
+    r'\bprologue\b', r'\bepilogue\b', r'\bbook [ivxlc]+\b', r'\bpart [ivxlc]+\b'
+]
+JUNK_RE = re.compile('|'.join(JUNK_PATTERNS), re.IGNORECASE)
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?]) +')
+WHITESPACE_RE = re.compile(r'\s+')
+BAD_TITLES = (
+    "loved this book ?", "about woolf:", "feedbooks", "project gutenberg", "similar users also downloaded",
+    "copyright", "download", "license", "public domain", "source:", "brought to you by",
+    "chapter", "contents", "index", "table of contents", "page", "the end", "about the author",
+    "biography", "publication", "publisher", "printed in", "first published", "this book is brought to you by",
+    "for more free ebooks", "visit", "contact us", "disclaimer", "transcriber", "footnote", "notes", "introduction",
+    "foreword", "appendix", "prologue", "epilogue", "book", "part"
+)
 
 def filter_junk_lines(text):
     lines = text.split('\n')
     filtered = []
-    junk_patterns = [
-        r'copyright', r'feedbooks', r'gutenberg', r'source:', r'brought to you by',
-        r'free ebooks? at', r'planet ebook', r'project gutenberg', r'all rights reserved',
-        r'public domain', r'similar users also downloaded', r'download', r'license',
-        r'www\.', r'https?://', r'\.(com|org|net|info|gov|edu)', r'ebook',
-        r'\bchapter\b', r'\bcontents\b', r'\bindex\b', r'\btable of contents\b',
-        r'\bpage \d+\b', r'\bthe end\b', r'\babout the author\b', r'\bbiography\b',
-        r'\bpublication\b', r'\bpublisher\b', r'\bprinted in', r'\bfirst published',
-        r'\bthis book is brought to you by', r'\bfor more free ebooks', r'\bvisit',
-        r'\bcontact us\b', r'\bdisclaimer\b', r'\btranscriber\b', r'\bfootnote\b',
-        r'\bnotes?\b', r'\bintroduction\b', r'\bforeword\b', r'\bappendix\b',
-        r'\bprologue\b', r'\bepilogue\b', r'\bbook [ivxlc]+\b', r'\bpart [ivxlc]+\b'
-    ]
-    junk_re = re.compile('|'.join(junk_patterns), re.IGNORECASE)
     for line in lines:
         l = line.strip()
-        if not l or junk_re.search(l):
+        if not l or JUNK_RE.search(l):
             continue
         if len(l.split()) < 5 and l.isupper():
             continue
@@ -65,7 +49,7 @@ def clean_text(text):
     return filter_junk_lines(text)
 
 def summarize(text, max_sentences=3):
-    sentences = re.split(r'(?<=[.!?]) +', text)
+    sentences = SENTENCE_SPLIT_RE.split(text)
     return ' '.join(sentences[:max_sentences]).strip()
 
 def extract_content_paragraphs(text, top_k=2, min_length=30):
@@ -76,55 +60,60 @@ def extract_content_paragraphs(text, top_k=2, min_length=30):
         paragraphs = [p.strip() for p in text.split('\n') if p.strip()]
     return paragraphs[:top_k] if paragraphs else []
 
+def sentence_term_matrix(sentences):
+    """Binary sentences x vocabulary CSR matrix over lowercased whitespace tokens."""
+    sparse = timed_import("scipy.sparse")
+    vocab = {}
+    indices, indptr = [], [0]
+    for sentence in sentences:
+        indices.extend({vocab.setdefault(word, len(vocab)) for word in sentence.lower().split()})
+        indptr.append(len(indices))
+    data = np.ones(len(indices), dtype=np.int64)
+    return sparse.csr_matrix((data, indices, indptr), shape=(len(sentences), len(vocab)))
+
 def textrank_summary(text, top_n=3):
-    text = re.sub(r'\s+', ' ', text)
-    sentences = re.split(r'(?<=[.!?]) +', text)
+    """
+    Picks the top_n sentences sharing the most words with all other sentences, in text order.
+    A sentence's score (sum of its word-set overlaps with every other sentence) is
+    X @ df - |words|, where X is the binary term matrix and df the per-word sentence counts,
+    so no sentence pairs are compared explicitly.
+    """
+    text = WHITESPACE_RE.sub(' ', text)
+    sentences = SENTENCE_SPLIT_RE.split(text)
     sentences = [s.strip() for s in sentences if len(s.strip().split()) > 6]
     if not sentences:
         return ""
-    scores = []
-    for i, s1 in enumerate(sentences):
-        score = 0
-        words1 = set(s1.lower().split())
-        for j, s2 in enumerate(sentences):
-            if i == j:
-                continue
-            words2 = set(s2.lower().split())
-            score += len(words1 & words2)
-        scores.append((score, i, s1))
-    top = sorted(scores, reverse=True)[:top_n]
-    top_indices = sorted([i for _, i, _ in top])
+    terms = sentence_term_matrix(sentences)
+    document_frequency = np.asarray(terms.sum(axis=0)).ravel()
+    scores = terms @ document_frequency - terms.getnnz(axis=1)
+    # Highest score first, later sentence first on ties
+    order = np.lexsort((-np.arange(len(sentences)), -scores))
+    top_indices = sorted(order[:top_n].tolist())
     return ' '.join([sentences[i] for i in top_indices])
 
 def clean_title(title, content, page):
-    bad_titles = [
-        "loved this book ?", "about woolf:", "feedbooks", "project gutenberg", "similar users also downloaded",
-        "copyright", "download", "license", "public domain", "source:", "brought to you by",
-        "chapter", "contents", "index", "table of contents", "page", "the end", "about the author",
-        "biography", "publication", "publisher", "printed in", "first published", "this book is brought to you by",
-        "for more free ebooks", "visit", "contact us", "disclaimer", "transcriber", "footnote", "notes", "introduction",
-        "foreword", "appendix", "prologue", "epilogue", "book", "part"
-    ]
-    if not title or any(bad in title.lower() for bad in bad_titles) or len(title.strip()) < 4:
+    if not title or any(bad in title.lower() for bad in BAD_TITLES) or len(title.strip()) < 4:
         content_clean = clean_text(content)
         first_sentence = summarize(content_clean, max_sentences=1)
         return first_sentence if first_sentence else f"Section on page {page}"
     return title.strip()
 
+def most_relevant_paragraph(prompt, paragraphs):
+    """The first paragraph with the highest cosine similarity to the prompt ("" if all are blank)."""
+    candidates = [para for para in paragraphs if para.strip()]
+    if not candidates:
+        return ""
+    # One batched forward pass; rows come back L2-normalized, so dot products are cosines
+    embeddings = embed_batch([prompt] + candidates)
+    scores = embeddings[1:] @ embeddings[0]
+    return candidates[int(np.argmax(scores))]
+
 def summarize_most_relevant(text, prompt, model=None, max_words=120):
     cleaned_text = clean_text(text)
     paragraphs = [p.strip() for p in cleaned_text.split('\n') if p.strip()]
     if not paragraphs:
         paragraphs = [cleaned_text]
-    prompt_emb = embed_onnx(prompt)
-    best_para = ""
-    best_score = -1
-    for para in paragraphs:
-        para_emb = embed_onnx(para)
-        score = cosine_similarity([prompt_emb], [para_emb])[0][0]
-        if score > best_score and para.strip():
-            best_score = score
-            best_para = para
+    best_para = most_relevant_paragraph(prompt, paragraphs)
     if not best_para.strip():
         for para in paragraphs:
             if para.strip():
@@ -0,0 +1,100 @@
+# utils/bm25.py
+import os
+import re
+import math
+import numpy as np
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+# --- LEXICAL PREFILTER ---
+# BM25_BUDGET > 0 keeps at most that many lexically matching chunks for the bi-encoder;
+# BM25_HYBRID fuses the BM25 and cosine rankings instead of ranking by cosine alone.
+BM25_BUDGET = int(os.environ.get("BM25_BUDGET", "0"))
+BM25_HYBRID = os.environ.get("BM25_HYBRID", "0") not in ("", "0")
+K1 = 1.5
+B = 0.75
+RRF_K = 60  # reciprocal rank fusion damping constant
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the to was were will with".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+class BM25Index:
+    """
+    Incremental inverted index: add() chunks as they are extracted, then search() for
+    the rows worth embedding. Postings are compact (row, term frequency) arrays.
+    """
+
+    def __init__(self, k1: float = K1, b: float = B):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.lengths = array("I")
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def add(self, text: str) -> int:
+        """Indexes one chunk and returns its row."""
+        row = len(self.lengths)
+        terms = tokenize(text)
+        counts: Dict[str, int] = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        for term, tf in counts.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = (array("I"), array("I"))
+            posting[0].append(row)
+            posting[1].append(tf)
+        self.lengths.append(len(terms))
+        return row
+
+    def add_many(self, texts: List[str]) -> List[int]:
+        return [self.add(text) for text in texts]
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every indexed row for the query (0 for rows sharing no term)."""
+        n = len(self.lengths)
+        scores = np.zeros(n, dtype=np.float32)
+        if not n:
+            return scores
+        lengths = np.frombuffer(self.lengths, dtype=np.uint32).astype(np.float32)
+        norm = self.k1 * (1 - self.b + self.b * lengths / max(float(lengths.mean()), 1e-9))
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            rows = np.frombuffer(posting[0], dtype=np.uint32)
+            tf = np.frombuffer(posting[1], dtype=np.uint32).astype(np.float32)
+            idf = math.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            scores[rows] += idf * tf * (self.k1 + 1) / (tf + norm[rows])
+        return scores
+
+    def search(self, query: str, budget: int) -> Tuple[Optional[np.ndarray], np.ndarray]:
+        """
+        Returns (rows, scores) for the top `budget` rows that match any query term, in
+        row order so downstream tie-breaking is unchanged. rows is None when nothing
+        matches, meaning the lexical stage cannot narrow the corpus.
+        """
+        scores = self.scores(query)
+        matched = np.flatnonzero(scores > 0)
+        if not len(matched):
+            return None, scores
+        if len(matched) > budget:
+            matched = np.sort(matched[np.argpartition(-scores[matched], budget - 1)[:budget]])
+        return matched, scores[matched]
+
+def reciprocal_rank_fusion(*score_lists: np.ndarray, k: int = RRF_K) -> np.ndarray:
+    """Sums 1 / (k + rank) over each score list (rank 1 = best; ties broken by row)."""
+    fused = np.zeros(len(score_lists[0]), dtype=np.float64)
+    for scores in score_lists:
+        order = np.lexsort((np.arange(len(scores)), -np.asarray(scores)))
+        ranks = np.empty(len(scores), dtype=np.float64)
+        ranks[order] = np.arange(1, len(scores) + 1)
+        fused += 1.0 / (k + ranks)
+    return fused
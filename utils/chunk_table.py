@@ -0,0 +1,241 @@
+# utils/chunk_table.py
+import os
+import json
+import numpy as np
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence
+
+def chunk_id_to_int(chunk_id: str) -> int:
+    """64-bit signed integer form of a chunk id (its first 8 digest bytes)."""
+    return int.from_bytes(bytes.fromhex(chunk_id)[:8], "little", signed=True)
+
+def chunk_id_to_hex(value: int) -> str:
+    return int(value).to_bytes(8, "little", signed=True).hex()
+
+class ChunkTable:
+    """
+    Columnar chunk storage: one row per chunk.
+
+    Document names are interned (doc_ids index into `documents`), page numbers and
+    doc ids are int32 arrays, chunk ids are int64, and all texts live in a single UTF-8
+    buffer sliced by `text_offsets`. Token-mode chunks keep their input ids in one flat
+    int32 buffer the same way. Pipeline stages pass row indices around and only build
+    dicts (info()) for the handful of rows that reach the output.
+    """
+
+    def __init__(
+        self,
+        documents: List[str],
+        doc_ids: np.ndarray,
+        page_numbers: np.ndarray,
+        chunk_ids: np.ndarray,
+        text_buffer: np.ndarray,
+        text_offsets: np.ndarray,
+        token_buffer: Optional[np.ndarray] = None,
+        token_offsets: Optional[np.ndarray] = None
+    ):
+        self.documents = documents
+        self.doc_ids = doc_ids
+        self.page_numbers = page_numbers
+        self.chunk_ids = chunk_ids
+        self.text_buffer = text_buffer
+        self.text_offsets = text_offsets
+        self.token_buffer = token_buffer
+        self.token_offsets = token_offsets
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    @property
+    def has_tokens(self) -> bool:
+        return self.token_offsets is not None
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.doc_ids, self.page_numbers, self.chunk_ids, self.text_buffer, self.text_offsets]
+        if self.has_tokens:
+            arrays += [self.token_buffer, self.token_offsets]
+        return sum(a.nbytes for a in arrays)
+
+    # --- Row access ---
+    def text(self, row: int) -> str:
+        start, end = self.text_offsets[row], self.text_offsets[row + 1]
+        return self.text_buffer[start:end].tobytes().decode("utf-8")
+
+    def texts(self, rows: Optional[Iterable[int]] = None) -> List[str]:
+        rows = range(len(self)) if rows is None else rows
+        return [self.text(row) for row in rows]
+
+    def document(self, row: int) -> str:
+        return self.documents[self.doc_ids[row]]
+
+    def chunk_id(self, row: int) -> str:
+        return chunk_id_to_hex(self.chunk_ids[row])
+
+    def input_ids(self, row: int) -> Optional[List[int]]:
+        if not self.has_tokens:
+            return None
+        start, end = self.token_offsets[row], self.token_offsets[row + 1]
+        return self.token_buffer[start:end].tolist() if end > start else None
+
+    def info(self, row: int, **extra) -> Dict:
+        """The row in the section-info dict shape used by the pipeline, plus any extra keys."""
+        info = {
+            "document": self.document(row),
+            "page_number": int(self.page_numbers[row]),
+            "chunk_id": self.chunk_id(row),
+            "text": self.text(row)
+        }
+        info.update(extra)
+        return info
+
+    def to_dicts(self) -> List[Dict]:
+        chunks = []
+        for row in range(len(self)):
+            chunk = self.info(row)
+            input_ids = self.input_ids(row)
+            if input_ids is not None:
+                chunk["input_ids"] = input_ids
+            chunks.append(chunk)
+        return chunks
+
+    def document_mask(self, documents: Optional[Iterable[str]]) -> Optional[np.ndarray]:
+        if documents is None:
+            return None
+        wanted = set(documents)
+        return np.isin(self.doc_ids, [i for i, name in enumerate(self.documents) if name in wanted])
+
+    # --- Construction ---
+    @classmethod
+    def empty(cls) -> "ChunkTable":
+        return ChunkTableBuilder().build()
+
+    @classmethod
+    def from_dicts(cls, chunks: Iterable[Dict]) -> "ChunkTable":
+        builder = ChunkTableBuilder()
+        for c in chunks:
+            builder.append(c["document"], c["page_number"], chunk_id_to_int(c["chunk_id"]), c["text"], c.get("input_ids"))
+        return builder.build()
+
+    @classmethod
+    def concat(cls, tables: Sequence["ChunkTable"]) -> "ChunkTable":
+        """Stacks tables row-wise, merging their document name lists."""
+        tables = [t for t in tables if len(t)]
+        if not tables:
+            return cls.empty()
+        if len(tables) == 1:
+            return tables[0]
+
+        documents, doc_index, doc_ids = [], {}, []
+        for t in tables:
+            remap = np.array([doc_index.setdefault(name, len(doc_index)) for name in t.documents], dtype=np.int32)
+            doc_ids.append(remap[t.doc_ids] if len(t.documents) else t.doc_ids)
+        documents = list(doc_index)
+
+        def stacked_offsets(offsets: List[np.ndarray]) -> np.ndarray:
+            parts, base = [np.zeros(1, dtype=np.int64)], 0
+            for o in offsets:
+                parts.append(o[1:] + base)
+                base += int(o[-1])
+            return np.concatenate(parts)
+
+        with_tokens = any(t.has_tokens for t in tables)
+        token_buffer = token_offsets = None
+        if with_tokens:
+            token_offsets = stacked_offsets([
+                t.token_offsets if t.has_tokens else np.zeros(len(t) + 1, dtype=np.int64) for t in tables
+            ])
+            token_buffer = np.concatenate([t.token_buffer for t in tables if t.has_tokens])
+        return cls(
+            documents,
+            np.concatenate(doc_ids),
+            np.concatenate([t.page_numbers for t in tables]),
+            np.concatenate([t.chunk_ids for t in tables]),
+            np.concatenate([t.text_buffer for t in tables]),
+            stacked_offsets([t.text_offsets for t in tables]),
+            token_buffer,
+            token_offsets
+        )
+
+    def with_document(self, document: str) -> "ChunkTable":
+        """Same rows, all attributed to one document name (e.g. chunks loaded from the parse cache)."""
+        return ChunkTable(
+            [document], np.zeros(len(self), dtype=np.int32), self.page_numbers, self.chunk_ids,
+            self.text_buffer, self.text_offsets, self.token_buffer, self.token_offsets
+        )
+
+    # --- Persistence (one .npy per column, so large tables can be memory-mapped) ---
+    COLUMNS = ["doc_ids", "page_numbers", "chunk_ids", "text_buffer", "text_offsets", "token_buffer", "token_offsets"]
+
+    def save(self, directory: str, prefix: str = "chunks"):
+        os.makedirs(directory, exist_ok=True)
+        for name in self.COLUMNS:
+            value = getattr(self, name)
+            if value is not None:
+                np.save(os.path.join(directory, f"{prefix}.{name}.npy"), value)
+        with open(os.path.join(directory, f"{prefix}.documents.json"), "w", encoding="utf-8") as f:
+            json.dump(self.documents, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str, prefix: str = "chunks", mmap: bool = True) -> "ChunkTable":
+        columns = {}
+        for name in cls.COLUMNS:
+            path = os.path.join(directory, f"{prefix}.{name}.npy")
+            columns[name] = np.load(path, mmap_mode="r" if mmap else None) if os.path.exists(path) else None
+        with open(os.path.join(directory, f"{prefix}.documents.json"), "r", encoding="utf-8") as f:
+            documents = json.load(f)
+        return cls(documents, **columns)
+
+class ChunkTableBuilder:
+    """Appends chunks one at a time into growable arrays, then freezes them into a ChunkTable."""
+
+    def __init__(self):
+        self.documents: List[str] = []
+        self.doc_index: Dict[str, int] = {}
+        self.doc_ids = array("i")
+        self.page_numbers = array("i")
+        self.chunk_ids = array("q")
+        self.text = bytearray()
+        self.text_offsets = array("q", [0])
+        self.tokens: Optional[array] = None
+        self.token_offsets: Optional[array] = None
+
+    def append(self, document: str, page_number: int, chunk_id: int, text: str, input_ids: Optional[List[int]] = None):
+        self.append_encoded(document, page_number, chunk_id, text.encode("utf-8"), input_ids)
+
+    def append_encoded(self, document: str, page_number: int, chunk_id: int, data, input_ids: Optional[List[int]] = None):
+        """append() for text that is already UTF-8 (bytes or a memoryview slice of a larger buffer)."""
+        doc_id = self.doc_index.get(document)
+        if doc_id is None:
+            doc_id = self.doc_index[document] = len(self.documents)
+            self.documents.append(document)
+        if input_ids is not None and self.tokens is None:
+            # Earlier rows had no ids: give them empty token ranges
+            self.tokens = array("i")
+            self.token_offsets = array("q", [0] * len(self.text_offsets))
+        self.doc_ids.append(doc_id)
+        self.page_numbers.append(page_number)
+        self.chunk_ids.append(chunk_id)
+        self.text += data
+        self.text_offsets.append(len(self.text))
+        if self.tokens is not None:
+            if input_ids is not None:
+                self.tokens.extend(input_ids)
+            self.token_offsets.append(len(self.tokens))
+
+    def build(self, copy_text: bool = True) -> ChunkTable:
+        """
+        Freezes the rows into a ChunkTable. With copy_text=False the table's text buffer is
+        a view of the builder's (no second copy of all chunk text), so nothing may be
+        appended afterwards.
+        """
+        return ChunkTable(
+            self.documents,
+            np.frombuffer(self.doc_ids, dtype=np.int32).copy(),
+            np.frombuffer(self.page_numbers, dtype=np.int32).copy(),
+            np.frombuffer(self.chunk_ids, dtype=np.int64).copy(),
+            np.frombuffer(bytes(self.text) if copy_text else self.text, dtype=np.uint8),
+            np.frombuffer(self.text_offsets, dtype=np.int64).copy(),
+            np.frombuffer(self.tokens, dtype=np.int32).copy() if self.tokens is not None else None,
+            np.frombuffer(self.token_offsets, dtype=np.int64).copy() if self.token_offsets is not None else None
+        )
@@ -0,0 +1,122 @@
+# utils/dedup.py
+import os
+import zlib
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+from utils.chunk_table import ChunkTable
+
+# --- NEAR-DUPLICATE DETECTION (MinHash + LSH) ---
+# Chunks whose estimated Jaccard similarity over word shingles reaches the threshold are
+# grouped; 8 bands of 8 rows make pairs at ~0.8 similarity very likely to share a bucket.
+DEDUP_CHUNKS = os.environ.get("DEDUP_CHUNKS", "0") not in ("", "0")
+DEDUP_THRESHOLD = float(os.environ.get("DEDUP_THRESHOLD", "0.8"))
+NUM_PERM = 64
+BANDS = 8
+SHINGLE_WORDS = 5
+
+def shingle_hashes(text: str, shingle_words: int = SHINGLE_WORDS) -> np.ndarray:
+    """CRC32 of every run of shingle_words lowercased words (the whole text if it is shorter)."""
+    words = text.lower().split()
+    count = max(1, len(words) - shingle_words + 1)
+    return np.fromiter(
+        (zlib.crc32(" ".join(words[i:i + shingle_words]).encode("utf-8")) for i in range(count)),
+        dtype=np.uint64, count=count
+    )
+
+class MinHashLSH:
+    """
+    Incremental near-duplicate index. add_batch() assigns each text to the first earlier
+    representative it matches, or makes it a new representative, so results do not
+    depend on batch boundaries and the first occurrence always wins.
+    """
+
+    def __init__(
+        self,
+        threshold: float = DEDUP_THRESHOLD,
+        num_perm: int = NUM_PERM,
+        bands: int = BANDS,
+        shingle_words: int = SHINGLE_WORDS,
+        seed: int = 0
+    ):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be divisible by bands ({bands}).")
+        rng = np.random.default_rng(seed)
+        # Multiply-add-shift hashing: ((a * x + b) mod 2^64) >> 32 with odd a
+        self.a = rng.integers(1, 2**63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_words = shingle_words
+        self.buckets: Dict[Tuple[int, bytes], List[int]] = {}
+        self.signatures: List[np.ndarray] = []  # per representative
+        self.count = 0
+
+    def signature(self, text: str) -> np.ndarray:
+        shingles = shingle_hashes(text, self.shingle_words)
+        with np.errstate(over="ignore"):
+            hashed = (self.a[:, None] * shingles[None, :] + self.b[:, None]) >> np.uint64(32)
+        return hashed.min(axis=1).astype(np.uint32)
+
+    def add(self, text: str) -> Tuple[int, bool]:
+        """Returns (representative id, is_new)."""
+        sig = self.signature(text)
+        keys = [(band, sig[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+        candidates = sorted({rep for key in keys for rep in self.buckets.get(key, ())})
+        for rep in candidates:
+            if np.mean(self.signatures[rep] == sig) >= self.threshold:
+                self.count += 1
+                return rep, False
+
+        rep = len(self.signatures)
+        self.signatures.append(sig)
+        for key in keys:
+            self.buckets.setdefault(key, []).append(rep)
+        self.count += 1
+        return rep, True
+
+    def add_batch(self, texts: List[str]) -> List[Tuple[int, bool]]:
+        return [self.add(text) for text in texts]
+
+def provenance(chunk: Dict) -> Dict:
+    return {"document": chunk["document"], "page_number": chunk["page_number"], "chunk_id": chunk["chunk_id"]}
+
+def dedup_stats(total: int, unique: int, groups: int) -> Dict:
+    return {
+        "chunks": total,
+        "unique": unique,
+        "removed": total - unique,
+        "groups": groups,  # representatives with at least one duplicate
+        "ratio": round((total - unique) / total, 4) if total else 0.0
+    }
+
+def deduplicate_rows(
+    table: ChunkTable,
+    rows: Optional[np.ndarray] = None,
+    lsh: Optional[MinHashLSH] = None
+) -> Tuple[np.ndarray, Dict[int, List[Dict]], Dict]:
+    """
+    Keeps one representative row (the first occurrence) per near-duplicate group; returns
+    (representative rows, provenance of the dropped duplicates keyed by representative row, stats).
+    """
+    lsh = lsh or MinHashLSH()
+    rows = np.arange(len(table)) if rows is None else np.asarray(rows)
+    kept = []
+    rep_rows = {}
+    duplicates: Dict[int, List[Dict]] = {}
+    for row in rows.tolist():
+        rep, is_new = lsh.add(table.text(row))
+        if is_new:
+            rep_rows[rep] = row
+            kept.append(row)
+        else:
+            info = {"document": table.document(row), "page_number": int(table.page_numbers[row]),
+                    "chunk_id": table.chunk_id(row)}
+            duplicates.setdefault(rep_rows[rep], []).append(info)
+    return np.array(kept, dtype=np.int64), duplicates, dedup_stats(len(rows), len(kept), len(duplicates))
+
+def report_dedup_stats(stats: Dict):
+    print(f"🧬 Dedup: removed {stats['removed']}/{stats['chunks']} near-duplicate chunks "
+          f"({stats['ratio']:.1%}) across {stats['groups']} groups.")
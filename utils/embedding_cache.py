@@ -0,0 +1,260 @@
+# utils/embedding_cache.py
+import os
+import hashlib
+import threading
+import time
+import numpy as np
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Callable, List, Dict, Optional, Tuple, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-writer use only
+    fcntl = None
+
+from utils import metrics
+from utils.embeddings import MODEL_DIR, MODEL_FILE, embed_batch, get_embedding_dim, get_tokenizer
+
+# --- PERSISTENT EMBEDDING CACHE ---
+# Disabled unless a directory is given; max entries bounds the on-disk size
+# (entries * dim * 4 bytes for the vectors file).
+CACHE_DIR = os.environ.get("EMBED_CACHE_DIR", "")
+MAX_ENTRIES = int(os.environ.get("EMBED_CACHE_MAX_ENTRIES", "200000"))
+
+KEY_BYTES = 16
+RECORD_BYTES = KEY_BYTES + 4  # key digest + little-endian uint32 row
+# Rewrite the append-only index once it holds this many records per slot
+COMPACT_FACTOR = 4
+
+def _file_digest(path: str) -> bytes:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.digest()
+
+@lru_cache(maxsize=1)
+def model_fingerprint() -> str:
+    """Hashes the bi-encoder weights, tokenizer vocabulary and tokenizer settings."""
+    tokenizer = get_tokenizer()
+    h = hashlib.sha256()
+    h.update(_file_digest(MODEL_FILE))
+    tokenizer_file = os.path.join(MODEL_DIR, "tokenizer.json")
+    if os.path.exists(tokenizer_file):
+        h.update(_file_digest(tokenizer_file))
+    settings = f"{type(tokenizer).__name__}|{tokenizer.model_max_length}|{getattr(tokenizer, 'do_lower_case', None)}|truncation"
+    h.update(settings.encode())
+    return h.hexdigest()
+
+class EmbeddingCache:
+    """
+    Content-addressed on-disk store of normalized float32 embeddings.
+
+    Layout (one directory per model fingerprint):
+      vectors.f32  memory-mapped (max_entries, dim) float32 matrix
+      keys.bin     memory-mapped key digest per row, used to validate reads
+      used.u64     memory-mapped last-access tick per row, for LRU eviction
+      index.log    append-only (key, row) records, replayed on open
+      lock         flock'd by writers; readers never block on other processes
+
+    Within a process, one lock guards the in-memory index (shared by threads such as the
+    inference server's pipeline workers). Writers clear a row's key before overwriting its vector and set it afterwards,
+    so a concurrent reader that sees the expected key before and after copying the
+    vector knows the copy is not torn.
+    """
+
+    def __init__(self, cache_dir: str, dim: int, fingerprint: str, max_entries: int = MAX_ENTRIES):
+        self.dim = dim
+        self.fingerprint = fingerprint.encode()
+        self.dir = os.path.join(cache_dir, fingerprint[:16])
+        os.makedirs(self.dir, exist_ok=True)
+        self.log_path = os.path.join(self.dir, "index.log")
+        self.lock_path = os.path.join(self.dir, "lock")
+        self.hits = 0
+        self.misses = 0
+        # Guards index/row_keys/log offset; reentrant because put_many refreshes while holding it
+        self._index_lock = threading.RLock()
+
+        with self._locked():
+            self.vectors = self._open_map("vectors.f32", np.float32, (max_entries, dim))
+            self.keys = self._open_map("keys.bin", np.uint8, (max_entries, KEY_BYTES))
+            self.used = self._open_map("used.u64", np.uint64, (max_entries,))
+        self.max_entries = self.vectors.shape[0]
+
+        self.index: Dict[bytes, int] = {}
+        self.row_keys: Dict[int, bytes] = {}
+        self._log_inode = None
+        self._log_offset = 0
+        self._refresh_index()
+
+    def _open_map(self, name: str, dtype, shape: Tuple[int, ...]) -> np.memmap:
+        path = os.path.join(self.dir, name)
+        if not os.path.exists(path):
+            np.memmap(path, dtype=dtype, mode="w+", shape=shape).flush()
+        # An existing store keeps the capacity it was created with
+        existing = np.memmap(path, dtype=dtype, mode="r+")
+        return existing.reshape((-1,) + shape[1:])
+
+    @contextmanager
+    def _locked(self):
+        with open(self.lock_path, "a+") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh_index(self):
+        """Replays index records appended since the last refresh (by any process)."""
+        with self._index_lock:
+            try:
+                stat = os.stat(self.log_path)
+            except FileNotFoundError:
+                return
+            if stat.st_ino != self._log_inode:
+                # First open, or the log was compacted and replaced
+                self.index.clear()
+                self.row_keys.clear()
+                self._log_inode = stat.st_ino
+                self._log_offset = 0
+            if stat.st_size <= self._log_offset:
+                return
+            with open(self.log_path, "rb") as f:
+                f.seek(self._log_offset)
+                data = f.read()
+            usable = len(data) - len(data) % RECORD_BYTES
+            for pos in range(0, usable, RECORD_BYTES):
+                key = data[pos:pos + KEY_BYTES]
+                row = int.from_bytes(data[pos + KEY_BYTES:pos + RECORD_BYTES], "little")
+                old_key = self.row_keys.get(row)
+                if old_key is not None and self.index.get(old_key) == row:
+                    del self.index[old_key]
+                self.index[key] = row
+                self.row_keys[row] = key
+            self._log_offset += usable
+
+    def key_for(self, text: str) -> bytes:
+        return hashlib.sha256(self.fingerprint + b"\0" + text.encode("utf-8")).digest()[:KEY_BYTES]
+
+    def get_many(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (vectors, hit_mask); rows with hit_mask False are zeros."""
+        keys = [self.key_for(text) for text in texts]
+        with self._index_lock:
+            self._refresh_index()
+            rows = [self.index.get(key) for key in keys]
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        hit_mask = np.zeros(len(texts), dtype=bool)
+        tick = time.time_ns()
+        for i, (key, row) in enumerate(zip(keys, rows)):
+            if row is None or self.keys[row].tobytes() != key:
+                continue
+            vector = np.array(self.vectors[row])
+            if self.keys[row].tobytes() != key:
+                continue  # overwritten while copying
+            out[i] = vector
+            hit_mask[i] = True
+            self.used[row] = tick
+        hits = int(hit_mask.sum())
+        with self._index_lock:
+            self.hits += hits
+            self.misses += len(texts) - hits
+        return out, hit_mask
+
+    def put_many(self, texts: List[str], vectors: np.ndarray):
+        """Stores embeddings, evicting least-recently-used rows once the store is full."""
+        if not texts:
+            return
+        with self._index_lock, self._locked():
+            self._refresh_index()
+            new_items = {}
+            for text, vector in zip(texts, vectors):
+                key = self.key_for(text)
+                if key not in self.index:
+                    new_items[key] = vector
+            if not new_items:
+                return
+            new_items = list(new_items.items())[-self.max_entries:]
+
+            occupied = len(self.row_keys)
+            free_rows = list(range(occupied, min(occupied + len(new_items), self.max_entries)))
+            shortfall = len(new_items) - len(free_rows)
+            if shortfall > 0:
+                # Evict the least recently used rows
+                victims = np.argpartition(self.used[:occupied], shortfall - 1)[:shortfall]
+                free_rows.extend(int(r) for r in victims)
+
+            tick = time.time_ns()
+            records = bytearray()
+            for (key, vector), row in zip(new_items, free_rows):
+                self.keys[row] = 0
+                self.vectors[row] = vector
+                self.keys[row] = np.frombuffer(key, dtype=np.uint8)
+                self.used[row] = tick
+                records += key + row.to_bytes(4, "little")
+            self.vectors.flush()
+            self.keys.flush()
+            self.used.flush()
+
+            with open(self.log_path, "ab") as f:
+                f.write(records)
+            self._refresh_index()
+            if self._log_offset > COMPACT_FACTOR * self.max_entries * RECORD_BYTES:
+                self._compact()
+
+    def _compact(self):
+        """Rewrites the index log with one record per live row (caller holds the lock)."""
+        tmp_path = self.log_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for row, key in sorted(self.row_keys.items()):
+                if self.index.get(key) == row:
+                    f.write(key + row.to_bytes(4, "little"))
+        os.replace(tmp_path, self.log_path)
+        self._refresh_index()
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+@lru_cache(maxsize=1)
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Returns the process-wide cache, or None when EMBED_CACHE_DIR is unset."""
+    if not CACHE_DIR:
+        return None
+    dim = get_embedding_dim() or embed_batch(["dimension probe"]).shape[1]
+    return EmbeddingCache(CACHE_DIR, dim, model_fingerprint(), MAX_ENTRIES)
+
+def embed_batch_cached(
+    texts: List[str],
+    cache: Optional[EmbeddingCache] = None,
+    return_stats: bool = False,
+    embed_fn: Optional[Callable[[List[str]], np.ndarray]] = None,
+    **kwargs
+) -> Union[np.ndarray, Tuple[np.ndarray, Dict]]:
+    """
+    embed_batch() that reads from and fills the persistent cache when one is enabled.
+    embed_fn replaces embed_batch for the misses (e.g. a request-coalescing batcher).
+    With return_stats=True, also returns {"enabled", "hits", "misses"} for this call.
+    """
+    if embed_fn is None:
+        embed_fn = lambda batch: embed_batch(batch, **kwargs)
+    if cache is None:
+        cache = get_embedding_cache()
+    if cache is None or not texts:
+        vectors = embed_fn(texts)
+        stats = {"enabled": cache is not None, "hits": 0, "misses": len(texts)}
+        return (vectors, stats) if return_stats else vectors
+
+    vectors, hit_mask = cache.get_many(texts)
+    miss_idx = np.flatnonzero(~hit_mask)
+    if len(miss_idx):
+        miss_texts = [texts[i] for i in miss_idx]
+        fresh = embed_fn(miss_texts)
+        vectors[miss_idx] = fresh
+        cache.put_many(miss_texts, fresh)
+    stats = {"enabled": True, "hits": len(texts) - len(miss_idx), "misses": len(miss_idx)}
+    metrics.incr("embed_cache_hits", stats["hits"])
+    metrics.incr("embed_cache_misses", stats["misses"])
+    return (vectors, stats) if return_stats else vectors
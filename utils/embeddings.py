@@ -1,62 +1,187 @@
 import os
 import numpy as np
-import onnxruntime
-from transformers import AutoTokenizer
 from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from utils import metrics, runtime
+from utils.fast_tokenizer import load_tokenizer
+from utils.startup import timed
 
 # Define model paths
 MODEL_DIR = os.environ.get("MINILM_MODEL_PATH", "./models/all-MiniLM-L6-v2/")
 MODEL_FILE = os.path.join(MODEL_DIR, "model_qint8_avx512_vnni.onnx")
 
+# Batching defaults: rows per ONNX call and a cap on padded tokens (rows * longest row)
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_MAX_TOKENS = 8192
+
 @lru_cache(maxsize=1)
 def get_tokenizer():
-    return AutoTokenizer.from_pretrained(MODEL_DIR, local_files_only=True)
+    return load_tokenizer(MODEL_DIR)
 
 
 @lru_cache(maxsize=1)
 def get_onnx_session():
-    return onnxruntime.InferenceSession(MODEL_FILE, providers=["CPUExecutionProvider"])
+    with timed("load bi-encoder session"):
+        return runtime.get_session("bi_encoder", MODEL_FILE)
+
+def get_embedding_dim() -> int:
+    """Returns the embedding width declared by the ONNX graph (0 if it is dynamic)."""
+    dim = get_onnx_session().get_outputs()[0].shape[-1]
+    return dim if isinstance(dim, int) else 0
 
 def mean_pooling(model_output, attention_mask):
     """Helper function for pooling ONNX model output."""
     token_embeddings = model_output[0]
-    input_mask_expanded = np.expand_dims(attention_mask, axis=-1).astype(float)
+    input_mask_expanded = np.expand_dims(attention_mask, axis=-1).astype(token_embeddings.dtype)
     sum_embeddings = np.sum(token_embeddings * input_mask_expanded, axis=1)
     sum_mask = np.maximum(np.sum(input_mask_expanded, axis=1), 1e-9)
     return sum_embeddings / sum_mask
 
-def embed_text(text: str) -> np.ndarray:
+def length_buckets(lengths: List[int], batch_size: int, max_tokens: int) -> List[List[int]]:
+    """
+    Groups row indices into batches of similar token length.
+    Rows are sorted by length so each batch pads only to its own longest row,
+    and a batch is closed once it would exceed batch_size rows or max_tokens padded tokens.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches = []
+    current = []
+    for i in order:
+        # Sorted ascending, so the row being added is the longest in the batch
+        if current and (len(current) >= batch_size or (len(current) + 1) * lengths[i] > max_tokens):
+            batches.append(current)
+            current = []
+        current.append(i)
+    if current:
+        batches.append(current)
+    return batches
+
+def pad_batch(rows: List[List[int]], pad_id: int = 0) -> np.ndarray:
+    """Right-pads token id lists to the longest row and returns an int64 matrix."""
+    width = max(len(r) for r in rows)
+    padded = np.full((len(rows), width), pad_id, dtype=np.int64)
+    for i, r in enumerate(rows):
+        padded[i, :len(r)] = r
+    return padded
+
+def embed_batch(
+    texts: List[str],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    input_ids: Optional[List[Optional[List[int]]]] = None
+) -> np.ndarray:
+    """
+    Embeds many texts with length-bucketed batched inference.
+    Returns a contiguous (len(texts), dim) float32 matrix of normalized embeddings,
+    with rows in the same order as the input.
+    input_ids may supply precomputed token ids per text (e.g. from the token-aware
+    chunker, special tokens included); only texts with None are tokenized here.
+    """
+    if not texts:
+        return np.zeros((0, get_embedding_dim()), dtype=np.float32)
+
     tokenizer = get_tokenizer()
     session = get_onnx_session()
 
-    encoded = tokenizer(
-        [text],
-        return_tensors="np",
-        padding=True,
-        truncation=True
-    )
-    
-    if "token_type_ids" not in encoded:
-        encoded["token_type_ids"] = np.zeros_like(encoded["input_ids"])
-
-    # --- FIX: Convert all inputs to int64 ---
-    input_feed = {
-        "input_ids": encoded["input_ids"].astype(np.int64),
-        "attention_mask": encoded["attention_mask"].astype(np.int64),
-        "token_type_ids": encoded["token_type_ids"].astype(np.int64)
-    }
-
-    outputs = session.run(None, input_feed)
-    
-    pooled_embedding = mean_pooling(outputs, encoded["attention_mask"])
-    norm = np.linalg.norm(pooled_embedding, axis=1, keepdims=True)
-    normalized_embedding = pooled_embedding / np.maximum(norm, 1e-9)
-    
-    return normalized_embedding[0]
+    input_ids = list(input_ids) if input_ids is not None else [None] * len(texts)
+    todo = [i for i, ids in enumerate(input_ids) if ids is None]
+    if todo:
+        encoded = tokenizer([texts[i] for i in todo], padding=False, truncation=True)
+        for i, ids in zip(todo, encoded["input_ids"]):
+            input_ids[i] = ids
+    metrics.incr("bi_encoder_pretokenized", len(texts) - len(todo))
+    pad_id = tokenizer.pad_token_id or 0
+
+    def run_bucket(batch):
+        ids = pad_batch([input_ids[i] for i in batch], pad_id)
+        attention_mask = pad_batch([[1] * len(input_ids[i]) for i in batch])
+
+        input_feed = {
+            "input_ids": ids,
+            "attention_mask": attention_mask,
+            "token_type_ids": np.zeros_like(ids)  # single-sequence inputs
+        }
+        outputs = session.run(None, input_feed)
+        metrics.incr("bi_encoder_calls")
+        metrics.incr("bi_encoder_tokens", int(attention_mask.sum()))
+        metrics.incr("bi_encoder_padded_tokens", ids.size)
+        metrics.observe("bi_encoder_batch_size", len(batch))
+
+        pooled = mean_pooling(outputs, attention_mask)
+        norm = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled / np.maximum(norm, 1e-9)
+
+    # Buckets run concurrently when the session pool has more than one replica
+    buckets = length_buckets([len(ids) for ids in input_ids], batch_size, max_tokens)
+    result = None
+    for batch, normalized in zip(buckets, session.map(run_bucket, buckets)):
+        if result is None:
+            result = np.empty((len(texts), normalized.shape[1]), dtype=np.float32)
+        result[batch] = normalized
+    return result
+
+def embed_spans(
+    texts: List[str],
+    spans: List[List[Tuple[int, int]]],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_tokens: int = DEFAULT_MAX_TOKENS
+) -> List[np.ndarray]:
+    """
+    Embeds character spans of each text from a single forward pass over the whole text.
+    Each span is the mean of the token states whose offsets fall inside it, normalized.
+    Returns one (len(spans[i]), dim) float32 matrix per text; spans with no tokens inside
+    the model window (e.g. past truncation) get a zero row, which callers must not score.
+    """
+    tokenizer = get_tokenizer()
+    session = get_onnx_session()
+
+    encoded = tokenizer(list(texts), padding=False, truncation=True, return_offsets_mapping=True)
+    input_ids = encoded["input_ids"]
+    token_type_ids = encoded.get("token_type_ids")
+    pad_id = tokenizer.pad_token_id or 0
+
+    results = [None] * len(texts)
+    for batch in length_buckets([len(ids) for ids in input_ids], batch_size, max_tokens):
+        ids = pad_batch([input_ids[i] for i in batch], pad_id)
+        attention_mask = pad_batch([[1] * len(input_ids[i]) for i in batch])
+        if token_type_ids is not None:
+            type_ids = pad_batch([token_type_ids[i] for i in batch])
+        else:
+            type_ids = np.zeros_like(ids)
+
+        input_feed = {
+            "input_ids": ids,
+            "attention_mask": attention_mask,
+            "token_type_ids": type_ids
+        }
+        token_states = session.run(None, input_feed)[0]
+        metrics.incr("bi_encoder_calls")
+        metrics.incr("bi_encoder_tokens", int(attention_mask.sum()))
+        metrics.incr("bi_encoder_padded_tokens", ids.size)
+        metrics.observe("bi_encoder_batch_size", len(batch))
+
+        for row, i in enumerate(batch):
+            offsets = np.asarray(encoded["offset_mapping"][i], dtype=np.int64).reshape(-1, 2)
+            starts, ends = offsets[:, 0], offsets[:, 1]
+            real_tokens = ends > starts  # special tokens map to (0, 0)
+            states = token_states[row, :len(offsets)]
+
+            pooled = np.zeros((len(spans[i]), token_states.shape[-1]), dtype=np.float32)
+            for j, (span_start, span_end) in enumerate(spans[i]):
+                selected = real_tokens & (starts >= span_start) & (ends <= span_end)
+                if selected.any():
+                    vector = states[selected].mean(axis=0)
+                    pooled[j] = vector / max(np.linalg.norm(vector), 1e-9)
+            results[i] = pooled
+    return results
+
+def embed_text(text: str) -> np.ndarray:
+    return embed_batch([text])[0]
 
 if __name__ == "__main__":
     import sys
     text = sys.argv[1] if len(sys.argv) > 1 else "Test embedding with ONNX"
     embedding = embed_text(text)
     print(embedding)
-    print("Shape:", embedding.shape)
\ No newline at end of file
+    print("Shape:", embedding.shape)
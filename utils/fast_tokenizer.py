@@ -0,0 +1,94 @@
+# utils/fast_tokenizer.py
+import os
+import json
+from typing import Dict, List, Optional
+
+from utils.startup import timed, timed_import
+
+# Position embeddings of the bundled MiniLM models stop at 512
+MAX_MODEL_LENGTH = 512
+
+class FastTokenizer:
+    """
+    Minimal stand-in for the transformers tokenizer calls made in this repo, backed
+    directly by the `tokenizers` library and the model directory's tokenizer.json.
+    Avoids importing transformers; produces unpadded id lists (callers pad per batch).
+    truncation=False is allowed for splitting text into model-sized pieces.
+    """
+
+    def __init__(self, model_dir: str):
+        tokenizers = timed_import("tokenizers")
+        self.tokenizer_file = os.path.join(model_dir, "tokenizer.json")
+        self.tokenizer = tokenizers.Tokenizer.from_file(self.tokenizer_file)
+        self._untruncated = None
+
+        config = {}
+        config_path = os.path.join(model_dir, "tokenizer_config.json")
+        if os.path.exists(config_path):
+            with open(config_path, "r", encoding="utf-8") as f:
+                config = json.load(f)
+        self.model_max_length = min(int(config.get("model_max_length") or MAX_MODEL_LENGTH), MAX_MODEL_LENGTH)
+        self.do_lower_case = config.get("do_lower_case")
+        self.pad_token_id = self.tokenizer.token_to_id(config.get("pad_token", "[PAD]")) or 0
+
+        # tokenizer.json may carry its own padding/truncation presets; match transformers instead
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(self.model_max_length)
+
+        # Special tokens wrapped around a single sequence, e.g. [CLS] ... [SEP]
+        probe = self.tokenizer.encode("a")
+        content = [i for i, special in enumerate(probe.special_tokens_mask) if not special]
+        self.special_prefix = probe.ids[:content[0]] if content else []
+        self.special_suffix = probe.ids[content[-1] + 1:] if content else []
+
+    def untruncated(self):
+        """Separate unpadded, untruncated tokenizer (the main one is shared across threads)."""
+        if self._untruncated is None:
+            tokenizers = timed_import("tokenizers")
+            tokenizer = tokenizers.Tokenizer.from_file(self.tokenizer_file)
+            tokenizer.no_padding()
+            tokenizer.no_truncation()
+            self._untruncated = tokenizer
+        return self._untruncated
+
+    def build_inputs_with_special_tokens(self, token_ids: List[int]) -> List[int]:
+        return self.special_prefix + list(token_ids) + self.special_suffix
+
+    def __call__(
+        self,
+        text: List[str],
+        text_pair: Optional[List[str]] = None,
+        padding: bool = False,
+        truncation: bool = True,
+        max_length: Optional[int] = None,
+        return_offsets_mapping: bool = False,
+        add_special_tokens: bool = True
+    ) -> Dict[str, List]:
+        if padding:
+            raise ValueError("FastTokenizer only produces unpadded encodings.")
+        if truncation and max_length is not None and max_length != self.model_max_length:
+            raise ValueError(f"FastTokenizer truncates at {self.model_max_length} tokens, not {max_length}.")
+
+        inputs = list(zip(text, text_pair)) if text_pair is not None else list(text)
+        tokenizer = self.tokenizer if truncation else self.untruncated()
+        encodings = tokenizer.encode_batch(inputs, add_special_tokens=add_special_tokens)
+        encoded = {
+            "input_ids": [e.ids for e in encodings],
+            "token_type_ids": [e.type_ids for e in encodings],
+            "attention_mask": [e.attention_mask for e in encodings]
+        }
+        if return_offsets_mapping:
+            encoded["offset_mapping"] = [e.offsets for e in encodings]
+        return encoded
+
+def load_tokenizer(model_dir: str):
+    """Uses the lightweight tokenizer.json path when possible, else falls back to transformers."""
+    label = f"load tokenizer ({os.path.basename(os.path.normpath(model_dir))})"
+    with timed(label):
+        if os.path.exists(os.path.join(model_dir, "tokenizer.json")):
+            try:
+                return FastTokenizer(model_dir)
+            except ImportError:
+                pass
+        transformers = timed_import("transformers")
+        return transformers.AutoTokenizer.from_pretrained(model_dir, local_files_only=True)
@@ -0,0 +1,172 @@
+# utils/metrics.py
+"""
+Lightweight per-stage instrumentation.
+
+Enable with PIPELINE_METRICS=1 (or metrics.enable()). While a run is active, stage()
+timers, incr() counters and observe() distributions accumulate into one record that
+finish_run() writes as JSON and hands to every registered hook. With metrics disabled
+there is no active run and every call returns immediately.
+
+The active run is process-wide: concurrent pipeline runs in one process (server mode)
+share a single record.
+"""
+import os
+import json
+import time
+import threading
+from contextlib import nullcontext
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+_lock = threading.Lock()
+_enabled = os.environ.get("PIPELINE_METRICS", "0") not in ("", "0")
+_profile_onnx = os.environ.get("ONNX_PROFILE", "0") not in ("", "0")
+PROFILE_DIR = os.environ.get("ONNX_PROFILE_DIR", ".")
+_hooks: List[Callable[[Dict], None]] = []
+_sessions: Dict[str, object] = {}
+_run: Optional["MetricsRun"] = None
+
+_NULL_TIMER = nullcontext()
+
+class MetricsRun:
+    def __init__(self, labels: Dict):
+        self.labels = labels
+        self.started = time.time()
+        self.timers: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self.distributions: Dict[str, List[float]] = {}  # name -> [count, sum, min, max]
+
+    def to_record(self) -> Dict:
+        return {
+            "started": datetime.fromtimestamp(self.started).isoformat(),
+            "wall_seconds": round(time.time() - self.started, 6),
+            "labels": self.labels,
+            "stages_seconds": {k: round(v, 6) for k, v in self.timers.items()},
+            "counters": dict(self.counters),
+            "distributions": {
+                name: {"count": int(c), "sum": s, "min": lo, "max": hi, "mean": round(s / c, 4) if c else 0.0}
+                for name, (c, s, lo, hi) in self.distributions.items()
+            }
+        }
+
+class _StageTimer:
+    __slots__ = ("run", "name", "start")
+
+    def __init__(self, run: MetricsRun, name: str):
+        self.run = run
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        with _lock:
+            self.run.timers[self.name] = self.run.timers.get(self.name, 0.0) + elapsed
+
+def enable(on: bool = True, profile_onnx: Optional[bool] = None):
+    """Turns collection on/off; profile_onnx must be set before the ONNX sessions are created."""
+    global _enabled, _profile_onnx
+    _enabled = on
+    if profile_onnx is not None:
+        _profile_onnx = profile_onnx
+
+def is_enabled() -> bool:
+    return _enabled
+
+def start_run(**labels) -> Optional[MetricsRun]:
+    """
+    Starts collecting a new record. Returns None when metrics are disabled or a run is
+    already active (the caller then contributes to that run and must not finish it).
+    """
+    global _run
+    with _lock:
+        if not _enabled or _run is not None:
+            return None
+        _run = MetricsRun(labels)
+        return _run
+
+def stage(name: str):
+    """Context manager adding the block's wall time to stage `name`."""
+    run = _run
+    return _NULL_TIMER if run is None else _StageTimer(run, name)
+
+def incr(name: str, value: int = 1):
+    run = _run
+    if run is None:
+        return
+    with _lock:
+        run.counters[name] = run.counters.get(name, 0) + value
+
+def observe(name: str, value: float):
+    """Adds one sample (e.g. a batch size) to a count/sum/min/max distribution."""
+    run = _run
+    if run is None:
+        return
+    with _lock:
+        d = run.distributions.get(name)
+        if d is None:
+            run.distributions[name] = [1, value, value, value]
+        else:
+            d[0] += 1
+            d[1] += value
+            d[2] = min(d[2], value)
+            d[3] = max(d[3], value)
+
+# --- ONNX Runtime profiling ---
+def session_options(name: str, options=None):
+    """Enables ORT profiling on (new or given) SessionOptions when ONNX_PROFILE is set."""
+    if options is None:
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+    if _profile_onnx:
+        options.enable_profiling = True
+        options.profile_file_prefix = os.path.join(PROFILE_DIR, f"onnx_profile_{name}")
+    return options
+
+def register_session(name: str, session):
+    if _profile_onnx:
+        _sessions[name] = session
+
+# --- Emission ---
+def add_hook(hook: Callable[[Dict], None]):
+    """Registers hook(record), called after every finished run (e.g. to ship metrics to a collector)."""
+    _hooks.append(hook)
+
+def remove_hook(hook: Callable[[Dict], None]):
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+def metrics_path_for(output_file: str) -> str:
+    """challenge1b_output.json -> challenge1b_output.metrics.json"""
+    path = Path(output_file)
+    return str(path.with_name(f"{path.stem}.metrics.json"))
+
+def finish_run(metrics_file: Optional[str] = None, **extra) -> Optional[Dict]:
+    """Closes the active run, writes it to metrics_file (if given), runs hooks and returns the record."""
+    global _run
+    with _lock:
+        run, _run = _run, None
+    if run is None:
+        return None
+
+    record = run.to_record()
+    record.update(extra)
+    if _sessions:
+        # end_profiling() flushes the trace and stops profiling for that session
+        record["onnx_profiles"] = {name: session.end_profiling() for name, session in _sessions.items()}
+        _sessions.clear()
+
+    if metrics_file:
+        Path(metrics_file).parent.mkdir(parents=True, exist_ok=True)
+        with open(metrics_file, "w", encoding="utf-8") as f:
+            json.dump(record, f, indent=2)
+
+    for hook in list(_hooks):
+        try:
+            hook(record)
+        except Exception as e:
+            print(f"⚠️ Metrics hook {getattr(hook, '__name__', hook)} failed: {e}")
+    return record
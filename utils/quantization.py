@@ -0,0 +1,170 @@
+# utils/quantization.py
+import os
+import tempfile
+import numpy as np
+from typing import Dict, Optional
+
+from utils.similarity import top_k_indices
+
+# --- QUANTIZED EMBEDDING STORAGE ---
+# EMBED_STORAGE=float16|int8 keeps a compact copy of an index's vectors in memory and scans
+# that; the top top_k * RESCORE_FACTOR candidates are then rescored against the float32
+# vectors (memory-mapped, so only the candidate rows are read). Indexes built in memory
+# spill their float32 vectors to an unlinked temp file for the same effect.
+EMBED_STORAGE = os.environ.get("EMBED_STORAGE", "float32")
+RESCORE_FACTOR = int(os.environ.get("RESCORE_FACTOR", "4"))
+STORAGE_MODES = ("float32", "float16", "int8")
+BLOCK_ROWS = 65536  # rows dequantized at a time while scanning
+
+class QuantizedMatrix:
+    """
+    float16 or scalar-int8 copy of an (n, dim) embedding matrix.
+
+    int8 rows are stored as round(x / scale) with a per-vector float32 scale of
+    max|x| / 127, so each row keeps its full dynamic range.
+    """
+
+    def __init__(self, mode: str, data: np.ndarray, scales: Optional[np.ndarray] = None):
+        self.mode = mode
+        self.data = data
+        self.scales = scales
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    @classmethod
+    def quantize(cls, vectors: np.ndarray, mode: str) -> "QuantizedMatrix":
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if mode == "float16":
+            return cls(mode, vectors.astype(np.float16))
+        if mode == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0 if len(vectors) else np.zeros(0, dtype=np.float32)
+            scales = np.maximum(scales, 1e-12).astype(np.float32)
+            data = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+            return cls(mode, data, scales)
+        raise ValueError(f"Unknown embedding storage mode {mode!r} (expected one of {STORAGE_MODES}).")
+
+    def dequantize(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        data = self.data if rows is None else self.data[rows]
+        block = data.astype(np.float32)
+        if self.scales is not None:
+            block *= (self.scales if rows is None else self.scales[rows])[:, None]
+        return block
+
+    def scores(self, queries: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """(len(queries), len(rows)) approximate dot products, dequantizing BLOCK_ROWS rows at a time."""
+        n = len(self) if rows is None else len(rows)
+        out = np.empty((len(queries), n), dtype=np.float32)
+        for start in range(0, n, BLOCK_ROWS):
+            stop = min(start + BLOCK_ROWS, n)
+            block = self.dequantize(np.arange(start, stop) if rows is None else rows[start:stop])
+            out[:, start:stop] = queries @ block.T
+        return out
+
+    # --- Persistence (next to the float32 vectors.npy) ---
+    def save(self, directory: str):
+        np.save(os.path.join(directory, f"vectors.{self.mode}.npy"), self.data)
+        if self.scales is not None:
+            np.save(os.path.join(directory, "vectors.scales.npy"), self.scales)
+
+    @classmethod
+    def load(cls, directory: str, mode: str) -> Optional["QuantizedMatrix"]:
+        path = os.path.join(directory, f"vectors.{mode}.npy")
+        if not os.path.exists(path):
+            return None
+        scales_path = os.path.join(directory, "vectors.scales.npy")
+        scales = np.load(scales_path) if mode == "int8" else None
+        return cls(mode, np.load(path), scales)
+
+def spill_to_disk(vectors: np.ndarray) -> np.ndarray:
+    """
+    A read-only memory map of vectors backed by an unlinked temp file, so the float32 rows
+    are paged in on demand (and can be dropped again) instead of staying resident.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if not vectors.size:
+        return vectors
+    with tempfile.TemporaryFile() as f:
+        vectors.tofile(f)
+        f.flush()
+        # The mapping keeps its own reference to the file, which outlives the handle
+        return np.memmap(f, dtype=np.float32, mode="r", shape=vectors.shape)
+
+def rescored_top_k(
+    vectors: np.ndarray,
+    quantized: QuantizedMatrix,
+    queries: np.ndarray,
+    top_k: int,
+    rows: Optional[np.ndarray] = None,
+    rescore_factor: int = RESCORE_FACTOR
+):
+    """
+    Per query (rows best first, float32 scores): approximate scan of the quantized matrix,
+    then exact rescoring of the best top_k * rescore_factor candidates. Candidates are
+    rescored in row order, so ties keep the lower row first as in an exact scan.
+    """
+    base = np.arange(len(quantized)) if rows is None else np.asarray(rows)
+    approx = quantized.scores(queries, rows)
+    results = []
+    for query, row_scores in zip(queries, approx):
+        candidates = np.sort(base[top_k_indices(row_scores, top_k * max(rescore_factor, 1))])
+        exact = np.asarray(vectors[candidates], dtype=np.float32) @ query
+        picked = top_k_indices(exact, top_k)
+        results.append((candidates[picked], exact[picked]))
+    return results
+
+def storage_report(
+    vectors: np.ndarray,
+    quantized: QuantizedMatrix,
+    queries: Optional[np.ndarray] = None,
+    top_k: int = 10,
+    sample: int = 100,
+    rescore_factor: int = RESCORE_FACTOR
+) -> Dict:
+    """
+    Resident memory of the vectors with and without the quantized copy, and recall@k of
+    quantized search (with and without rescoring) against exact float32 search. float32
+    vectors held in memory rather than memory-mapped count against the savings. Without
+    queries, a fixed sample of the indexed vectors stands in for them.
+    """
+    float32_resident = not isinstance(vectors, np.memmap)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    resident = quantized.nbytes + (vectors.nbytes if float32_resident else 0)
+    if queries is None:
+        rng = np.random.default_rng(0)
+        picked = rng.choice(len(vectors), size=min(sample, len(vectors)), replace=False) if len(vectors) else []
+        queries = vectors[np.sort(picked)]
+    report = {
+        "storage": quantized.mode,
+        "float32_bytes": int(vectors.nbytes),
+        "quantized_bytes": int(quantized.nbytes),
+        "float32_resident": float32_resident,
+        "resident_bytes": int(resident),
+        "saved_bytes": int(vectors.nbytes - resident),
+        "saved_ratio": round(1 - resident / vectors.nbytes, 4) if vectors.nbytes else 0.0,
+        "top_k": top_k,
+        "queries": len(queries)
+    }
+    if not len(queries) or not len(vectors):
+        return dict(report, recall_at_k=1.0, recall_at_k_no_rescore=1.0)
+
+    exact = [set(top_k_indices(s, top_k).tolist()) for s in queries @ vectors.T]
+    approx = [set(top_k_indices(s, top_k).tolist()) for s in quantized.scores(queries)]
+    rescored = [set(rows.tolist()) for rows, _ in rescored_top_k(vectors, quantized, queries, top_k, rescore_factor=rescore_factor)]
+    hits = lambda found: sum(len(e & f) for e, f in zip(exact, found)) / sum(len(e) for e in exact)
+    report["recall_at_k"] = round(hits(rescored), 4)
+    report["recall_at_k_no_rescore"] = round(hits(approx), 4)
+    return report
+
+def print_storage_report(report: Dict):
+    mb = 1024 * 1024
+    resident = report["resident_bytes"]
+    change = f"{report['saved_ratio']:.0%} saved" if resident <= report["float32_bytes"] else "float32 copy still in memory"
+    print(f"🗜️ Embedding storage {report['storage']}: {report['float32_bytes'] / mb:.2f} MB -> "
+          f"{resident / mb:.2f} MB resident ({change}), "
+          f"recall@{report['top_k']} {report['recall_at_k']:.3f} "
+          f"({report['recall_at_k_no_rescore']:.3f} before rescoring).")
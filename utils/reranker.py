@@ -1,65 +1,219 @@
 # utils/reranker.py
 import os
-import onnxruntime as ort
-from transformers import AutoTokenizer
 import numpy as np
 from functools import lru_cache
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional, Sequence, Tuple, Union
+
+from utils import metrics, runtime
+from utils.embeddings import length_buckets, pad_batch
+from utils.fast_tokenizer import load_tokenizer
+from utils.startup import timed
 
 # --- CROSS-ENCODER MODEL (Accurate Reranking) ---
 MODEL_DIR = os.environ.get("CROSS_ENCODER_MODEL_PATH", "./models/cross-encoder-ms-marco-MiniLM-L-6-v2/")
 MODEL_FILE = os.path.join(MODEL_DIR, "model_qint8_avx512_vnni.onnx")
 
+# Pairs per ONNX call and a cap on padded tokens per call
+DEFAULT_BATCH_SIZE = 16
+DEFAULT_MAX_TOKENS = 8192
+
+# Adaptive mode: how many standard deviations above the fitted bi-encoder -> cross-encoder
+# trend an unscored candidate would need to reach before it is worth scoring
+ADAPTIVE_Z = 2.0
+
 @lru_cache(maxsize=1)
 def get_cross_encoder_tokenizer():
-    return AutoTokenizer.from_pretrained(MODEL_DIR, local_files_only=True)
+    return load_tokenizer(MODEL_DIR)
 
 @lru_cache(maxsize=1)
 def get_cross_encoder_session():
-    return ort.InferenceSession(MODEL_FILE, providers=["CPUExecutionProvider"])
+    with timed("load cross-encoder session"):
+        return runtime.get_session("cross_encoder", MODEL_FILE)
+
+def cross_encode_pairs(
+    queries: List[str],
+    texts: List[str],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_tokens: int = DEFAULT_MAX_TOKENS
+) -> np.ndarray:
+    """Scores (query, text) pairs in length-bucketed, dynamically padded batches."""
+    if not texts:
+        return np.zeros(0, dtype=np.float32)
 
-def cross_encode_similarity(query: str, text: str) -> float:
-    """Calculates a relevance score for a (query, text) pair using the Cross-Encoder."""
     tokenizer = get_cross_encoder_tokenizer()
     session = get_cross_encoder_session()
 
-    inputs = tokenizer(query, text, return_tensors="np", padding=True, truncation=True, max_length=512)
-    
+    encoded = tokenizer(list(queries), list(texts), padding=False, truncation=True, max_length=512)
+    pad_id = tokenizer.pad_token_id or 0
+
     # ONNX model might not need token_type_ids
-    expected_inputs = {i.name for i in session.get_inputs()}
-    ort_inputs = {k: v.astype(np.int64) for k, v in inputs.items() if k in expected_inputs}
+    expected_inputs = [i.name for i in session.get_inputs()]
+    if "attention_mask" in expected_inputs and "attention_mask" not in encoded:
+        encoded["attention_mask"] = [[1] * len(ids) for ids in encoded["input_ids"]]
 
-    outputs = session.run(None, ort_inputs)
-    return float(outputs[0][0])
+    scores = np.empty(len(texts), dtype=np.float32)
+    lengths = [len(ids) for ids in encoded["input_ids"]]
 
-def rerank_with_cross_encoder(
+    def run_bucket(batch):
+        ort_inputs = {
+            name: pad_batch([encoded[name][i] for i in batch], pad_id if name == "input_ids" else 0)
+            for name in expected_inputs if name in encoded
+        }
+        outputs = session.run(None, ort_inputs)
+        metrics.incr("cross_encoder_calls")
+        metrics.incr("cross_encoder_tokens", sum(lengths[i] for i in batch))
+        metrics.incr("cross_encoder_padded_tokens", ort_inputs["input_ids"].size)
+        metrics.observe("cross_encoder_batch_size", len(batch))
+        return np.asarray(outputs[0]).reshape(len(batch), -1)[:, 0]
+
+    # Buckets run concurrently when the session pool has more than one replica
+    buckets = length_buckets(lengths, batch_size, max_tokens)
+    for batch, batch_scores in zip(buckets, session.map(run_bucket, buckets)):
+        scores[batch] = batch_scores
+    return scores
+
+def cross_encode_batch(
     query: str,
-    section_infos: List[Dict],
-    top_k: int = 5,
-    max_per_doc: int = 2
-) -> List[Dict]:
-    """Reranks a list of sections using the cross-encoder and returns the top_k."""
-    scored_infos = []
-    for info in section_infos:
-        score = cross_encode_similarity(query, info["text"])
-        scored_infos.append({"score": score, "info": info})
-    
-    # Sort by the new cross-encoder score
-    ranked_infos = sorted(scored_infos, key=lambda x: x["score"], reverse=True)
-
-    # Apply diversity and select top_k
-    results = []
+    texts: List[str],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_tokens: int = DEFAULT_MAX_TOKENS
+) -> np.ndarray:
+    """Scores one query against many texts."""
+    return cross_encode_pairs([query] * len(texts), texts, batch_size, max_tokens)
+
+def cross_encode_similarity(query: str, text: str) -> float:
+    """Calculates a relevance score for a (query, text) pair using the Cross-Encoder."""
+    return float(cross_encode_batch(query, [text])[0])
+
+def select_diverse(
+    scores: np.ndarray,
+    documents: Sequence[str],
+    top_k: int,
+    max_per_doc: int
+) -> List[int]:
+    """
+    Picks the best-scoring rows while allowing at most max_per_doc per document.
+    scores[i] is NaN for rows that were not scored; ties keep the lower row first.
+    """
+    scored = np.flatnonzero(~np.isnan(scores))
+    order = scored[np.argsort(-scores[scored], kind="stable")]
+    selected = []
     doc_counts = {}
-    rank = 1
-    for item in ranked_infos:
-        doc = item["info"]["document"]
+    for row in order:
+        doc = documents[row]
         if doc_counts.get(doc, 0) < max_per_doc:
-            info_out = item["info"].copy()
-            info_out["score"] = item["score"]
-            info_out["rank"] = rank
-            results.append(info_out)
+            selected.append(int(row))
             doc_counts[doc] = doc_counts.get(doc, 0) + 1
-            rank += 1
-            if len(results) >= top_k:
+            if len(selected) >= top_k:
                 break
-    return results
\ No newline at end of file
+    return selected
+
+def can_stop_early(
+    similarities: np.ndarray,
+    scores: np.ndarray,
+    remaining: np.ndarray,
+    selected: List[int],
+    top_k: int
+) -> bool:
+    """
+    Decides whether the unscored candidates (rows in remaining) can plausibly enter the selection.
+    Fits cross-encoder score against bi-encoder similarity on the pairs scored so far and
+    stops when the most optimistic remaining candidate (fit + ADAPTIVE_Z residual std devs)
+    still falls below the weakest selected score.
+    """
+    scored = np.flatnonzero(~np.isnan(scores))
+    if len(selected) < top_k or len(scored) < 3:
+        return False
+
+    sims = similarities[scored].astype(np.float64)
+    fitted_scores = scores[scored].astype(np.float64)
+    if np.ptp(sims) < 1e-9:
+        return False
+    slope, intercept = np.polyfit(sims, fitted_scores, 1)
+    sigma = np.std(fitted_scores - (slope * sims + intercept))
+
+    remaining_sims = similarities[remaining]
+    best_case = max(slope * remaining_sims.max(), slope * remaining_sims.min()) + intercept + ADAPTIVE_Z * sigma
+    return best_case < scores[selected].min()
+
+def rerank_rows(
+    query: str,
+    texts: Sequence[str],
+    documents: Sequence[str],
+    similarities: Optional[np.ndarray] = None,
+    top_k: int = 5,
+    max_per_doc: int = 2,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    adaptive: bool = False,
+    score_fn: Optional[Callable[[str, List[str]], np.ndarray]] = None
+) -> Tuple[List[int], np.ndarray]:
+    """
+    Row-index core of the reranker: returns (selected rows best first, scores) where
+    scores[i] is the cross-encoder score of row i, or NaN if adaptive mode skipped it.
+    Adaptive mode needs the bi-encoder similarities to order and extrapolate.
+    """
+    if score_fn is None:
+        score_fn = lambda q, batch: cross_encode_batch(q, batch, batch_size=batch_size)
+    scores = np.full(len(texts), np.nan, dtype=np.float64)
+
+    if adaptive and similarities is not None:
+        similarities = np.asarray(similarities, dtype=np.float64)
+        ordered = np.argsort(-similarities, kind="stable")
+        for start in range(0, len(ordered), batch_size):
+            batch = ordered[start:start + batch_size]
+            scores[batch] = score_fn(query, [texts[i] for i in batch])
+
+            remaining = ordered[start + batch_size:]
+            if not len(remaining):
+                break
+            selected = select_diverse(scores, documents, top_k, max_per_doc)
+            if can_stop_early(similarities, scores, remaining, selected, top_k):
+                break
+    elif len(texts):
+        scores[:] = score_fn(query, list(texts))
+
+    return select_diverse(scores, documents, top_k, max_per_doc), scores
+
+def rerank_with_cross_encoder(
+    query: str,
+    section_infos: List[Dict],
+    top_k: int = 5,
+    max_per_doc: int = 2,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    adaptive: bool = False,
+    return_stats: bool = False,
+    score_fn: Optional[Callable[[str, List[str]], np.ndarray]] = None
+) -> Union[List[Dict], Tuple[List[Dict], Dict]]:
+    """
+    Reranks a list of sections using the cross-encoder and returns the top_k.
+
+    With adaptive=True, candidates are scored batch by batch in bi-encoder order (the
+    "similarity" key set by rank_sections_by_similarity) and scoring stops once the
+    top_k/max_per_doc quotas are filled and the rest cannot plausibly beat them.
+    With return_stats=True, also returns {"candidates", "pairs_scored"}.
+    score_fn(query, texts) replaces cross_encode_batch (e.g. a request-coalescing batcher).
+    """
+    similarities = None
+    if section_infos and all("similarity" in info for info in section_infos):
+        similarities = np.array([info["similarity"] for info in section_infos], dtype=np.float64)
+    selected, scores = rerank_rows(
+        query,
+        [info["text"] for info in section_infos],
+        [info["document"] for info in section_infos],
+        similarities,
+        top_k=top_k,
+        max_per_doc=max_per_doc,
+        batch_size=batch_size,
+        adaptive=adaptive,
+        score_fn=score_fn
+    )
+
+    # Only the selected rows are copied into result dicts
+    results = [
+        dict(section_infos[row], score=float(scores[row]), rank=rank)
+        for rank, row in enumerate(selected, start=1)
+    ]
+
+    if return_stats:
+        return results, {"candidates": len(section_infos), "pairs_scored": int(np.count_nonzero(~np.isnan(scores)))}
+    return results
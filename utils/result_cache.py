@@ -0,0 +1,162 @@
+# utils/result_cache.py
+import os
+import re
+import json
+import time
+import hashlib
+import tempfile
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils import metrics
+
+# --- QUERY RESULT CACHE ---
+# Disabled unless a directory is given. Entries are keyed by the normalized persona/task
+# query, the input PDFs' content hashes and every pipeline setting that changes the
+# candidates; each holds the candidate list, cross-encoder scores, per-chunk sentences
+# and the final sections per (top_k, max_per_doc). RESULT_CACHE_BYPASS=1 skips lookups
+# (fresh results still overwrite the entry).
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", "")
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "512"))
+RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", "86400"))  # seconds; 0 = never expire
+RESULT_CACHE_BYPASS = os.environ.get("RESULT_CACHE_BYPASS", "0") not in ("", "0")
+ENTRY_VERSION = 1
+
+WHITESPACE = re.compile(r"\s+")
+
+def normalize_query(text: str) -> str:
+    """Case- and whitespace-insensitive form of a persona/task query (both encoders are uncased)."""
+    return WHITESPACE.sub(" ", text).strip().casefold()
+
+def model_stamp(path: str) -> str:
+    """Cheap model identity (path, size, mtime) so swapping model files invalidates entries."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return f"{path}|missing"
+    return f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+def result_slot(top_k: int, max_per_doc: int) -> str:
+    return f"{top_k}/{max_per_doc}"
+
+class ResultCache:
+    """
+    One JSON file per entry; reads touch the file so eviction drops the least recently
+    used entries beyond max_entries. Writes go through a temp file unique to the writer and
+    an atomic rename, so concurrent threads and processes only ever see complete entries.
+    """
+
+    def __init__(self, cache_dir: str, max_entries: int = RESULT_CACHE_MAX_ENTRIES, ttl: float = RESULT_CACHE_TTL):
+        self.dir = cache_dir
+        self.max_entries = max_entries
+        self.ttl = ttl
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, persona: str, task: str, documents: List[Tuple[str, str]], **options) -> str:
+        """Entry key for a persona/task over (document name, content digest) pairs and pipeline options."""
+        query = f"{normalize_query(persona)}: {normalize_query(task)}"
+        payload = json.dumps(
+            {"version": ENTRY_VERSION, "query": query, "documents": documents, "options": options},
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict]:
+        path = self.path_for(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            metrics.incr("result_cache_misses")
+            return None
+        if self.ttl > 0 and time.time() - entry.get("created", 0) > self.ttl:
+            self._remove(path)
+            metrics.incr("result_cache_misses")
+            return None
+        try:
+            os.utime(path)  # LRU: mark as recently used
+        except OSError:
+            pass
+        metrics.incr("result_cache_hits")
+        return entry
+
+    def put(self, key: str, entry: Dict):
+        path = self.path_for(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.dir, prefix=f"{key}.", suffix=".tmp")
+        try:
+            with open(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Drops expired entries, then the least recently used ones beyond max_entries."""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.dir, name)
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+            entries.append((mtime, path))
+        entries.sort(reverse=True)
+        for i, (mtime, path) in enumerate(entries):
+            # mtime tracks the last use, so it only bounds the creation-time TTL from below
+            if i >= self.max_entries or (self.ttl > 0 and now - mtime > self.ttl):
+                self._remove(path)
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.dir):
+            if name.endswith(".json"):
+                self._remove(os.path.join(self.dir, name))
+
+def new_entry(query_embedding: np.ndarray, candidates: List[Dict]) -> Dict:
+    return {
+        "created": time.time(),
+        "query_embedding": np.asarray(query_embedding, dtype=np.float32).tolist(),
+        "candidates": candidates,
+        "scores": {},     # candidate text -> cross-encoder score
+        "sentences": {},  # chunk id -> most relevant sentences
+        "results": {}     # result_slot(top_k, max_per_doc) -> {extracted_sections, subsection_analysis}
+    }
+
+def cached_scorer(
+    entry: Dict,
+    score_fn: Callable[[str, List[str]], np.ndarray]
+) -> Callable[[str, List[str]], np.ndarray]:
+    """Wraps score_fn so texts already scored for this entry are not sent to the cross-encoder again."""
+    scores = entry["scores"]
+
+    def score(query: str, texts: List[str]) -> np.ndarray:
+        # Unscored texts go out exactly as given: the quantized encoder's scores depend on batch composition
+        missing = [t for t in texts if t not in scores]
+        if missing:
+            for text, value in zip(missing, score_fn(query, missing)):
+                scores[text] = float(value)
+        return np.array([scores[t] for t in texts], dtype=np.float32)
+    return score
+
+@lru_cache(maxsize=1)
+def get_result_cache() -> Optional[ResultCache]:
+    """Returns the process-wide cache, or None when RESULT_CACHE_DIR is unset."""
+    if not RESULT_CACHE_DIR:
+        return None
+    return ResultCache(RESULT_CACHE_DIR)
@@ -0,0 +1,184 @@
+# utils/runtime.py
+"""
+Shared ONNX Runtime configuration: every model session in the process is created here.
+
+Thread counts, graph optimization level and memory-arena options come from the
+environment (ORT_* below). Intra-op threads default to the cores the parse workers leave
+free (see CORE BUDGET). Each model file is loaded once per process (the summarizer and the
+bi-encoder share one session) as a pool of ORT_REPLICAS session replicas, and batched
+callers spread their buckets across the replicas with SessionPool.map(). With
+ORT_OPTIMIZED_DIR set, the graph ONNX Runtime optimized on first load is saved there and
+later startups load it with optimization off.
+"""
+import os
+import queue
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List
+
+from utils import metrics
+from utils.startup import timed_import
+
+# --- CORE BUDGET ---
+# CPU_CORES is shared by PDF parsing and inference. Parsing takes PARSE_WORKERS (default:
+# all of them, since the batch path parses before it embeds); inference gets the cores
+# left over, or all of them when parsing claims the whole machine. Set PARSE_WORKERS below
+# CPU_CORES for runs that parse and embed at once (streaming, the server).
+CPU_CORES = int(os.environ.get("CPU_CORES", "0")) or (os.cpu_count() or 1)
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", "0")) or CPU_CORES
+
+ORT_INTRA_OP_THREADS = os.environ.get("ORT_INTRA_OP_THREADS", "auto")  # "auto" = inference cores / replicas, 0 = ORT default
+ORT_INTER_OP_THREADS = int(os.environ.get("ORT_INTER_OP_THREADS", "0"))
+ORT_GRAPH_OPT = os.environ.get("ORT_GRAPH_OPT", "all")  # disable | basic | extended | all
+ORT_ARENA = os.environ.get("ORT_ARENA", "1") not in ("", "0")
+ORT_MEM_PATTERN = os.environ.get("ORT_MEM_PATTERN", "1") not in ("", "0")
+ORT_REPLICAS = max(1, int(os.environ.get("ORT_REPLICAS", "1")))
+ORT_OPTIMIZED_DIR = os.environ.get("ORT_OPTIMIZED_DIR", "")
+
+GRAPH_OPT_LEVELS = {
+    "disable": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL"
+}
+
+_lock = threading.Lock()
+_pools: Dict[str, "SessionPool"] = {}
+
+def runtime_config() -> Dict:
+    return {
+        "cpu_cores": CPU_CORES,
+        "parse_workers": PARSE_WORKERS,
+        "inference_cores": inference_cores(),
+        "intra_op_threads": ORT_INTRA_OP_THREADS,
+        "inter_op_threads": ORT_INTER_OP_THREADS,
+        "graph_optimization": ORT_GRAPH_OPT,
+        "cpu_mem_arena": ORT_ARENA,
+        "mem_pattern": ORT_MEM_PATTERN,
+        "replicas": ORT_REPLICAS,
+        "optimized_dir": ORT_OPTIMIZED_DIR or None
+    }
+
+def inference_cores() -> int:
+    """Cores left for ONNX Runtime once the parse workers have their share."""
+    return CPU_CORES - PARSE_WORKERS if PARSE_WORKERS < CPU_CORES else CPU_CORES
+
+def intra_op_threads(replicas: int = ORT_REPLICAS) -> int:
+    if ORT_INTRA_OP_THREADS == "auto":
+        return max(1, inference_cores() // replicas)
+    return int(ORT_INTRA_OP_THREADS or 0)
+
+def make_session_options(name: str, graph_opt: str = ORT_GRAPH_OPT, replicas: int = ORT_REPLICAS):
+    """SessionOptions from the runtime config, with metrics profiling applied on top."""
+    ort = timed_import("onnxruntime")
+    if graph_opt not in GRAPH_OPT_LEVELS:
+        raise ValueError(f"Unknown ORT_GRAPH_OPT {graph_opt!r} (expected one of {list(GRAPH_OPT_LEVELS)}).")
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads(replicas)
+    options.inter_op_num_threads = ORT_INTER_OP_THREADS
+    options.graph_optimization_level = getattr(ort.GraphOptimizationLevel, GRAPH_OPT_LEVELS[graph_opt])
+    options.enable_cpu_mem_arena = ORT_ARENA
+    options.enable_mem_pattern = ORT_MEM_PATTERN
+    return metrics.session_options(name, options)
+
+def optimized_model_path(model_file: str, graph_opt: str = ORT_GRAPH_OPT, cache_dir: str = ORT_OPTIMIZED_DIR) -> str:
+    """
+    Cache file for the optimized graph, keyed by the source model (path, size, mtime), the
+    optimization level and the ONNX Runtime version, so any of those changing re-optimizes.
+    """
+    ort = timed_import("onnxruntime")
+    stat = os.stat(model_file)
+    key = f"{os.path.abspath(model_file)}|{stat.st_size}|{stat.st_mtime_ns}|{graph_opt}|{ort.__version__}"
+    stem = os.path.splitext(os.path.basename(model_file))[0]
+    return os.path.join(cache_dir, f"{stem}.{graph_opt}.{hashlib.sha1(key.encode()).hexdigest()[:12]}.onnx")
+
+class SessionPool:
+    """
+    ORT_REPLICAS InferenceSession replicas of one model behind a queue of idle replicas.
+
+    run() takes the next idle replica (waiting if all are busy), so concurrent callers
+    spread across replicas while each replica runs one request at a time. map() lets one
+    caller fan its batches out over the replicas. Exposes the InferenceSession methods the
+    pipeline uses, so it is a drop-in replacement.
+    """
+
+    def __init__(self, name: str, sessions: List, source: str):
+        self.name = name
+        self.sessions = sessions
+        self.source = source  # "model", "optimized" (written this run) or "cached" (loaded from disk)
+        self.idle: "queue.Queue" = queue.Queue()
+        for session in sessions:
+            self.idle.put(session)
+        self._executor = ThreadPoolExecutor(max_workers=len(sessions), thread_name_prefix=f"{name}-replica")
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def map(self, fn: Callable, items: Iterable) -> List:
+        """[fn(item) for item in items], run concurrently across the replicas when there are several."""
+        items = list(items)
+        if len(self.sessions) < 2 or len(items) < 2:
+            return [fn(item) for item in items]
+        return list(self._executor.map(fn, items))
+
+    def run(self, output_names, input_feed, run_options=None):
+        session = self.idle.get()
+        try:
+            return session.run(output_names, input_feed, run_options)
+        finally:
+            self.idle.put(session)
+
+    def get_inputs(self):
+        return self.sessions[0].get_inputs()
+
+    def get_outputs(self):
+        return self.sessions[0].get_outputs()
+
+    def end_profiling(self):
+        paths = [session.end_profiling() for session in self.sessions]
+        return paths[0] if len(paths) == 1 else paths
+
+    def describe(self) -> Dict:
+        return {"replicas": len(self.sessions), "graph": self.source}
+
+def create_pool(name: str, model_file: str, replicas: int = ORT_REPLICAS) -> SessionPool:
+    ort = timed_import("onnxruntime")
+    graph_opt, path, source = ORT_GRAPH_OPT, model_file, "model"
+    first_options = make_session_options(name, graph_opt, replicas)
+
+    if ORT_OPTIMIZED_DIR and graph_opt != "disable":
+        cached = optimized_model_path(model_file, graph_opt)
+        if os.path.exists(cached):
+            # Already optimized: skip the optimizer on load
+            path, source, graph_opt = cached, "cached", "disable"
+            first_options = make_session_options(name, graph_opt, replicas)
+        else:
+            os.makedirs(ORT_OPTIMIZED_DIR, exist_ok=True)
+            first_options.optimized_model_filepath = cached
+            source = "optimized"
+
+    sessions = [ort.InferenceSession(path, first_options, providers=["CPUExecutionProvider"])]
+    for _ in range(replicas - 1):
+        options = make_session_options(name, graph_opt, replicas)
+        sessions.append(ort.InferenceSession(path, options, providers=["CPUExecutionProvider"]))
+    return SessionPool(name, sessions, source)
+
+def get_session(name: str, model_file: str) -> SessionPool:
+    """
+    The process-wide session pool for model_file (created on first use). name labels it
+    for metrics/profiling; a second caller with another name shares the same pool.
+    """
+    key = os.path.abspath(model_file)
+    with _lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = create_pool(name, model_file)
+            metrics.register_session(name, pool)
+        return pool
+
+def describe() -> Dict:
+    """Runtime config plus the loaded pools (e.g. for a health endpoint)."""
+    with _lock:
+        pools = {pool.name: dict(pool.describe(), model=key) for key, pool in _pools.items()}
+    return dict(runtime_config(), sessions=pools)
@@ -1,32 +1,66 @@
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from typing import List, Dict
+from typing import List, Dict, Optional, Union
+
+from utils.bm25 import reciprocal_rank_fusion
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """
+    Indices of the top_k highest scores, best first.
+    Uses argpartition so only the selected scores are sorted; ties keep the lower index first.
+    """
+    top_k = min(top_k, len(scores))
+    if top_k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if top_k < len(scores):
+        picked = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        picked = np.arange(len(scores))
+    return picked[np.lexsort((picked, -scores[picked]))]
+
+def cosine_scores(query_embedding: np.ndarray, embeddings: np.ndarray) -> np.ndarray:
+    """Cosine similarity of the query to every row of an embedding matrix."""
+    norms = np.maximum(np.linalg.norm(embeddings, axis=1), 1e-9)
+    query_norm = max(np.linalg.norm(query_embedding), 1e-9)
+    return (embeddings @ query_embedding) / (norms * query_norm)
+
+def rank_rows(sims: np.ndarray, top_k: int, lexical_scores: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Row indices of the top_k candidates, best first: by cosine similarity, or by reciprocal
+    rank fusion of the cosine and lexical (e.g. BM25) rankings when lexical_scores is given.
+    """
+    if lexical_scores is not None:
+        return top_k_indices(reciprocal_rank_fusion(sims, lexical_scores), top_k)
+    return top_k_indices(sims, top_k)
 
 def rank_sections_by_similarity(
     query_embedding: np.ndarray,
-    section_embeddings: List[np.ndarray],
+    section_embeddings: Union[np.ndarray, List[np.ndarray]],
     section_infos: List[Dict],
     top_k: int = 50
 ) -> List[Dict]:
     """
     Ranks sections purely by cosine similarity to get initial candidates for the reranker.
     """
-    # Ensure there are embeddings to process
-    if not section_embeddings or not any(e is not None for e in section_embeddings):
-        return []
-    
-    # Filter out any None embeddings before calculating similarity
-    valid_embeddings = [e for e in section_embeddings if e is not None]
-    valid_infos = [info for i, info in enumerate(section_infos) if section_embeddings[i] is not None]
+    # A batched embedding matrix has no missing rows and can be used as-is
+    if isinstance(section_embeddings, np.ndarray):
+        if section_embeddings.shape[0] == 0:
+            return []
+        valid_embeddings = section_embeddings
+        valid_infos = section_infos
+    else:
+        # Ensure there are embeddings to process
+        if not section_embeddings or not any(e is not None for e in section_embeddings):
+            return []
 
-    if not valid_embeddings:
+        # Filter out any None embeddings before calculating similarity
+        valid_embeddings = np.array([e for e in section_embeddings if e is not None])
+        valid_infos = [info for i, info in enumerate(section_infos) if section_embeddings[i] is not None]
+
+    if not len(valid_embeddings):
         return []
 
     # Compute cosine similarity
-    sims = cosine_similarity([query_embedding], valid_embeddings)[0]
-    
-    # Pair scores with their corresponding info and sort
-    ranked = sorted(zip(sims, valid_infos), key=lambda x: x[0], reverse=True)
-    
-    # Return the top_k candidates for the next stage
-    return [info for score, info in ranked[:top_k]]
\ No newline at end of file
+    sims = cosine_scores(query_embedding, valid_embeddings)
+
+    # Return the top_k candidates for the next stage, carrying their bi-encoder score
+    return [dict(valid_infos[i], similarity=float(sims[i])) for i in rank_rows(sims, top_k)]
@@ -0,0 +1,36 @@
+# utils/startup.py
+import sys
+import time
+import importlib
+from contextlib import contextmanager
+from typing import Dict
+
+# Cold-start bookkeeping: heavy imports and model loads record how long they took
+PROCESS_START = time.perf_counter()
+STARTUP_TIMINGS: Dict[str, float] = {}
+
+@contextmanager
+def timed(label: str):
+    """Records the duration of the enclosed block under label (first occurrence wins)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STARTUP_TIMINGS.setdefault(label, time.perf_counter() - start)
+
+def timed_import(module_name: str):
+    """Imports a module on first use and records the import time."""
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    with timed(f"import {module_name}"):
+        return importlib.import_module(module_name)
+
+def startup_report() -> Dict[str, float]:
+    report = {label: round(seconds, 4) for label, seconds in STARTUP_TIMINGS.items()}
+    report["since process start"] = round(time.perf_counter() - PROCESS_START, 4)
+    return report
+
+def print_startup_report():
+    print("⏱️ Startup timings:")
+    for label, seconds in startup_report().items():
+        print(f"  {label:<56} {seconds:8.3f}s")
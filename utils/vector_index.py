@@ -0,0 +1,150 @@
+# utils/vector_index.py
+import os
+import json
+import numpy as np
+from typing import List, Dict, Optional, Iterable, Tuple, Union
+
+from utils.chunk_table import ChunkTable
+from utils.quantization import EMBED_STORAGE, QuantizedMatrix, rescored_top_k, spill_to_disk
+from utils.similarity import top_k_indices
+
+INDEX_VERSION = 2  # 1: chunks.json columns; 2: columnar chunk table files
+
+class CorpusIndex:
+    """
+    A reusable retrieval index over a fixed set of chunks.
+
+    Holds a contiguous (n, dim) matrix of L2-normalized float32 embeddings plus a columnar
+    chunk table with one row per embedding. Saved as vectors.npy, the table's column files
+    (all memory-mapped on load) and meta.json, so many persona queries can be answered
+    without re-parsing or re-embedding the corpus.
+
+    With float16/int8 storage (EMBED_STORAGE) searches scan an in-memory quantized copy
+    and rescore the best candidates against the memory-mapped float32 vectors (spilled to
+    a temp file when the index is built in memory).
+    """
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        table: ChunkTable,
+        meta: Optional[Dict] = None,
+        quantized: Optional[QuantizedMatrix] = None
+    ):
+        self.vectors = vectors
+        self.table = table
+        self.meta = meta or {}
+        self.quantized = quantized
+
+    @classmethod
+    def build(
+        cls,
+        chunks: Union[ChunkTable, List[Dict]],
+        embeddings: np.ndarray,
+        meta: Optional[Dict] = None,
+        storage: str = EMBED_STORAGE
+    ) -> "CorpusIndex":
+        """Builds an index from a chunk table (or extracted chunk dicts) and its embedding matrix."""
+        vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if len(vectors):
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.maximum(norms, 1e-9)
+        table = chunks if isinstance(chunks, ChunkTable) else ChunkTable.from_dicts(chunks)
+        quantized = None
+        if storage != "float32":
+            quantized = QuantizedMatrix.quantize(vectors, storage)
+            vectors = spill_to_disk(vectors)
+        return cls(vectors, table, meta, quantized)
+
+    @property
+    def storage(self) -> str:
+        return self.quantized.mode if self.quantized is not None else "float32"
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def save(self, index_dir: str):
+        os.makedirs(index_dir, exist_ok=True)
+        np.save(os.path.join(index_dir, "vectors.npy"), self.vectors)
+        self.table.save(index_dir)
+        if self.quantized is not None:
+            self.quantized.save(index_dir)
+        meta = dict(self.meta, version=INDEX_VERSION, count=len(self), dim=int(self.vectors.shape[1]) if len(self) else 0,
+                    storage=self.storage)
+        with open(os.path.join(index_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = True, storage: Optional[str] = None) -> "CorpusIndex":
+        """Loads a saved index; storage defaults to the one it was saved with (quantizing on load if needed)."""
+        vectors = np.load(os.path.join(index_dir, "vectors.npy"), mmap_mode="r" if mmap else None)
+        with open(os.path.join(index_dir, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") == 1:
+            with open(os.path.join(index_dir, "chunks.json"), "r", encoding="utf-8") as f:
+                columns = json.load(f)
+            table = ChunkTable.from_dicts(
+                dict(zip(columns, values)) for values in zip(*columns.values())
+            )
+        elif meta.get("version") == INDEX_VERSION:
+            table = ChunkTable.load(index_dir, mmap=mmap)
+        else:
+            raise ValueError(f"Unsupported index version {meta.get('version')} in {index_dir}")
+
+        storage = storage or meta.get("storage") or EMBED_STORAGE
+        quantized = None
+        if storage != "float32":
+            quantized = QuantizedMatrix.load(index_dir, storage) or QuantizedMatrix.quantize(vectors, storage)
+        return cls(vectors, table, meta, quantized)
+
+    @staticmethod
+    def exists(index_dir: str) -> bool:
+        return os.path.exists(os.path.join(index_dir, "meta.json"))
+
+    def info(self, row: int, similarity: Optional[float] = None) -> Dict:
+        """Returns the chunk at row in the section-info shape used by the pipeline."""
+        if similarity is not None:
+            return self.table.info(row, similarity=similarity)
+        return self.table.info(row)
+
+    def document_mask(self, documents: Optional[Iterable[str]]) -> Optional[np.ndarray]:
+        return self.table.document_mask(documents)
+
+    def search(self, query_embedding: np.ndarray, top_k: int = 50, documents: Optional[Iterable[str]] = None) -> List[Dict]:
+        """Top-k chunks by cosine similarity, optionally restricted to the named documents."""
+        return self.search_batch(np.asarray(query_embedding)[None, :], top_k, documents)[0]
+
+    def search_batch(self, query_matrix: np.ndarray, top_k: int = 50, documents: Optional[Iterable[str]] = None) -> List[List[Dict]]:
+        """Answers several queries with a single matrix multiply; one result list per query row."""
+        if not len(self):
+            return [[] for _ in range(len(query_matrix))]
+        queries = np.asarray(query_matrix, dtype=np.float32)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-9)
+        mask = self.document_mask(documents)
+        rows = np.flatnonzero(mask) if mask is not None else None
+        return [
+            [self.info(int(i), float(score)) for i, score in zip(picked, picked_scores)]
+            for picked, picked_scores in self.top_rows(queries, top_k, rows)
+        ]
+
+    def top_rows(
+        self,
+        queries: np.ndarray,
+        top_k: int,
+        rows: Optional[np.ndarray] = None
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Per (normalized) query row: (row indices best first, their scores), searching all
+        rows or only the given ones. Quantized storage scans the compact copy and rescores
+        the best candidates in float32.
+        """
+        if self.quantized is not None:
+            return rescored_top_k(self.vectors, self.quantized, queries, top_k, rows)
+        results = []
+        for row_scores in queries @ self.vectors.T:
+            if rows is not None:
+                picked = rows[top_k_indices(row_scores[rows], top_k)]
+            else:
+                picked = top_k_indices(row_scores, top_k)
+            results.append((picked, row_scores[picked]))
+        return results